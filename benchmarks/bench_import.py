@@ -0,0 +1,123 @@
+"""Import time of streamlit-sync.
+
+Each measure runs in a fresh interpreter: Streamlit is imported first (an app always
+imports it) and then `streamlit_sync` is imported and timed. The benchmark also reports
+heavy modules that should only be loaded on first use of a room (Streamlit server,
+diskcache, ...).
+
+Usage (from the repository root):
+
+    python -m benchmarks.bench_import --save benchmarks/results/my_change.json
+    python -m benchmarks.bench_import --compare benchmarks/results/import_baseline.json
+
+With `--compare`, the command fails if the median import time regressed by more than
+the tolerance compared to a previous result, or if a heavy module is imported eagerly.
+"""
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import streamlit as st
+
+# Modules that must not be imported by `import streamlit_sync`
+HEAVY_MODULES = (
+    "diskcache",
+    "streamlit.server.server",
+    "streamlit_sync.backends",
+    "streamlit_sync.synced_state",
+    "http.server",
+)
+
+_MEASURE_SCRIPT = """
+import json, sys, time
+import streamlit
+start = time.perf_counter()
+import streamlit_sync
+duration = time.perf_counter() - start
+heavy_modules = [name for name in {heavy_modules!r} if name in sys.modules]
+print(json.dumps({{"import_ms": duration * 1000, "heavy_modules": heavy_modules}}))
+"""
+
+
+def measure_once() -> Dict[str, Any]:
+    """Import streamlit-sync in a new interpreter. Return duration and heavy modules."""
+    output = subprocess.run(
+        [sys.executable, "-c", _MEASURE_SCRIPT.format(heavy_modules=HEAVY_MODULES)],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def run_benchmark(repeat: int) -> Dict[str, Any]:
+    """Measure import time several times. Return the results."""
+    measures = [measure_once() for _ in range(repeat)]
+    durations = sorted(measure["import_ms"] for measure in measures)
+    return {
+        "import_ms_min": durations[0],
+        "import_ms_median": statistics.median(durations),
+        "heavy_modules": sorted(
+            {name for measure in measures for name in measure["heavy_modules"]}
+        ),
+    }
+
+
+def compare(
+    result: Dict[str, Any], baseline: Dict[str, Any], tolerance: float
+) -> List[str]:
+    """Return a description of the regressions compared to a baseline."""
+    regressions = []
+    if result["import_ms_median"] > baseline["import_ms_median"] * (1 + tolerance):
+        regressions.append(
+            f"import time {result['import_ms_median']:.1f}ms"
+            f" > {baseline['import_ms_median']:.1f}ms"
+        )
+    for name in result["heavy_modules"]:
+        regressions.append(f"{name} is imported by `import streamlit_sync`")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--save", type=Path, help="Save results to a JSON file.")
+    parser.add_argument("--compare", type=Path, help="Compare with saved results.")
+    parser.add_argument("--tolerance", type=float, default=0.5)
+    args = parser.parse_args(argv)
+
+    result = run_benchmark(args.repeat)
+    print(
+        f"import streamlit_sync: median {result['import_ms_median']:.1f}ms"
+        f" min {result['import_ms_min']:.1f}ms"
+        f" | heavy modules: {', '.join(result['heavy_modules']) or 'none'}"
+    )
+
+    if args.save is not None:
+        args.save.parent.mkdir(parents=True, exist_ok=True)
+        environment = {
+            "python": platform.python_version(),
+            "streamlit": st.__version__,
+            "platform": platform.platform(),
+        }
+        config = {"repeat": args.repeat, "tolerance": args.tolerance}
+        content = {"config": config, "environment": environment, "result": result}
+        args.save.write_text(json.dumps(content, indent=2) + "\n")
+
+    if args.compare is not None:
+        baseline = json.loads(args.compare.read_text())["result"]
+        regressions = compare(result, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
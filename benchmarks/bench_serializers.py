@@ -0,0 +1,134 @@
+"""Latency and disk usage of the serialization of persisted values.
+
+For each kind of value (NumPy array, DataFrame, large string, JSON-like document and a
+generic Python object), values are committed to a room attached to disk and read back,
+with the default pickle serialization and with serialization policies.
+
+Usage (from the repository root):
+
+    python -m benchmarks.bench_serializers
+"""
+import argparse
+import string
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from streamlit_sync.backends import LocalBackend
+from streamlit_sync.serializers import SerializationPolicy, _is_installed
+
+
+def _values(size: int) -> Dict[str, Callable[[int], Any]]:
+    """Return functions generating distinct values of each kind, of roughly `size`."""
+    rng = np.random.default_rng(0)
+    words = ["".join(rng.choice(list(string.ascii_lowercase), 8)) for _ in range(1000)]
+    nb_rows = size // 16
+
+    def array(i: int) -> Any:
+        return np.round(rng.normal(size=size // 8), 2)
+
+    def dataframe(i: int) -> Any:
+        return pd.DataFrame(
+            {
+                "value": rng.integers(0, 100, nb_rows),
+                "label": rng.choice(words[:20], nb_rows),
+            }
+        )
+
+    def text(i: int) -> Any:
+        return " ".join(rng.choice(words, size // 9))
+
+    def document(i: int) -> Any:
+        return {
+            "id": i,
+            "items": [
+                {"name": str(word), "score": float(score), "tags": ["a", "b"]}
+                for word, score in zip(
+                    rng.choice(words, size // 60), rng.random(size // 60)
+                )
+            ],
+        }
+
+    def python_object(i: int) -> Any:
+        return [(str(word), i) for word in rng.choice(words, size // 20)]
+
+    return {
+        "array": array,
+        "dataframe": dataframe,
+        "text": text,
+        "document": document,
+        "object": python_object,
+    }
+
+
+def _policies() -> Dict[str, Optional[SerializationPolicy]]:
+    policies: Dict[str, Optional[SerializationPolicy]] = {
+        "pickle": None,
+        "serializers": SerializationPolicy(),
+    }
+    for codec, module_name in (("zstd", "zstandard"), ("lz4", "lz4.frame")):
+        if _is_installed(module_name):
+            policies[f"serializers+{codec}"] = SerializationPolicy(
+                compression=codec, compress_threshold=1024
+            )
+    return policies
+
+
+def run_benchmark(
+    kind: str,
+    make_value: Callable[[int], Any],
+    policy: Optional[SerializationPolicy],
+    repeat: int,
+) -> Dict[str, Any]:
+    values = [make_value(i) for i in range(repeat)]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        room_dir = Path(tmp_dir) / "room"
+        backend = LocalBackend()
+        backend.attach_to_disk(room_dir, serialization=policy)
+
+        start = time.perf_counter()
+        for i, value in enumerate(values):
+            backend.commit(backend.version, {f"key_{i}": value})
+        write_duration = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for i in range(repeat):
+            backend.get(f"key_{i}")
+        read_duration = time.perf_counter() - start
+
+        backend.close()
+        size = sum(
+            path.stat().st_size for path in room_dir.rglob("*") if path.is_file()
+        )
+    return {
+        "kind": kind,
+        "write_ms": write_duration / repeat * 1000,
+        "read_ms": read_duration / repeat * 1000,
+        "disk_mb": size / 1e6,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=1_000_000, help="In bytes.")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    for kind, make_value in _values(args.size).items():
+        for name, policy in _policies().items():
+            result = run_benchmark(kind, make_value, policy, args.repeat)
+            print(
+                f"{kind:>10} {name:>18}: write {result['write_ms']:7.2f}ms"
+                f" | read {result['read_ms']:7.2f}ms"
+                f" | disk {result['disk_mb']:6.1f}MB"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,316 @@
+"""Load test of a room with simulated sessions.
+
+N sessions run their script in parallel threads against the same room, using the fake
+server of the test suite. Each script run syncs the room, writes a few values with a
+configurable probability and syncs again. Read-only sessions (viewers) can be added.
+The benchmark reports throughput, sync latency percentiles and lost updates (values
+written by a session that never made it to the room) for in-memory and disk rooms.
+
+Usage (from the repository root):
+
+    python -m benchmarks.bench_sync --save benchmarks/results/my_change.json
+    python -m benchmarks.bench_sync --compare benchmarks/results/baseline.json
+
+With `--compare`, the command fails if throughput, p99 latency or the ratio of lost
+updates regressed by more than the tolerance compared to a previous result. Each mode
+is run `--repeat` times and the median of each measure is kept. Results depend on the
+machine and on the workload: compare results produced on the same machine, with the
+same options.
+"""
+import argparse
+import json
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import streamlit as st
+
+from streamlit_sync import JournalPolicy, WriteBehindPolicy
+from streamlit_sync.synced_state import _SyncedState
+from streamlit_sync_tests.fake_server import RERUN, FakeServer, FakeSession
+
+MODES = ("memory", "disk", "write_behind", "journal")
+
+
+class _Writes:
+    """Keep track of written and committed values to detect lost updates."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.written: Set[Tuple[str, int]] = set()
+        self.committed: Set[Tuple[str, int]] = set()
+
+    def wrap_commit(self, room: _SyncedState) -> None:
+        backend = room._backend
+        commit = backend.commit
+
+        def tracked_commit(base_version: Any, values: Dict[str, Any]) -> Any:
+            version = commit(base_version, values)
+            if version is not None:
+                with self._lock:
+                    self.committed.update(value[0] for value in values.values())
+            return version
+
+        backend.commit = tracked_commit  # type: ignore
+
+
+def _run_session(
+    server: FakeServer,
+    session: FakeSession,
+    room: _SyncedState,
+    args: argparse.Namespace,
+    writes: _Writes,
+    deadline: float,
+    latencies: List[float],
+    counters: Dict[str, int],
+    read_only: bool = False,
+) -> None:
+    rng = random.Random(session.id)
+    payload = b"x" * args.value_size
+    seq = 0
+
+    to_write: Dict[str, Any] = {}
+
+    def timed_sync(before_script: bool = False) -> None:
+        start = time.perf_counter()
+        try:
+            room.sync(before_script=before_script, read_only=read_only)
+        finally:
+            latencies.append(time.perf_counter() - start)
+
+    def script() -> None:
+        room.register_session(read_only=read_only)
+        timed_sync(before_script=True)
+        for key, value in to_write.items():
+            st.session_state[key] = value
+        with writes._lock:
+            writes.written.update(value[0] for value in to_write.values())
+        timed_sync()
+
+    while time.monotonic() < deadline:
+        to_write.clear()
+        if not read_only and rng.random() < args.write_probability:
+            for key in rng.sample(range(args.nb_keys), args.keys_per_write):
+                seq += 1
+                to_write[f"key_{key}"] = ((session.id, seq), payload)
+
+        # Values are written once: on rerun, local values are kept in session state
+        while server.run(session, script) == RERUN:
+            counters["reruns"] += 1
+            to_write.clear()
+        counters["runs"] += 1
+
+        if args.think_time > 0:
+            time.sleep(args.think_time)
+
+
+def run_benchmark(mode: str, args: argparse.Namespace) -> Dict[str, Any]:
+    """Run the load test on a room. Return the results."""
+    with tempfile.TemporaryDirectory() as cache_dir, FakeServer().installed() as server:
+        room = _SyncedState(f"bench_{mode}")
+        if mode == "disk":
+            room.attach_to_disk(Path(cache_dir))
+        elif mode == "write_behind":
+            room.attach_to_disk(Path(cache_dir), write_behind=WriteBehindPolicy())
+        elif mode == "journal":
+            room.attach_to_disk(Path(cache_dir), journal=JournalPolicy())
+
+        writes = _Writes()
+        writes.wrap_commit(room)
+        nb_sessions = args.nb_sessions + args.nb_viewers
+        sessions = [server.new_session() for _ in range(nb_sessions)]
+        latencies: List[List[float]] = [[] for _ in sessions]
+        counters = [{"runs": 0, "reruns": 0} for _ in sessions]
+
+        start = time.monotonic()
+        threads = [
+            threading.Thread(
+                target=_run_session,
+                args=(
+                    server,
+                    session,
+                    room,
+                    args,
+                    writes,
+                    start + args.duration,
+                    latencies[i],
+                    counters[i],
+                    i >= args.nb_sessions,  # Viewers are read-only
+                ),
+            )
+            for i, session in enumerate(sessions)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        duration = time.monotonic() - start
+
+        # Settle: values still pending in sessions are committed
+        for i, session in enumerate(sessions):
+            server.run_until_done(session, _settle_script(room, i >= args.nb_sessions))
+        room.close()
+
+        all_latencies = sorted(latency for values in latencies for latency in values)
+        nb_runs = sum(counter["runs"] for counter in counters)
+        return {
+            "mode": mode,
+            "runs_per_second": nb_runs / duration,
+            "reruns": sum(counter["reruns"] for counter in counters),
+            "sync_p50_ms": _percentile(all_latencies, 0.5) * 1000,
+            "sync_p99_ms": _percentile(all_latencies, 0.99) * 1000,
+            "writes": len(writes.written),
+            "lost_updates": len(writes.written - writes.committed),
+            "lost_update_ratio": (
+                len(writes.written - writes.committed) / max(len(writes.written), 1)
+            ),
+        }
+
+
+def _median_result(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Return the median of each measure of several runs of the same mode."""
+    return {
+        key: value
+        if isinstance(value, str)
+        else statistics.median(result[key] for result in results)
+        for key, value in results[0].items()
+    }
+
+
+def _settle_script(room: _SyncedState, read_only: bool) -> Any:
+    def script() -> None:
+        room.register_session(read_only=read_only)
+        room.sync(before_script=True, read_only=read_only)
+        room.sync(read_only=read_only)
+
+    return script
+
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    if len(sorted_values) == 0:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def compare(
+    results: List[Dict[str, Any]], baseline: List[Dict[str, Any]], tolerance: float
+) -> List[str]:
+    """Return a description of the regressions compared to a baseline."""
+    regressions = []
+    baseline_by_mode = {result["mode"]: result for result in baseline}
+    for result in results:
+        reference = baseline_by_mode.get(result["mode"])
+        if reference is None:
+            continue
+        if result["runs_per_second"] < reference["runs_per_second"] * (1 - tolerance):
+            regressions.append(
+                f"{result['mode']}: throughput {result['runs_per_second']:.0f} runs/s"
+                f" < {reference['runs_per_second']:.0f} runs/s"
+            )
+        if result["sync_p99_ms"] > reference["sync_p99_ms"] * (1 + tolerance):
+            regressions.append(
+                f"{result['mode']}: p99 latency {result['sync_p99_ms']:.2f}ms"
+                f" > {reference['sync_p99_ms']:.2f}ms"
+            )
+        # Lost updates are noisy: ignore variations below 1% of the writes
+        ratio, reference_ratio = (
+            result["lost_update_ratio"],
+            reference["lost_update_ratio"],
+        )
+        if ratio > reference_ratio * (1 + tolerance) and ratio > reference_ratio + 0.01:
+            regressions.append(
+                f"{result['mode']}: {ratio:.1%} lost updates > {reference_ratio:.1%}"
+            )
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", dest="nb_sessions", type=int, default=8)
+    parser.add_argument(
+        "--viewers",
+        dest="nb_viewers",
+        type=int,
+        default=0,
+        help="Number of additional read-only sessions.",
+    )
+    parser.add_argument("--keys", dest="nb_keys", type=int, default=50)
+    parser.add_argument("--keys-per-write", type=int, default=2)
+    parser.add_argument("--value-size", type=int, default=1000, help="In bytes.")
+    parser.add_argument(
+        "--write-probability",
+        type=float,
+        default=0.5,
+        help="Probability that a script run writes values.",
+    )
+    parser.add_argument(
+        "--think-time", type=float, default=0.0, help="Pause between 2 runs (s)."
+    )
+    parser.add_argument("--duration", type=float, default=3.0, help="Per mode (s).")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="Number of runs per mode (median)."
+    )
+    parser.add_argument("--save", type=Path, help="Save results to a JSON file.")
+    parser.add_argument("--compare", type=Path, help="Compare with saved results.")
+    parser.add_argument("--tolerance", type=float, default=0.3)
+    args = parser.parse_args(argv)
+
+    results = []
+    for mode in args.modes:
+        result = _median_result([run_benchmark(mode, args) for _ in range(args.repeat)])
+        results.append(result)
+        print(
+            f"{mode:>12}: {result['runs_per_second']:8.0f} runs/s"
+            f" | sync p50 {result['sync_p50_ms']:6.3f}ms"
+            f" p99 {result['sync_p99_ms']:6.3f}ms"
+            f" | {result['reruns']} reruns"
+            f" | {result['lost_updates']}/{result['writes']} lost updates"
+        )
+
+    if args.save is not None:
+        args.save.parent.mkdir(parents=True, exist_ok=True)
+        config = {
+            key: value
+            for key, value in vars(args).items()
+            if key not in ("save", "compare", "modes")
+        }
+        environment = {
+            "python": platform.python_version(),
+            "streamlit": st.__version__,
+            "platform": platform.platform(),
+        }
+        content = {"config": config, "environment": environment, "results": results}
+        args.save.write_text(json.dumps(content, indent=2) + "\n")
+
+    if args.compare is not None:
+        saved = json.loads(args.compare.read_text())
+        workload = {
+            key: value
+            for key, value in saved["config"].items()
+            if key not in ("duration", "repeat", "tolerance")
+        }
+        mismatches = sorted(
+            key for key, value in workload.items() if getattr(args, key, None) != value
+        )
+        if mismatches:
+            print(
+                "WARNING baseline recorded with a different workload"
+                f" ({', '.join(mismatches)}): results are not comparable."
+            )
+        regressions = compare(results, saved["results"], args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,24 +1,139 @@
+import importlib
 from pathlib import Path
-from typing import Optional, Union
+from typing import TYPE_CHECKING, Any, List, Optional, Union
 
-from .rooms import delete_room, enter_room, exit_room
-from .synced_state import get_synced_state as _get_synced_state
-from .ui import select_room_widget
-from .utils import get_not_synced_key
+import streamlit as st
+
+from . import st_hack
+from .conflicts import first_writer_wins, last_writer_wins
+from .journal import JournalPolicy
+from .persistence import WriteBehindPolicy
+from .serializers import SerializationPolicy, Serializer, register_serializer
+from .utils import READ_ONLY_KEY, get_not_synced_key
+
+if TYPE_CHECKING:
+    from .rooms import (
+        configure_room,
+        delete_room,
+        enter_room,
+        exit_room,
+        export_room,
+        get_room_history,
+        import_room,
+        room_memo,
+        set_eviction_policy,
+        warm_up_rooms,
+    )
+    from .synced_state import (
+        EvictionPolicy,
+        Subscription,
+        _SyncedState,
+        set_default_backend,
+    )
+    from .ui import select_room_widget
+
+# Rooms, their backends and the UI are imported on first use (see `__getattr__`)
+_LAZY_ATTRIBUTES = {
+    "configure_room": "rooms",
+    "delete_room": "rooms",
+    "enter_room": "rooms",
+    "exit_room": "rooms",
+    "export_room": "rooms",
+    "get_room_history": "rooms",
+    "import_room": "rooms",
+    "room_memo": "rooms",
+    "set_eviction_policy": "rooms",
+    "warm_up_rooms": "rooms",
+    "EvictionPolicy": "synced_state",
+    "Subscription": "synced_state",
+    "set_default_backend": "synced_state",
+    "select_room_widget": "ui",
+}
+
+
+def __getattr__(name: str) -> Any:
+    module_name = _LAZY_ATTRIBUTES.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module_name}", __name__), name)
+    globals()[name] = value  # Next lookups do not go through `__getattr__`
+    return value
+
+
+def __dir__() -> List[str]:
+    return sorted(set(globals()) | set(_LAZY_ATTRIBUTES))
+
+
+def _get_synced_state(room_name: str) -> "_SyncedState":
+    from .synced_state import get_synced_state
+
+    return get_synced_state(room_name)
 
 
 class sync:
-    """Sync your Streamlit app with other sessions of the room !"""
+    """Sync your Streamlit app with other sessions of the room !
+
+    Args:
+        room_name: Name of the room to sync with.
+        cache_dir: If provided, room is persisted on disk in this directory.
+        write_behind: If True (or a `WriteBehindPolicy`), persisted values are kept in
+            memory and written to disk in the background. Defaults to False.
+        blob_threshold: If provided, persisted arrays and DataFrames larger than this
+            size (in bytes) are stored once as memory-mapped blobs shared by all
+            sessions. Defaults to None (all values are pickled).
+        lazy_load: If True, persisted values are read from disk only when the session
+            uses them (read by the script or by a widget). Defaults to False.
+        journal: If True (or a `JournalPolicy`), persisted values are kept in memory
+            and each update is appended to a journal, compacted in the background.
+            Cheaper than the default engine for rooms updated at a high rate. Cannot be
+            combined with `write_behind` nor `blob_threshold`. Defaults to False.
+        serialization: If True (or a `SerializationPolicy`), persisted values are
+            serialized by type (NumPy arrays, DataFrames, strings, plain containers)
+            and optionally compressed, instead of being pickled. Defaults to False.
+        subscription: If provided, the session is only rerun when one of these keys is
+            updated by another session. Defaults to None (rerun on any update).
+        read_only: If True, the session only receives values from the room (viewer):
+            its own changes are never sent to the room. Defaults to the role chosen
+            with `enter_room`, or False.
+    """
 
     def __init__(
-        self, room_name: str, cache_dir: Optional[Union[str, Path]] = None
+        self,
+        room_name: str,
+        cache_dir: Optional[Union[str, Path]] = None,
+        write_behind: Union[bool, WriteBehindPolicy] = False,
+        blob_threshold: Optional[int] = None,
+        lazy_load: bool = False,
+        journal: Union[bool, JournalPolicy] = False,
+        serialization: Union[bool, SerializationPolicy] = False,
+        subscription: Optional["Subscription"] = None,
+        read_only: Optional[bool] = None,
     ) -> None:
+        st_hack.patch_session_state()
         if cache_dir is not None:
             # Attach to disk from caching
-            _get_synced_state(room_name).attach_to_disk(Path(cache_dir))
+            if write_behind is True:
+                write_behind = WriteBehindPolicy()
+            if journal is True:
+                journal = JournalPolicy()
+            if serialization is True:
+                serialization = SerializationPolicy()
+            _get_synced_state(room_name).attach_to_disk(
+                Path(cache_dir),
+                write_behind=write_behind or None,
+                blob_threshold=blob_threshold,
+                lazy_load=lazy_load,
+                journal=journal or None,
+                serialization=serialization or None,
+            )
 
         self.room_name = room_name
-        self._inner_sync()
+        self.subscription = subscription
+        if read_only is None:
+            read_only = st.session_state.get(READ_ONLY_KEY, False)
+        self.read_only = read_only
+        # Values missed by the session are applied before the app runs
+        self._inner_sync(before_script=True)
 
     def __enter__(self) -> "sync":
         return self
@@ -26,7 +141,8 @@ class sync:
     def __exit__(self, type, value, traceback) -> None:  # type: ignore
         self._inner_sync()
 
-    def _inner_sync(self) -> None:
+    def _inner_sync(self, before_script: bool = False) -> None:
         synced_state = _get_synced_state(self.room_name)
-        synced_state.register_session()
-        synced_state.sync()
+        synced_state.register_session(read_only=self.read_only)
+        synced_state.subscribe(self.subscription)
+        synced_state.sync(before_script=before_script, read_only=self.read_only)
@@ -0,0 +1,615 @@
+"""Storage backends of the rooms.
+
+A backend stores the values of a room, maintains its version counter, provides the lock
+used to commit new values and notifies the room when values are changed by another
+process.
+
+- `LocalBackend` (default): room lives in the memory of the current process,
+  optionally persisted to disk.
+- `SQLiteBackend`: room is shared by several processes on the same host (e.g. several
+  Streamlit servers behind a load balancer) through a SQLite database in WAL mode.
+"""
+import logging
+import pickle
+import shutil
+import sqlite3
+from collections import OrderedDict
+from pathlib import Path
+from threading import Event, RLock, Thread
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    ContextManager,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
+
+from .blobs import BLOBS_DIRNAME, _BlobIndex, _BlobStore, _estimate_size
+from .exceptions import StreamlitSyncException
+from .journal import JournalPolicy, _Journal
+from .metrics import RoomMetrics, _InstrumentedLock
+from .persistence import WriteBehindPolicy, _WriteBehindFlusher
+from .serializers import SerializationPolicy, _SerializedIndex, check_policy
+
+if TYPE_CHECKING:
+    # Imported on first use: not needed by in-memory rooms
+    from diskcache import Cache
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class RoomBackend:
+    """Interface of a room backend.
+
+    Version starts at 0 and is incremented on each commit. Each key keeps the version
+    in which it was last updated.
+    """
+
+    version: int
+
+    @property
+    def is_in_memory(self) -> bool:
+        """Return True if values are Python objects kept in memory.
+
+        If False, values are read from disk (or a database) each time they are needed.
+        """
+        return False
+
+    def lock(self) -> ContextManager[Any]:
+        """Return the lock protecting the room values."""
+        raise NotImplementedError()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Return the value of a key."""
+        raise NotImplementedError()
+
+    def keys(self) -> Iterable[str]:
+        """Return all keys of the room."""
+        raise NotImplementedError()
+
+    def key_version(self, key: str) -> Optional[int]:
+        """Return the version in which key was last updated, None if key is unknown.
+
+        Called without holding the lock: must be cheap and thread-safe.
+        """
+        raise NotImplementedError()
+
+    def read_since(self, version: Optional[int]) -> Tuple[Dict[str, Any], int]:
+        """Return values updated after `version` and the current room version.
+
+        If version is unknown (new session or room has been reset), all values are
+        returned.
+        """
+        raise NotImplementedError()
+
+    def keys_since(self, version: Optional[int]) -> Tuple[List[str], int]:
+        """Return keys updated after `version` and the current room version.
+
+        Same as `read_since` without reading the values. Used to load values lazily.
+        """
+        values, version = self.read_since(version)
+        return list(values), version
+
+    def commit(
+        self, base_version: Optional[int], values: Dict[str, Any]
+    ) -> Optional[int]:
+        """Commit new values if room is still at `base_version`.
+
+        Return the new room version, or None if values have been committed by someone
+        else since `base_version`.
+        """
+        raise NotImplementedError()
+
+    def set_change_callback(self, callback: Callable[[], None]) -> None:
+        """Register a callback to call when the room is updated by another process."""
+
+    def set_metrics(self, metrics: RoomMetrics) -> None:
+        """Record metrics of the backend (e.g. lock contention) in the room metrics."""
+
+    def preload(self) -> Dict[str, Tuple[int, Any]]:
+        """Read values persisted on disk ahead of the first session reading them.
+
+        Return the values read and their versions.
+        """
+        return {}
+
+    def resume_from(self, version: int) -> None:
+        """Continue versioning from a previous instance of the room.
+
+        Called when a room is reloaded after having been evicted or deleted so that
+        versions seen by sessions are never reused.
+        """
+
+    def estimated_size(self) -> int:
+        """Return estimated memory used by the room values, in bytes."""
+        return 0
+
+    def close(self) -> None:
+        """Release resources (threads, files,...) held by the backend.
+
+        Persisted values must be kept.
+        """
+
+    def delete(self) -> None:
+        """Release resources and delete all values, including persisted ones."""
+        self.close()
+
+
+class LocalBackend(RoomBackend):
+    """Room stored in the memory of the current process.
+
+    Room can be attached to disk to be persisted. In that case, values are stored in a
+    diskcache `Index`, or kept in memory and appended to a journal (see `journal.py`).
+    """
+
+    def __init__(self) -> None:
+        self._lock: Union[RLock, _InstrumentedLock] = RLock()
+        self.version = 0
+        self.state: Any = {}
+        # Keys ordered from the oldest to the most recently updated
+        self._key_versions: "OrderedDict[str, int]" = OrderedDict()
+
+        self.use_cache = False
+        self.room_cache_dir: Optional[Path] = None
+        self._cache: Optional["Cache"] = None
+        self._flusher: Optional[_WriteBehindFlusher] = None
+        self._journal: Optional[_Journal] = None
+        # Values read ahead from disk, until a session reads them (see `preload`)
+        self._preloaded: Dict[str, Any] = {}
+
+    @property
+    def is_in_memory(self) -> bool:
+        """Return True if values are Python objects kept in memory."""
+        return isinstance(self.state, dict)
+
+    def lock(self) -> ContextManager[Any]:
+        return self._lock
+
+    def set_metrics(self, metrics: RoomMetrics) -> None:
+        # Same underlying lock: safe even if held by a background thread
+        self._lock = _InstrumentedLock(metrics, self._lock, prefix="backend_lock")
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if self._preloaded:
+            value = self._preloaded.pop(key, _MISSING)
+            if value is not _MISSING:
+                return value
+        return self.state.get(key, default)
+
+    def keys(self) -> Iterable[str]:
+        return self.state.keys()
+
+    def key_version(self, key: str) -> Optional[int]:
+        return self._key_versions.get(key)
+
+    def read_since(self, version: Optional[int]) -> Tuple[Dict[str, Any], int]:
+        with self._lock:
+            values = {
+                key: self._preloaded.pop(key)
+                if key in self._preloaded
+                else self.state[key]
+                for key in self._changed_keys_since(version)
+            }
+            return values, self.version
+
+    def keys_since(self, version: Optional[int]) -> Tuple[List[str], int]:
+        with self._lock:
+            return self._changed_keys_since(version), self.version
+
+    def commit(
+        self, base_version: Optional[int], values: Dict[str, Any]
+    ) -> Optional[int]:
+        journal = self._journal
+        if journal is not None:
+            # Serialize values before locking
+            data = journal.encode(values)
+        with self._lock:
+            if self.version != base_version:
+                return None
+            if journal is not None:
+                journal.append(self.version + 1, data)
+            self.state.update(values)
+            for key in values:
+                self._preloaded.pop(key, None)
+            if self._flusher is not None:
+                self._flusher.mark_dirty(values)
+            self._set_versions(values.keys(), self.version + 1)
+            return self.version
+
+    def attach_to_disk(
+        self,
+        room_cache_dir: Path,
+        write_behind: Optional[WriteBehindPolicy] = None,
+        blob_threshold: Optional[int] = None,
+        journal: Optional[JournalPolicy] = None,
+        serialization: Optional[SerializationPolicy] = None,
+    ) -> None:
+        """Attach the room to disk. See `_SyncedState.attach_to_disk`."""
+        if self.use_cache:
+            return
+        if serialization is not None:
+            check_policy(serialization)
+        if journal is not None and (
+            write_behind is not None or blob_threshold is not None
+        ):
+            raise StreamlitSyncException(
+                "The journal storage engine cannot be used with write-behind nor"
+                " with blobs."
+            )
+
+        with self._lock:
+            # Room can be attached concurrently by a session and by the warm-up
+            if self.use_cache:
+                return
+            if journal is not None:
+                self._attach_to_journal(room_cache_dir, journal, serialization)
+                return
+
+            from diskcache import Cache, Index
+
+            self.use_cache = True
+            self.room_cache_dir = room_cache_dir
+            self._cache = Cache(room_cache_dir)
+            serialized_index = _SerializedIndex(
+                Index.fromcache(self._cache), serialization
+            )
+            index: Union[_SerializedIndex, _BlobIndex] = serialized_index
+            if blob_threshold is not None:
+                blob_store = _BlobStore(
+                    room_cache_dir / BLOBS_DIRNAME, threshold=blob_threshold
+                )
+                # Reclaim blobs orphaned by a process that crashed while saving
+                blob_store.collect_garbage()
+                index = _BlobIndex(serialized_index, blob_store)
+
+            if write_behind is None:
+                self.state = index
+            else:
+                self.state = dict(index)
+                self._flusher = _WriteBehindFlusher(index, write_behind)
+
+            # Values loaded from disk are new to every session
+            self._key_versions = OrderedDict()
+            self._set_versions(list(self.state.keys()), self.version + 1)
+
+    def _attach_to_journal(
+        self,
+        room_cache_dir: Path,
+        policy: JournalPolicy,
+        serialization: Optional[SerializationPolicy],
+    ) -> None:
+        with self._lock:
+            self._journal = _Journal(
+                room_cache_dir,
+                policy,
+                capture=self._capture_for_compaction,
+                serialization=serialization,
+            )
+            values, version = self._journal.load()
+            migrated = version is None and (room_cache_dir / "cache.db").exists()
+            if migrated:
+                # Room persisted with the diskcache engine: import its values once
+                values = _read_diskcache(room_cache_dir)
+
+            self.use_cache = True
+            self.room_cache_dir = room_cache_dir
+            self.state = values
+
+            # Values loaded from disk are new to every session
+            self._key_versions = OrderedDict()
+            self._set_versions(list(values), max(self.version, version or 0) + 1)
+            if migrated:
+                self._journal.append(self.version, self._journal.encode(values))
+
+    def _capture_for_compaction(self) -> Tuple[Dict[str, Any], int]:
+        """Start a new journal segment and return a copy of the state."""
+        assert self._journal is not None
+        with self._lock:
+            self._journal.rotate()
+            return dict(self.state), self.version
+
+    def history(
+        self, since_version: Optional[int] = None
+    ) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """Replay the updates kept in the journal. See `_Journal.history`."""
+        if self._journal is None:
+            raise StreamlitSyncException(
+                "History is only kept with the journal storage engine."
+            )
+        return self._journal.history(since_version)
+
+    def preload(self) -> Dict[str, Tuple[int, Any]]:
+        """Read values from disk and keep them until a session reads them.
+
+        Values are handed over to the first session reading them, and then dropped:
+        memory used by the room is the same as if it had not been preloaded. No-op if
+        values are already kept in memory.
+        """
+        if self.is_in_memory:
+            return {}
+        with self._lock:
+            key_versions = dict(self._key_versions)
+        # Read without holding the lock: sessions can commit meanwhile
+        values = {}
+        for key in key_versions:
+            try:
+                values[key] = self.state[key]
+            except KeyError:
+                pass
+        preloaded = {}
+        with self._lock:
+            for key, value in values.items():
+                # Values updated while reading are outdated
+                if self._key_versions.get(key) == key_versions[key]:
+                    self._preloaded[key] = value
+                    preloaded[key] = (key_versions[key], value)
+        return preloaded
+
+    def resume_from(self, version: int) -> None:
+        with self._lock:
+            self.version = max(self.version, version)
+
+    def estimated_size(self) -> int:
+        if not self.is_in_memory:
+            # Values are read from disk when needed, except preloaded ones
+            values = list(self._preloaded.values())
+        else:
+            values = list(self.state.values())
+        return sum(_estimate_size(value) for value in values)
+
+    def close(self) -> None:
+        if self._flusher is not None:
+            # Room can be reloaded from disk (e.g. after eviction): always flushed.
+            # `flush_on_shutdown` only applies when the server stops.
+            self._flusher.stop()
+            self._flusher = None
+        if self._journal is not None:
+            self._journal.close()
+        if self._cache is not None:
+            self._cache.close()
+        self._preloaded = {}
+
+    def delete(self) -> None:
+        if self._journal is not None:
+            # Compaction thread takes the lock: stop it first
+            self._journal.close()
+        with self._lock:
+            if self._flusher is not None:
+                self._flusher.stop(flush=False)
+                self._flusher = None
+            self.state = {}
+            self._key_versions = OrderedDict()
+            self._journal = None
+            if self._cache is not None:
+                self._cache.close()
+            if self.use_cache:
+                assert self.room_cache_dir is not None
+                shutil.rmtree(self.room_cache_dir, ignore_errors=True)
+                self.use_cache = False
+
+    def _set_versions(self, keys: Iterable[str], version: int) -> None:
+        """Bump room version and set version of updated keys.
+
+        Must be called while holding the lock.
+        """
+        for key in keys:
+            self._key_versions[key] = version
+            self._key_versions.move_to_end(key)
+        self.version = version
+
+    def _changed_keys_since(self, version: Optional[int]) -> List[str]:
+        """Return keys updated after `version`.
+
+        Keys are ordered by version so we only iterate over the changed ones.
+
+        Must be called while holding the lock.
+        """
+        if not isinstance(version, int) or version > self.version:
+            return list(self._key_versions)
+
+        changed_keys = []
+        for key in reversed(self._key_versions):
+            if self._key_versions[key] <= version:
+                break
+            changed_keys.append(key)
+        return changed_keys
+
+
+class SQLiteBackend(LocalBackend):
+    """Room shared between processes through a SQLite database.
+
+    Each process keeps a mirror of the room in memory, so that reads are as cheap as
+    with a `LocalBackend`. Commits are done in an exclusive SQLite transaction, which
+    acts as a lock across processes. The database is in WAL mode so readers are not
+    blocked by writers.
+
+    Changes made by other processes are detected by polling `PRAGMA data_version`,
+    which only reads the shared-memory file of the WAL and does not query the tables.
+
+    Values must be pickle-able.
+    """
+
+    def __init__(self, path: Union[str, Path], poll_interval: float = 0.1) -> None:
+        super().__init__()
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.poll_interval = poll_interval
+        self._on_change: Optional[Callable[[], None]] = None
+
+        # Autocommit mode: transactions are handled explicitly
+        self._conn = sqlite3.connect(
+            str(self.path), timeout=30, isolation_level=None, check_same_thread=False
+        )
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS state"
+                " (key TEXT PRIMARY KEY, value BLOB NOT NULL, version INTEGER NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS meta"
+                " (id INTEGER PRIMARY KEY CHECK (id = 0), version INTEGER NOT NULL)"
+            )
+            self._conn.execute("INSERT OR IGNORE INTO meta VALUES (0, 0)")
+            self._data_version = self._get_data_version()
+            self._refresh()
+
+        self._stopped = Event()
+        self._watcher = Thread(
+            target=self._watch, name="streamlit_sync_sqlite_watcher", daemon=True
+        )
+        self._watcher.start()
+
+    @classmethod
+    def in_directory(
+        cls, directory: Union[str, Path], poll_interval: float = 0.1
+    ) -> Callable[[str], "SQLiteBackend"]:
+        """Return a backend factory storing each room in `directory/<room>.sqlite3`.
+
+        Example:
+            streamlit_sync.set_default_backend(SQLiteBackend.in_directory("./rooms"))
+        """
+        return lambda room_name: cls(
+            Path(directory) / f"{room_name}.sqlite3", poll_interval=poll_interval
+        )
+
+    def commit(
+        self, base_version: Optional[int], values: Dict[str, Any]
+    ) -> Optional[int]:
+        # Serialize values before locking
+        rows = [(key, pickle.dumps(value)) for key, value in values.items()]
+        with self._lock:
+            # Lock the database for writing, across processes
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                db_version = self._get_db_version()
+                if db_version == base_version:
+                    version = db_version + 1
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO state VALUES (?, ?, ?)",
+                        [(key, value, version) for key, value in rows],
+                    )
+                    self._conn.execute(
+                        "UPDATE meta SET version = ? WHERE id = 0", (version,)
+                    )
+                    self._conn.execute("COMMIT")
+                else:
+                    self._conn.execute("ROLLBACK")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+            if db_version == base_version:
+                self.state.update(values)
+                self._set_versions(values.keys(), version)
+                return version
+
+            # Commit refused: load the values committed by other processes. The
+            # watcher will not see them as new, so other sessions are notified here.
+            has_changed = self._refresh()
+
+        if has_changed and self._on_change is not None:
+            self._on_change()
+        return None
+
+    def attach_to_disk(self, *args: Any, **kwargs: Any) -> None:
+        raise StreamlitSyncException(
+            "Rooms with a SQLite backend are already persisted: cannot attach to disk."
+        )
+
+    def set_change_callback(self, callback: Callable[[], None]) -> None:
+        self._on_change = callback
+
+    def resume_from(self, version: int) -> None:
+        # Versions are persisted in the database
+        pass
+
+    def close(self) -> None:
+        self._stopped.set()
+        self._watcher.join()
+        with self._lock:
+            self._conn.close()
+
+    def delete(self) -> None:
+        self.close()
+        with self._lock:
+            self.state = {}
+            self._key_versions = OrderedDict()
+            for suffix in ("", "-wal", "-shm"):
+                path = self.path.with_name(self.path.name + suffix)
+                if path.exists():
+                    path.unlink()
+
+    def _watch(self) -> None:
+        while not self._stopped.wait(self.poll_interval):
+            try:
+                with self._lock:
+                    data_version = self._get_data_version()
+                    if data_version == self._data_version:
+                        continue
+                    self._data_version = data_version
+                    has_changed = self._refresh()
+            except sqlite3.Error:
+                logger.exception("Failed to refresh room from %s.", self.path)
+                continue
+
+            if has_changed and self._on_change is not None:
+                self._on_change()
+
+    def _refresh(self) -> bool:
+        """Load values committed by other processes. Return True if any.
+
+        Must be called while holding the lock.
+        """
+        rows = self._conn.execute(
+            "SELECT key, value, version FROM state WHERE version > ? ORDER BY version",
+            (self.version,),
+        ).fetchall()
+        db_version = self._get_db_version()
+        if db_version < self.version:
+            # Database has been reset: reload everything
+            rows = self._conn.execute(
+                "SELECT key, value, version FROM state ORDER BY version"
+            ).fetchall()
+            self.state = {}
+            self._key_versions = OrderedDict()
+
+        for key, value, version in rows:
+            self.state[key] = pickle.loads(value)
+            self._key_versions[key] = version
+            self._key_versions.move_to_end(key)
+
+        has_changed = db_version != self.version
+        self.version = db_version
+        return has_changed
+
+    def _get_db_version(self) -> int:
+        return self._conn.execute("SELECT version FROM meta WHERE id = 0").fetchone()[0]
+
+    def _get_data_version(self) -> int:
+        return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+
+def _read_diskcache(room_cache_dir: Path) -> Dict[str, Any]:
+    """Read all values of a room persisted with the diskcache engine."""
+    from diskcache import Cache, Index
+
+    with Cache(room_cache_dir) as cache:
+        serialized_index = _SerializedIndex(Index.fromcache(cache), None)
+        index: Union[_SerializedIndex, _BlobIndex] = serialized_index
+        if (room_cache_dir / BLOBS_DIRNAME).exists():
+            # Threshold is only used to save values
+            index = _BlobIndex(
+                serialized_index,
+                _BlobStore(room_cache_dir / BLOBS_DIRNAME, threshold=0),
+            )
+        return {key: index[key] for key in index}
@@ -0,0 +1,274 @@
+"""Content-addressed storage of large values for rooms attached to disk.
+
+Large NumPy arrays and DataFrames are not pickled in the room cache. Instead, they are
+saved once in a `blobs/` subfolder of the room cache dir, in a format that can be
+memory-mapped (`.npy` for arrays, Arrow IPC for DataFrames). The room cache only stores
+a reference to the blob. When read, values are returned as read-only memory-mapped
+views shared by all sessions instead of private copies.
+
+Blobs are named after the fingerprint of their content so identical values are only
+stored once. The blob referenced by each key is tracked in a small index so that blobs
+that are not referenced anymore can be deleted without reading the room values.
+"""
+import os
+import sys
+import tempfile
+import weakref
+from collections import Counter
+from pathlib import Path
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    NamedTuple,
+    Optional,
+)
+
+from .fingerprints import fingerprint
+
+if TYPE_CHECKING:
+    from .serializers import _SerializedIndex
+
+BLOBS_DIRNAME = "blobs"
+_DATA_DIRNAME = "data"
+_REFS_DIRNAME = "refs"
+
+
+class _BlobRef(NamedTuple):
+    """Reference to a blob, stored in the room cache instead of the value."""
+
+    digest: str
+    fmt: str
+
+
+class _BlobStore:
+    def __init__(self, directory: Path, threshold: int) -> None:
+        self.threshold = threshold
+        self.data_dir = directory / _DATA_DIRNAME
+        self.data_dir.mkdir(parents=True, exist_ok=True)
+
+        from diskcache import Index
+
+        # Name of the blob referenced by each key, and number of keys per blob
+        self.refs = Index(str(directory / _REFS_DIRNAME))
+        self._ref_counts: "Counter[str]" = Counter(self.refs.values())
+
+        # Loaded values are shared between sessions as long as they are used
+        self._loaded: "weakref.WeakValueDictionary[str, Any]" = (
+            weakref.WeakValueDictionary()
+        )
+
+    def path(self, ref: _BlobRef) -> Path:
+        return self.data_dir / f"{ref.digest}.{ref.fmt}"
+
+    def save(self, key: str, value: Any) -> Optional[_BlobRef]:
+        """Save value as a blob if it is large enough. Return reference if saved.
+
+        Blob previously referenced by the key is deleted if not used anymore.
+        """
+        ref = self._maybe_write(value)
+        previous_name = self.refs.get(key)
+        if ref is None:
+            self.refs.pop(key, None)
+        else:
+            name = self.path(ref).name
+            self.refs[key] = name
+            self._ref_counts[name] += 1
+
+        if previous_name is not None:
+            self._maybe_delete(previous_name)
+        return ref
+
+    def discard(self, key: str) -> None:
+        """Forget key, deleting its blob if not used anymore."""
+        previous_name = self.refs.pop(key, None)
+        if previous_name is not None:
+            self._maybe_delete(previous_name)
+
+    def load(self, ref: _BlobRef) -> Any:
+        """Load value from a blob, as a read-only memory-mapped view."""
+        value = self._loaded.get(ref.digest)
+        if value is None:
+            value = _READERS[ref.fmt](self.path(ref))
+            try:
+                self._loaded[ref.digest] = value
+            except TypeError:
+                pass  # Not weak-referenceable
+        return value
+
+    def collect_garbage(self) -> None:
+        """Delete all blobs that are not referenced anymore.
+
+        Including blobs and temporary files left behind by a process that crashed
+        while saving. Must not be called while values are being saved.
+        """
+        for path in self.data_dir.iterdir():
+            if self._ref_counts[path.name] <= 0:
+                _unlink(path)
+
+    def _maybe_write(self, value: Any) -> Optional[_BlobRef]:
+        fmt = _get_blob_format(value)
+        if fmt is None or _estimate_size(value) < self.threshold:
+            return None
+
+        digest = fingerprint(value)
+        if digest is None:
+            return None
+
+        ref = _BlobRef(digest=digest.hex(), fmt=fmt)
+        path = self.path(ref)
+        if not path.exists():
+            # Write to a temporary file first so that a blob is never half-written
+            fd, tmp_path = tempfile.mkstemp(dir=self.data_dir, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    _WRITERS[fmt](value, f)
+                os.replace(tmp_path, path)
+            except Exception:
+                # Value not supported by the format (e.g. column with mixed types)
+                # -> pickled in the room cache instead
+                os.unlink(tmp_path)
+                return None
+        return ref
+
+    def _maybe_delete(self, name: str) -> None:
+        self._ref_counts[name] -= 1
+        if self._ref_counts[name] <= 0:
+            del self._ref_counts[name]
+            _unlink(self.data_dir / name)
+
+
+class _BlobIndex:
+    """Room state stored in a diskcache Index, with large values stored as blobs.
+
+    Implements the subset of the Index API used by streamlit-sync.
+    """
+
+    def __init__(self, index: "_SerializedIndex", blob_store: _BlobStore) -> None:
+        self.index = index
+        self.blob_store = blob_store
+        self.directory = index.directory
+        self.transact = index.transact
+
+    def __getitem__(self, key: str) -> Any:
+        value = self.index[key]
+        if isinstance(value, _BlobRef):
+            return self.blob_store.load(value)
+        return value
+
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        ref = self.blob_store.save(key, value)
+        self.index[key] = value if ref is None else ref
+
+    def __delitem__(self, key: str) -> None:
+        del self.index[key]
+        self.blob_store.discard(key)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self.index
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.index)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def keys(self) -> Iterable[str]:
+        return self.index.keys()
+
+    def items(self) -> Iterator[Any]:
+        for key in self.index:
+            yield key, self[key]
+
+    def update(self, values: Dict[str, Any]) -> None:
+        with self.index.transact():
+            for key, value in values.items():
+                self[key] = value
+
+
+def _unlink(path: Path) -> None:
+    try:
+        path.unlink()
+    except OSError:
+        # Most likely still memory-mapped on Windows: will be deleted later
+        pass
+
+
+def _get_blob_format(value: Any) -> Optional[str]:
+    np = sys.modules.get("numpy")
+    if np is not None and isinstance(value, np.ndarray) and not value.dtype.hasobject:
+        return "npy"
+
+    pd = sys.modules.get("pandas")
+    if pd is not None and isinstance(value, pd.DataFrame):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            return None
+        return "arrow"
+
+    return None
+
+
+def _estimate_size(value: Any) -> int:
+    """Return a rough estimate of the memory used by a value."""
+    if hasattr(value, "nbytes"):
+        return int(value.nbytes)  # NumPy arrays
+
+    pd = sys.modules.get("pandas")
+    if pd is not None and isinstance(value, (pd.DataFrame, pd.Series)):
+        return int(pd.Series(value.memory_usage(index=True, deep=True)).sum())
+
+    size = sys.getsizeof(value)
+    if isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(_estimate_size(item) for item in value)
+    elif isinstance(value, dict):
+        size += sum(_estimate_size(k) + _estimate_size(v) for k, v in value.items())
+    return size
+
+
+def _write_npy(value: Any, f: Any) -> None:
+    import numpy as np
+
+    np.save(f, value, allow_pickle=False)
+
+
+def _read_npy(path: Path) -> Any:
+    import numpy as np
+
+    return np.load(path, mmap_mode="r", allow_pickle=False)
+
+
+def _write_arrow(value: Any, f: Any) -> None:
+    import pyarrow as pa
+
+    table = pa.Table.from_pandas(value)
+    with pa.ipc.new_file(f, table.schema) as writer:
+        writer.write_table(table)
+
+
+def _read_arrow(path: Path) -> Any:
+    import pyarrow as pa
+
+    table = pa.ipc.open_file(pa.memory_map(str(path))).read_all()
+    # Zero-copy when possible (numerical columns without nulls)
+    return table.to_pandas(split_blocks=True)
+
+
+_WRITERS: Dict[str, Callable[[Any, Any], None]] = {
+    "npy": _write_npy,
+    "arrow": _write_arrow,
+}
+_READERS: Dict[str, Callable[[Path], Any]] = {
+    "npy": _read_npy,
+    "arrow": _read_arrow,
+}
@@ -0,0 +1,154 @@
+"""Coalesce room updates into waves of reruns.
+
+Without scheduling, each committed change triggers a rerun of every other session of
+the room. When a user drags a slider, this can lead to a storm of reruns. The
+broadcast scheduler batches changes committed within a time window (or exceeding a
+max rate) into a single rerun wave. The last wave is always sent after the last
+change so that all sessions end up with the final state.
+
+Rerun requests of a wave are sent outside of the room lock by a bounded pool of
+workers shared by all rooms.
+"""
+import logging
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Lock, Timer
+from typing import Any, Callable, Optional, Sequence
+
+from .exceptions import StreamlitSyncException
+
+logger = logging.getLogger(__name__)
+
+# Rerun requests are sent by a pool of workers shared by all rooms
+FAN_OUT_MAX_WORKERS = 4
+FAN_OUT_CHUNK_SIZE = 16
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = Lock()
+
+
+def fan_out(
+    sessions: Sequence[Any], on_sent: Optional[Callable[[float], None]] = None
+) -> None:
+    """Request a rerun of the sessions, without waiting for requests to be sent.
+
+    Sessions are split in chunks handled by a bounded pool of workers. If provided,
+    `on_sent` is called with the latency (in seconds) of each chunk.
+    """
+    global _executor
+    if len(sessions) == 0:
+        return
+
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=FAN_OUT_MAX_WORKERS,
+                thread_name_prefix="streamlit_sync_fan_out",
+            )
+
+    submitted_at = time.perf_counter()
+    for start in range(0, len(sessions), FAN_OUT_CHUNK_SIZE):
+        future = _executor.submit(
+            _request_reruns,
+            sessions[start : start + FAN_OUT_CHUNK_SIZE],
+            submitted_at,
+            on_sent,
+        )
+        future.add_done_callback(_log_error)
+
+
+def _request_reruns(
+    sessions: Sequence[Any],
+    submitted_at: float,
+    on_sent: Optional[Callable[[float], None]],
+) -> None:
+    for session in sessions:
+        # Errors are not raised in the caller: one session (e.g. disconnected in the
+        # meantime) must not prevent the others from being rerun.
+        try:
+            session.request_rerun(None)
+        except Exception:
+            logger.exception("Failed to request a rerun of session %s.", session)
+    if on_sent is not None:
+        on_sent(time.perf_counter() - submitted_at)
+
+
+def _log_error(future: "Future[None]") -> None:
+    error = future.exception()
+    if error is not None:
+        logger.error("Failed to fan out rerun requests.", exc_info=error)
+
+
+class _BroadcastScheduler:
+    def __init__(self, broadcast: Callable[[], None]) -> None:
+        self._broadcast = broadcast
+        self._lock = Lock()
+        self._timer: Optional[Timer] = None
+        self._last_broadcast: float = 0.0
+
+        self.window: float = 0.0
+        self.max_rate: Optional[float] = None
+
+    def configure(self, window: float = 0.0, max_rate: Optional[float] = None) -> None:
+        """Configure how updates are coalesced.
+
+        Args:
+            window: Time to wait (in seconds) after a first change before triggering
+                the sessions. Changes committed in the meantime are sent in the same
+                wave. Defaults to 0 (no wait).
+            max_rate: Maximum number of waves per second. Defaults to None (no limit).
+        """
+        if window < 0:
+            raise StreamlitSyncException(f"Broadcast window must be >= 0: {window}.")
+        if max_rate is not None and max_rate <= 0:
+            raise StreamlitSyncException(f"Broadcast max rate must be > 0: {max_rate}.")
+        self.window = window
+        self.max_rate = max_rate
+
+    @property
+    def is_immediate(self) -> bool:
+        """Return True if waves are sent as soon as they are scheduled."""
+        return self.window == 0 and self.max_rate is None
+
+    @property
+    def is_pending(self) -> bool:
+        """Return True if a wave is scheduled but not yet sent."""
+        return self._timer is not None
+
+    def schedule(self) -> None:
+        """Schedule a wave of reruns.
+
+        If a wave is already pending, the change will be part of it.
+        """
+        if self.is_immediate:
+            self._broadcast()
+            return
+
+        with self._lock:
+            if self._timer is not None:
+                # Coalesced with pending wave
+                return
+
+            delay = self.window
+            if self.max_rate is not None:
+                next_allowed = self._last_broadcast + 1 / self.max_rate
+                delay = max(delay, next_allowed - time.monotonic())
+
+            self._timer = Timer(delay, self._send_wave)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def cancel(self) -> None:
+        """Cancel pending wave, if any."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+    def _send_wave(self) -> None:
+        with self._lock:
+            # Reset before broadcasting: any change committed from now on is not
+            # guaranteed to be part of this wave and must schedule a new one.
+            self._timer = None
+            self._last_broadcast = time.monotonic()
+        self._broadcast()
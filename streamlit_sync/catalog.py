@@ -0,0 +1,190 @@
+"""Catalog of the rooms persisted in a cache directory.
+
+Listing rooms from the cache directory requires to scan it, which is slow when it
+contains thousands of rooms. Instead, rooms are listed in a catalog maintained in memory
+when rooms are attached, updated or deleted. The catalog is saved in the cache
+directory in the background so that it survives restarts. The directory is only
+scanned once, if no catalog has been saved yet.
+"""
+import atexit
+import json
+import logging
+import os
+import tempfile
+from pathlib import Path
+from threading import Lock
+from typing import Any, Dict, List, NamedTuple, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+CATALOG_FILENAME = ".rooms_catalog.json"
+
+# Catalogs already loaded, by cache dir
+_catalogs: Dict[Path, "_RoomCatalog"] = {}
+_catalogs_lock = Lock()
+
+
+class RoomInfo(NamedTuple):
+    """Information about a room persisted in a cache directory.
+
+    Args:
+        name: Name of the room.
+        last_updated: Timestamp of the last update. None if unknown.
+        size_on_disk: Size of the room cache directory (in bytes), as of when the room
+            was last loaded or unloaded.
+        attach_options: Options the room was last attached to disk with (storage
+            engine, serialization,...), as JSON. None if unknown.
+    """
+
+    name: str
+    last_updated: Optional[float] = None
+    size_on_disk: int = 0
+    attach_options: Optional[Dict[str, Any]] = None
+
+
+class _RoomCatalog:
+    def __init__(self, cache_dir: Path) -> None:
+        self.cache_dir = cache_dir
+        self.path = cache_dir / CATALOG_FILENAME
+
+        self._lock = Lock()
+        self._rooms: Dict[str, RoomInfo] = {}
+        self._dirty = False
+        self._load()
+
+    def __contains__(self, room_name: str) -> bool:
+        return room_name in self._rooms
+
+    def __len__(self) -> int:
+        return len(self._rooms)
+
+    def get(self, room_name: str) -> Optional[RoomInfo]:
+        return self._rooms.get(room_name)
+
+    def list_rooms(
+        self, search: Optional[str] = None, limit: Optional[int] = None
+    ) -> List[RoomInfo]:
+        """List rooms sorted by name, optionally filtered by a search string."""
+        with self._lock:
+            rooms = list(self._rooms.values())
+        if search:
+            search = search.lower()
+            rooms = [room for room in rooms if search in room.name.lower()]
+        rooms.sort(key=lambda room: room.name)
+        return rooms if limit is None else rooms[:limit]
+
+    def update(
+        self,
+        room_name: str,
+        last_updated: Optional[float] = None,
+        size_on_disk: Optional[int] = None,
+        attach_options: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        """Add room to the catalog or update its information."""
+        with self._lock:
+            room = self._rooms.get(room_name, RoomInfo(name=room_name))
+            if last_updated is not None:
+                room = room._replace(last_updated=last_updated)
+            if size_on_disk is not None:
+                room = room._replace(size_on_disk=size_on_disk)
+            if attach_options is not None:
+                room = room._replace(attach_options=attach_options)
+            self._rooms[room_name] = room
+            self._dirty = True
+
+    def remove(self, room_name: str) -> None:
+        """Remove room from the catalog."""
+        with self._lock:
+            if self._rooms.pop(room_name, None) is not None:
+                self._dirty = True
+
+    def save(self) -> None:
+        """Save catalog in the cache directory, if it has changed."""
+        with self._lock:
+            if not self._dirty:
+                return
+            content = {
+                "rooms": [
+                    {
+                        "name": room.name,
+                        "last_updated": room.last_updated,
+                        "size_on_disk": room.size_on_disk,
+                        "attach_options": room.attach_options,
+                    }
+                    for room in self._rooms.values()
+                ]
+            }
+            self._dirty = False
+
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(content, f)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            logger.exception("Failed to save rooms catalog to %s.", self.path)
+            self._dirty = True
+
+    def _load(self) -> None:
+        try:
+            content = json.loads(self.path.read_text())
+            self._rooms = {
+                room["name"]: RoomInfo(
+                    name=room["name"],
+                    last_updated=room.get("last_updated"),
+                    size_on_disk=room.get("size_on_disk", 0),
+                    attach_options=room.get("attach_options"),
+                )
+                for room in content["rooms"]
+            }
+        except FileNotFoundError:
+            self._scan()
+        except (OSError, ValueError, KeyError, TypeError):
+            logger.warning("Invalid rooms catalog %s: rebuilding it.", self.path)
+            self._scan()
+
+    def _scan(self) -> None:
+        """Build catalog from the cache directory content."""
+        self._rooms = {}
+        if self.cache_dir.is_dir():
+            for path in self.cache_dir.iterdir():
+                if path.is_dir():
+                    self._rooms[path.name] = RoomInfo(
+                        name=path.name,
+                        last_updated=path.stat().st_mtime,
+                        size_on_disk=get_dir_size(path),
+                    )
+        self._dirty = len(self._rooms) > 0
+
+
+def get_catalog(cache_dir: Union[str, Path]) -> _RoomCatalog:
+    """Return the catalog of a cache directory, loading it if necessary."""
+    cache_dir = Path(cache_dir).absolute()
+    catalog = _catalogs.get(cache_dir)
+    if catalog is None:
+        with _catalogs_lock:
+            catalog = _catalogs.get(cache_dir)
+            if catalog is None:
+                catalog = _RoomCatalog(cache_dir)
+                _catalogs[cache_dir] = catalog
+    return catalog
+
+
+@atexit.register
+def save_catalogs() -> None:
+    """Save all catalogs that have changed."""
+    for catalog in list(_catalogs.values()):
+        catalog.save()
+
+
+def get_dir_size(path: Path) -> int:
+    """Return total size of the files in a directory (in bytes)."""
+    size = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                size += os.path.getsize(os.path.join(dirpath, filename))
+            except OSError:
+                pass  # Deleted in the meantime
+    return size
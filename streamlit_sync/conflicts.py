@@ -0,0 +1,20 @@
+"""Resolution of keys updated concurrently by a session and the room.
+
+When a session commits while the room has been updated since it last synced, its
+updates are merged with the room: keys updated on one side only are kept as is. A
+resolver is only called for keys updated on both sides.
+"""
+from typing import Any, Callable
+
+# Called as `resolver(key, session_value, room_value)`. Return the value to keep.
+ConflictResolver = Callable[[str, Any, Any], Any]
+
+
+def last_writer_wins(key: str, session_value: Any, room_value: Any) -> Any:
+    """Keep the value of the session committing last. Default resolver."""
+    return session_value
+
+
+def first_writer_wins(key: str, session_value: Any, room_value: Any) -> Any:
+    """Keep the value already committed to the room."""
+    return room_value
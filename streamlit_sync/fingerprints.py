@@ -0,0 +1,135 @@
+"""Cheap change detection for synced values.
+
+Comparing large values with `!=` on every rerun is expensive (e.g. element-wise
+comparison of DataFrames) and sometimes ambiguous (NumPy arrays return an array). This
+module computes a type-aware fingerprint of a value that can be compared instead. Types
+that cannot be fingerprinted fall back to a safe equality check.
+
+NumPy and Pandas are optional: they are only used if already imported by the app.
+"""
+import hashlib
+import sys
+from typing import Any, Optional
+
+# Scalars are encoded with their repr when part of a container
+_SCALAR_TYPES = (int, float, complex, bool, type(None))
+_BYTES_TYPES = (bytes, bytearray, memoryview)
+
+
+def fingerprint(value: Any) -> Optional[bytes]:
+    """Return a fingerprint of the value, or None if type is not supported.
+
+    Two values with the same fingerprint are considered equal. Scalars are not
+    fingerprinted at top-level since comparing them is already cheap.
+    """
+    if isinstance(value, _SCALAR_TYPES):
+        return None
+
+    hasher = hashlib.blake2b(digest_size=16)
+    try:
+        if not _update(hasher, value):
+            return None
+    except Exception:
+        # Any error while hashing (e.g. un-hashable objects in a DataFrame)
+        return None
+    return hasher.digest()
+
+
+def values_equal(value: Any, other: Any) -> bool:
+    """Check if 2 values are equal, without ambiguity for arrays and DataFrames."""
+    if value is other:
+        return True
+
+    if isinstance(value, float) and isinstance(other, float):
+        # NaN is not equal to itself but is not a change
+        return value == other or (value != value and other != other)
+
+    np = sys.modules.get("numpy")
+    if np is not None and isinstance(value, np.ndarray):
+        return (
+            isinstance(other, np.ndarray)
+            and value.dtype == other.dtype
+            and value.shape == other.shape
+            and bool(np.array_equal(value, other))
+        )
+
+    pd = sys.modules.get("pandas")
+    if pd is not None and isinstance(value, (pd.DataFrame, pd.Series)):
+        return type(value) is type(other) and bool(value.equals(other))
+
+    try:
+        result = value == other
+        return result if isinstance(result, bool) else bool(result)
+    except Exception:
+        # Ambiguous comparison (e.g. a list of arrays): consider values different
+        return False
+
+
+def _update(hasher: Any, value: Any) -> bool:
+    """Feed the value to the hasher. Return False if type is not supported."""
+    np = sys.modules.get("numpy")
+    if np is not None and isinstance(value, np.ndarray):
+        # Subclasses (e.g. memory-mapped arrays) have the same fingerprint
+        if value.dtype.hasobject:
+            return False
+        _feed(hasher, b"ndarray")
+        _feed(hasher, str(value.dtype).encode())
+        _feed(hasher, str(value.shape).encode())
+        _feed(hasher, np.ascontiguousarray(value).data)
+        return True
+
+    _feed(hasher, type(value).__qualname__.encode())
+
+    if isinstance(value, _SCALAR_TYPES):
+        _feed(hasher, repr(value).encode())
+        return True
+
+    if isinstance(value, str):
+        _feed(hasher, value.encode("utf-8", "surrogatepass"))
+        return True
+
+    if isinstance(value, _BYTES_TYPES):
+        _feed(hasher, value)
+        return True
+
+    if isinstance(value, (list, tuple)):
+        _feed(hasher, str(len(value)).encode())
+        return all(_update(hasher, item) for item in value)
+
+    if isinstance(value, dict):
+        _feed(hasher, str(len(value)).encode())
+        return all(
+            _update(hasher, key) and _update(hasher, item)
+            for key, item in value.items()
+        )
+
+    if isinstance(value, (set, frozenset)):
+        # Sets are unordered: feed fingerprints of the items in a sorted way
+        digests = []
+        for item in value:
+            item_hasher = hashlib.blake2b(digest_size=16)
+            if not _update(item_hasher, item):
+                return False
+            digests.append(item_hasher.digest())
+        _feed(hasher, b"".join(sorted(digests)))
+        return True
+
+    pd = sys.modules.get("pandas")
+    if pd is not None and isinstance(value, (pd.DataFrame, pd.Series)):
+        if isinstance(value, pd.DataFrame):
+            _feed(hasher, repr(list(value.columns)).encode())
+            _feed(hasher, repr(list(value.dtypes)).encode())
+        else:
+            _feed(hasher, repr(value.name).encode())
+            _feed(hasher, str(value.dtype).encode())
+        _feed(hasher, pd.util.hash_pandas_object(value, index=True).values.data)
+        return True
+
+    return False
+
+
+def _feed(hasher: Any, data: Any) -> None:
+    """Feed data prefixed by its length so that consecutive chunks can't collide."""
+    data = memoryview(data)
+    hasher.update(data.nbytes.to_bytes(8, "little"))
+    hasher.update(data)
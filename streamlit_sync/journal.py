@@ -0,0 +1,264 @@
+"""Append-only journal storage engine for rooms attached to disk.
+
+Instead of a random-access write in a diskcache database, each commit is appended to a
+journal file as a single record:
+
+    payload size | CRC32 of payload | payload = version | pickled updated values
+
+State is kept in memory. When the journal has grown above a threshold, a background
+thread compacts it: a snapshot of the whole state is written (see `snapshots.py`) and
+journal files covered by the snapshot are deleted. When the server starts, the room is
+recovered by reading the snapshot and replaying the journal sequentially. A record left
+half-written by a crash is detected by its checksum and ignored.
+
+The journal is split in segments (`journal-<sequence>.log`): a new segment is started
+on each compaction. Old segments can be kept up to a size limit to replay the history
+of the room.
+"""
+import logging
+import os
+import pickle
+import struct
+import zlib
+from pathlib import Path
+from threading import Event, Lock, Thread
+from typing import IO, Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from .serializers import SerializationPolicy, dumps, loads
+from .snapshots import RoomSnapshot, write_snapshot
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FILENAME = "snapshot.stsync"
+_SEGMENT_PREFIX = "journal-"
+_SEGMENT_SUFFIX = ".log"
+_HEADER = struct.Struct("<II")
+_VERSION = struct.Struct("<Q")
+
+
+class JournalPolicy(NamedTuple):
+    """Configure the journal storage engine.
+
+    Args:
+        compact_bytes: Size of the journal (in bytes) above which it is compacted into
+            a snapshot. Defaults to 16MB.
+        history_bytes: Max size of the journal segments kept after compaction, to
+            replay the history of the room. Defaults to 0 (no history).
+        fsync: If True, each record is synced to the storage device before the
+            commit returns. Otherwise records are only written to the OS, which
+            survives a crash of the server but not of the machine. Defaults to False.
+    """
+
+    compact_bytes: int = 16 * 1024 * 1024
+    history_bytes: int = 0
+    fsync: bool = False
+
+
+class _Journal:
+    """Journal of a room, in a directory.
+
+    Args:
+        directory: Directory of the room.
+        policy: Journal configuration.
+        capture: Called by the compaction thread. Must start a new segment (see
+            `rotate`) and return a copy of the state with its version, atomically
+            with respect to `append`.
+        serialization: If provided, values are serialized with this policy instead
+            of being pickled.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        policy: JournalPolicy,
+        capture: Callable[[], Tuple[Dict[str, Any], int]],
+        serialization: Optional[SerializationPolicy] = None,
+    ) -> None:
+        self.directory = directory
+        self.policy = policy
+        self.serialization = serialization
+        self._capture = capture
+
+        self._lock = Lock()
+        self._file: Optional[IO[bytes]] = None
+        self._sequence = 0
+        # Size of the segments written since the last snapshot
+        self._pending_bytes = 0
+
+        self._wake_up = Event()
+        self._stopped = Event()
+        self._thread: Optional[Thread] = None
+
+    def load(self) -> Tuple[Dict[str, Any], Optional[int]]:
+        """Recover state from the snapshot and the journal. Return state and version.
+
+        Version is None if nothing has been persisted yet. A new segment is started
+        and the compaction thread is started.
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        values: Dict[str, Any] = {}
+        version: Optional[int] = None
+
+        snapshot_path = self.directory / SNAPSHOT_FILENAME
+        if snapshot_path.exists():
+            with RoomSnapshot(snapshot_path) as snapshot:
+                values = dict(snapshot.items())
+                version = snapshot.version
+
+        snapshot_version = version
+        segments = self._list_segments()
+        for _, path in segments:
+            for record_version, updated_values, size in _read_segment(path):
+                if snapshot_version is None or record_version > snapshot_version:
+                    values.update(updated_values)
+                    version = record_version
+                    self._pending_bytes += size
+
+        with self._lock:
+            self._sequence = segments[-1][0] if segments else 0
+            self._open_segment()
+
+        self._thread = Thread(
+            target=self._run, name="streamlit_sync_journal", daemon=True
+        )
+        self._thread.start()
+        if self._pending_bytes >= self.policy.compact_bytes:
+            self._wake_up.set()
+        return values, version
+
+    def encode(self, values: Dict[str, Any]) -> bytes:
+        """Serialize updated values. Can be called before locking the room."""
+        if self.serialization is not None:
+            values = {
+                key: dumps(value, self.serialization) for key, value in values.items()
+            }
+        return pickle.dumps(values, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def append(self, version: int, data: bytes) -> None:
+        """Append updated values, serialized with `encode`, to the journal."""
+        payload = _VERSION.pack(version) + data
+        record = _HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+        with self._lock:
+            assert self._file is not None
+            self._file.write(record)
+            self._file.flush()
+            if self.policy.fsync:
+                os.fsync(self._file.fileno())
+            self._pending_bytes += len(record)
+            if self._pending_bytes >= self.policy.compact_bytes:
+                self._wake_up.set()
+
+    def rotate(self) -> None:
+        """Start a new segment. Next records are not covered by the next snapshot."""
+        with self._lock:
+            self._open_segment()
+            self._pending_bytes = 0
+
+    def compact(self) -> None:
+        """Write a snapshot of the state and delete the segments it covers."""
+        values, version = self._capture()
+        write_snapshot(
+            self.directory / SNAPSHOT_FILENAME, self.directory.name, version, values
+        )
+
+        # All segments but the current one are covered by the snapshot
+        with self._lock:
+            current_sequence = self._sequence
+        old_segments = [
+            path
+            for sequence, path in self._list_segments()
+            if sequence < current_sequence
+        ]
+        history_size = 0
+        for path in reversed(old_segments):
+            size = path.stat().st_size
+            history_size += size
+            if size == 0 or history_size > self.policy.history_bytes:
+                path.unlink()
+
+    def history(
+        self, since_version: Optional[int] = None
+    ) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """Replay updates kept in the journal, from the oldest to the latest.
+
+        Yield the version and updated values of each commit after `since_version`.
+        """
+        for _, path in self._list_segments():
+            for version, values, _ in _read_segment(path, warn=False):
+                if since_version is None or version > since_version:
+                    yield version, values
+
+    def close(self) -> None:
+        """Stop the compaction thread and close the journal."""
+        self._stopped.set()
+        self._wake_up.set()
+        if self._thread is not None:
+            self._thread.join()
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            self._wake_up.wait()
+            self._wake_up.clear()
+            if self._stopped.is_set():
+                break
+            try:
+                self.compact()
+            except Exception:
+                logger.exception("Failed to compact journal in %s.", self.directory)
+
+    def _open_segment(self) -> None:
+        """Close current segment and open the next one. Must hold the lock."""
+        if self._file is not None:
+            self._file.close()
+        self._sequence += 1
+        self._file = open(self._segment_path(self._sequence), "ab")
+
+    def _segment_path(self, sequence: int) -> Path:
+        return self.directory / f"{_SEGMENT_PREFIX}{sequence:08d}{_SEGMENT_SUFFIX}"
+
+    def _list_segments(self) -> List[Tuple[int, Path]]:
+        segments = []
+        for path in self.directory.glob(f"{_SEGMENT_PREFIX}*{_SEGMENT_SUFFIX}"):
+            try:
+                sequence = int(path.name[len(_SEGMENT_PREFIX) : -len(_SEGMENT_SUFFIX)])
+            except ValueError:
+                continue
+            segments.append((sequence, path))
+        return sorted(segments)
+
+
+def has_journal(directory: Path) -> bool:
+    """Return True if a room has been persisted in a directory with a journal."""
+    return (directory / SNAPSHOT_FILENAME).exists() or any(
+        directory.glob(f"{_SEGMENT_PREFIX}*{_SEGMENT_SUFFIX}")
+    )
+
+
+def _read_segment(
+    path: Path, warn: bool = True
+) -> Iterator[Tuple[int, Dict[str, Any], int]]:
+    """Read records of a segment sequentially, up to the first invalid one.
+
+    Yield the version, updated values and size of each record. The last record of the
+    current segment can be invalid if it is being written: set `warn` to False.
+    """
+    with open(path, "rb") as f:
+        while True:
+            header = f.read(_HEADER.size)
+            if len(header) < _HEADER.size:
+                return
+            size, crc = _HEADER.unpack(header)
+            payload = f.read(size)
+            if len(payload) < size or zlib.crc32(payload) != crc:
+                if warn:
+                    logger.warning("Ignoring truncated record at the end of %s.", path)
+                return
+            (version,) = _VERSION.unpack_from(payload)
+            values = pickle.loads(memoryview(payload)[_VERSION.size :])
+            # Values serialized with a policy are decoded, others are returned as is
+            values = {key: loads(value) for key, value in values.items()}
+            yield version, values, _HEADER.size + size
@@ -0,0 +1,121 @@
+"""Results of expensive computations shared by the sessions of a room.
+
+When a room is updated, all its sessions are rerun and usually derive the same results
+from the same synced values. A function memoized with `room_memo` is cached per room
+and per version of the values it depends on: the first session computing it after an
+update stores the result, other sessions reuse it. Sessions asking for a result being
+computed wait for it instead of computing it again.
+
+A result is keyed on the arguments of the function and on the version of the room the
+session has synced with (or the versions of the keys the function depends on, if
+provided). Results of older versions are evicted as new ones are computed. Sessions
+that are not up to date compute their own result, which is not cached. Like with
+`st.experimental_memo`, each call returns a copy of the cached result unless
+`copy_results=False`.
+"""
+from collections import OrderedDict
+from threading import Event, Lock
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+from .exceptions import StreamlitSyncException
+from .fingerprints import fingerprint
+
+
+class _Entry:
+    """Result of a call. Sessions asking for it while it is computed wait for it."""
+
+    __slots__ = ("done", "failed", "value")
+
+    def __init__(self) -> None:
+        self.done = Event()
+        self.failed = False
+        self.value: Any = None
+
+
+class _MemoCache:
+    """Results of a memoized function, in a room.
+
+    Args:
+        max_entries: Max number of distinct arguments cached. Least recently used
+            arguments are evicted first.
+        max_versions: Max number of versions cached per arguments. Oldest versions are
+            evicted first.
+    """
+
+    def __init__(self, max_entries: int, max_versions: int) -> None:
+        self.max_entries = max_entries
+        self.max_versions = max_versions
+        self._lock = Lock()
+        # Arguments => versions => result
+        self._entries: "OrderedDict[Hashable, OrderedDict[Hashable, _Entry]]" = (
+            OrderedDict()
+        )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(len(entries) for entries in self._entries.values())
+
+    def get_or_compute(
+        self, arguments: Hashable, versions: Hashable, compute: Callable[[], Any]
+    ) -> Tuple[Any, bool]:
+        """Return the result of a call, computing it if needed. Return result and hit.
+
+        A result is computed by a single session at a time and stored only once
+        computed. If `compute` raises, the exception is propagated and the next waiting
+        session computes the result.
+        """
+        while True:
+            with self._lock:
+                entries = self._entries.get(arguments)
+                if entries is None:
+                    entries = self._entries[arguments] = OrderedDict()
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+                else:
+                    self._entries.move_to_end(arguments)
+
+                entry = entries.get(versions)
+                if entry is None:
+                    entry = entries[versions] = _Entry()
+                    while len(entries) > self.max_versions:
+                        entries.popitem(last=False)
+                    break
+
+            # Computed or being computed by another session
+            entry.done.wait()
+            if not entry.failed:
+                return entry.value, True
+
+        try:
+            entry.value = compute()
+        except BaseException:
+            # Including reruns and stops requested while computing
+            with self._lock:
+                entries = self._entries.get(arguments)
+                if entries is not None and entries.get(versions) is entry:
+                    del entries[versions]
+            entry.failed = True
+            entry.done.set()
+            raise
+        entry.done.set()
+        return entry.value, False
+
+
+def make_arguments_key(args: Tuple[Any, ...], kwargs: Dict[str, Any]) -> Hashable:
+    """Return a hashable key of the arguments of a call.
+
+    Unhashable arguments (lists, arrays, DataFrames,...) are fingerprinted.
+    """
+    key = (args, tuple(sorted(kwargs.items())))
+    try:
+        hash(key)
+        return key
+    except TypeError:
+        pass
+    arguments_fingerprint = fingerprint([list(args), kwargs])
+    if arguments_fingerprint is None:
+        raise StreamlitSyncException(
+            "Cannot memoize call: arguments must be hashable or fingerprintable"
+            " (containers, bytes, arrays, DataFrames)."
+        )
+    return arguments_fingerprint
@@ -0,0 +1,280 @@
+"""Instrumentation of the rooms internals.
+
+Each room records counters (commits, catch-ups, keys scanned,...) and histograms
+(lock wait and hold time, scan duration, fan-out latency,...). Stats are available per
+room or aggregated over all rooms with `get_stats`, and can be exported in the
+Prometheus text format with `render_prometheus` or `start_http_server`.
+
+Recording is cheap but can be disabled with `set_enabled(False)`.
+"""
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+_enabled = True
+
+# Metrics are kept when a room is unloaded from memory
+_room_metrics: Dict[str, "RoomMetrics"] = {}
+_room_metrics_lock = Lock()
+
+_TIME_BUCKETS = (1e-5, 5e-5, 1e-4, 5e-4, 1e-3, 5e-3, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+_SIZE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 5000)
+
+COUNTERS: Dict[str, str] = {
+    "syncs": "Number of syncs (2 per script run).",
+    "commits": "Number of successful commits.",
+    "conflicts": "Number of commits refused because the room was updated meanwhile.",
+    "merged_commits": "Number of commits merged with concurrent updates of the room.",
+    "key_conflicts": "Number of keys updated concurrently by a session and the room.",
+    "catch_ups": "Number of catch-ups (missed values applied to a session).",
+    "catch_up_reruns": "Number of catch-ups that required an extra script run.",
+    "keys_scanned": "Number of keys compared with the room values.",
+    "keys_changed": "Number of updated keys committed.",
+    "disk_bytes_written": "Estimated size of the values committed to disk.",
+    "waves": "Number of broadcast waves.",
+    "sessions_triggered": "Number of rerun requests sent to sessions.",
+    "sessions_not_subscribed": (
+        "Number of outdated sessions not rerun as they do not depend on the updates."
+    ),
+    "memo_hits": "Number of memoized results reused from the room.",
+    "memo_misses": "Number of memoized results computed by a session.",
+}
+
+HISTOGRAMS: Dict[str, Tuple[str, Sequence[float]]] = {
+    "lock_wait_seconds": ("Time spent waiting for the room lock.", _TIME_BUCKETS),
+    "lock_hold_seconds": ("Time the room lock is held.", _TIME_BUCKETS),
+    "backend_lock_wait_seconds": (
+        "Time spent waiting for the backend lock (commits, reads of missed values).",
+        _TIME_BUCKETS,
+    ),
+    "backend_lock_hold_seconds": ("Time the backend lock is held.", _TIME_BUCKETS),
+    "scan_seconds": ("Duration of the scan of updated values.", _TIME_BUCKETS),
+    "commit_seconds": ("Duration of the commits to the backend.", _TIME_BUCKETS),
+    "fan_out_size": ("Number of sessions triggered per wave.", _SIZE_BUCKETS),
+    "fan_out_seconds": ("Latency to send rerun requests.", _TIME_BUCKETS),
+}
+
+
+def set_enabled(enabled: bool) -> None:
+    """Enable or disable recording of the metrics. Enabled by default."""
+    global _enabled
+    _enabled = enabled
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+class _Histogram:
+    __slots__ = ("buckets", "counts", "count", "sum", "max")
+
+    def __init__(self, buckets: Sequence[float]) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other: "_Histogram") -> None:
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.count += other.count
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "max": self.max,
+            "buckets": dict(zip(list(self.buckets) + [float("inf")], self.counts)),
+        }
+
+
+class RoomMetrics:
+    """Counters and histograms of a room."""
+
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self.clear()
+
+    def clear(self) -> None:
+        with self._lock:
+            self.counters: Dict[str, int] = dict.fromkeys(COUNTERS, 0)
+            self.histograms: Dict[str, _Histogram] = {
+                name: _Histogram(buckets) for name, (_, buckets) in HISTOGRAMS.items()
+            }
+
+    def inc(self, name: str, value: int = 1) -> None:
+        if _enabled:
+            with self._lock:
+                self.counters[name] += value
+
+    def observe(self, name: str, value: float) -> None:
+        if _enabled:
+            with self._lock:
+                self.histograms[name].observe(value)
+
+    def merge(self, other: "RoomMetrics") -> None:
+        with other._lock:
+            for name, value in other.counters.items():
+                self.counters[name] += value
+            for name, histogram in other.histograms.items():
+                self.histograms[name].merge(histogram)
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            stats: Dict[str, Any] = dict(self.counters)
+            for name, histogram in self.histograms.items():
+                stats[name] = histogram.as_dict()
+        return stats
+
+
+class _InstrumentedLock:
+    """Lock recording wait and hold times in the room metrics.
+
+    Args:
+        metrics: Metrics of the room.
+        lock: Lock to instrument, reentrant or not. Defaults to a new `Lock`. Only the
+            outermost acquisition of a reentrant lock is recorded.
+        prefix: Times are recorded in the `<prefix>_wait_seconds` and
+            `<prefix>_hold_seconds` histograms. Defaults to "lock" (room lock).
+    """
+
+    def __init__(
+        self, metrics: RoomMetrics, lock: Optional[Any] = None, prefix: str = "lock"
+    ) -> None:
+        self._lock = Lock() if lock is None else lock
+        self._metrics = metrics
+        self._wait_name = f"{prefix}_wait_seconds"
+        self._hold_name = f"{prefix}_hold_seconds"
+        # Only modified by the thread holding the lock
+        self._depth = 0
+        self._acquired_at: Optional[float] = None
+
+    def acquire(self, blocking: bool = True) -> bool:
+        start = time.perf_counter() if _enabled else None
+        if not self._lock.acquire(blocking):
+            return False
+        self._depth += 1
+        if self._depth == 1:
+            if start is None:
+                self._acquired_at = None
+            else:
+                self._acquired_at = time.perf_counter()
+                self._metrics.observe(self._wait_name, self._acquired_at - start)
+        return True
+
+    def release(self) -> None:
+        # Read before another thread acquires the lock
+        self._depth -= 1
+        is_released, acquired_at = self._depth == 0, self._acquired_at
+        self._lock.release()
+        if is_released and acquired_at is not None:
+            self._metrics.observe(self._hold_name, time.perf_counter() - acquired_at)
+
+    def __enter__(self) -> None:
+        self.acquire()
+
+    def __exit__(self, type, value, traceback) -> None:  # type: ignore
+        self.release()
+
+
+def get_room_metrics(room_name: str) -> RoomMetrics:
+    """Return metrics of a room, creating them if needed."""
+    metrics = _room_metrics.get(room_name)
+    if metrics is None:
+        with _room_metrics_lock:
+            metrics = _room_metrics.setdefault(room_name, RoomMetrics())
+    return metrics
+
+
+def get_stats(room_name: Optional[str] = None) -> Dict[str, Any]:
+    """Return stats of a room, or aggregated over all rooms if no room is provided.
+
+    Counters are returned as integers and histograms as a dictionary with `count`,
+    `sum`, `max` and non-cumulative `buckets` (upper bound -> count).
+    """
+    if room_name is not None:
+        return get_room_metrics(room_name).as_dict()
+
+    total = RoomMetrics()
+    for metrics in list(_room_metrics.values()):
+        total.merge(metrics)
+    return total.as_dict()
+
+
+def reset() -> None:
+    """Reset all recorded metrics to zero."""
+    for metrics in list(_room_metrics.values()):
+        metrics.clear()
+
+
+def render_prometheus() -> str:
+    """Render metrics of all rooms in the Prometheus text format."""
+    rooms = sorted(list(_room_metrics.items()))
+    lines: List[str] = []
+    for name, description in COUNTERS.items():
+        metric = f"streamlit_sync_{name}_total"
+        lines.append(f"# HELP {metric} {description}")
+        lines.append(f"# TYPE {metric} counter")
+        for room_name, metrics in rooms:
+            value = metrics.counters[name]
+            lines.append(f"{metric}{{room={_quote(room_name)}}} {value}")
+
+    for name, (description, buckets) in HISTOGRAMS.items():
+        metric = f"streamlit_sync_{name}"
+        lines.append(f"# HELP {metric} {description}")
+        lines.append(f"# TYPE {metric} histogram")
+        for room_name, metrics in rooms:
+            with metrics._lock:
+                histogram = metrics.histograms[name]
+                counts = list(histogram.counts)
+                count, total = histogram.count, histogram.sum
+            label = f"room={_quote(room_name)}"
+            cumulative = 0
+            for bound, bucket_count in zip(list(buckets) + ["+Inf"], counts):
+                cumulative += bucket_count
+                lines.append(f'{metric}_bucket{{{label},le="{bound}"}} {cumulative}')
+            lines.append(f"{metric}_sum{{{label}}} {total}")
+            lines.append(f"{metric}_count{{{label}}} {count}")
+    return "\n".join(lines) + "\n"
+
+
+def start_http_server(port: int, addr: str = "") -> ThreadingHTTPServer:
+    """Serve metrics in the Prometheus text format from a background thread.
+
+    Return the server. Call `server.shutdown()` to stop it.
+    """
+    server = ThreadingHTTPServer((addr, port), _MetricsHandler)
+    Thread(
+        target=server.serve_forever, name="streamlit_sync_metrics", daemon=True
+    ).start()
+    return server
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        content = render_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass  # Do not log each scrape
+
+
+def _quote(value: str) -> str:
+    escaped = value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return f'"{escaped}"'
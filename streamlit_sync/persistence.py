@@ -0,0 +1,109 @@
+"""Write-behind persistence for rooms attached to disk.
+
+By default, each commit of a room attached to disk is written synchronously to its
+cache. In write-behind mode, the in-memory state of the room is authoritative: updated
+values are marked as dirty and flushed to the cache in batches by a background thread.
+"""
+import atexit
+import logging
+import weakref
+from threading import Event, Lock, Thread
+from typing import Any, Dict, Mapping, NamedTuple, Union
+
+from .blobs import _BlobIndex
+from .serializers import _SerializedIndex
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindPolicy(NamedTuple):
+    """Configure how dirty values are flushed to disk.
+
+    Args:
+        flush_interval: Max time (in seconds) between 2 flushes. Defaults to 1s.
+        max_dirty: Number of dirty keys above which a flush is triggered without
+            waiting for the interval. Defaults to 100.
+        flush_on_shutdown: Whether dirty values are flushed when the server stops.
+            Values of rooms unloaded from memory (e.g. evicted) are always flushed.
+            Defaults to True.
+    """
+
+    flush_interval: float = 1.0
+    max_dirty: int = 100
+    flush_on_shutdown: bool = True
+
+
+# Flushers to stop on shutdown
+_flushers: "weakref.WeakSet[_WriteBehindFlusher]" = weakref.WeakSet()
+
+
+class _WriteBehindFlusher:
+    def __init__(
+        self, index: Union[_SerializedIndex, _BlobIndex], policy: WriteBehindPolicy
+    ) -> None:
+        self.index = index
+        self.policy = policy
+
+        self._lock = Lock()
+        self._dirty: Dict[str, Any] = {}
+        self._wake_up = Event()
+        self._stopped = Event()
+
+        self._thread = Thread(
+            target=self._run, name="streamlit_sync_write_behind", daemon=True
+        )
+        self._thread.start()
+        _flushers.add(self)
+
+    @property
+    def nb_dirty(self) -> int:
+        """Return number of values not yet flushed to disk."""
+        return len(self._dirty)
+
+    def mark_dirty(self, values: Mapping[str, Any]) -> None:
+        """Mark values as to be flushed to disk."""
+        with self._lock:
+            self._dirty.update(values)
+            if len(self._dirty) >= self.policy.max_dirty:
+                self._wake_up.set()
+
+    def flush(self) -> None:
+        """Write all dirty values to disk in a single transaction."""
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+        if len(dirty) == 0:
+            return
+
+        try:
+            with self.index.transact():
+                self.index.update(dirty)
+        except Exception:
+            # Values will be retried on next flush unless updated in the meantime
+            logger.exception("Failed to flush values to %s.", self.index.directory)
+            with self._lock:
+                for key, value in dirty.items():
+                    self._dirty.setdefault(key, value)
+
+    def stop(self, flush: bool = True) -> None:
+        """Stop background thread, optionally flushing remaining dirty values."""
+        self._stopped.set()
+        self._wake_up.set()
+        self._thread.join()
+        if flush:
+            self.flush()
+        _flushers.discard(self)
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            self._wake_up.wait(self.policy.flush_interval)
+            self._wake_up.clear()
+            if self._stopped.is_set():
+                # Last flush is handled by `stop`
+                break
+            self.flush()
+
+
+@atexit.register
+def _stop_all_flushers() -> None:
+    for flusher in list(_flushers):
+        flusher.stop(flush=flusher.policy.flush_on_shutdown)
@@ -1,15 +1,40 @@
 """High level API to manage rooms."""
+from functools import partial, wraps
+from pathlib import Path
+from threading import Lock, Thread
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Tuple, Union
+
 import streamlit as st
 
 from . import st_hack
+from .conflicts import ConflictResolver, last_writer_wins
 from .exceptions import StreamlitSyncException
-from .synced_state import get_synced_state
-from .utils import LAST_SYNCED_KEY, ROOM_NAME_KEY
+from .memo import make_arguments_key
+from .snapshots import RoomSnapshot, write_snapshot
+from .synced_state import EvictionPolicy, get_room_registry, get_synced_state
+from .utils import (
+    LAST_SYNCED_KEY,
+    READ_ONLY_KEY,
+    ROOM_NAME_KEY,
+    SYNCED_ROOM_KEY,
+    SYNCED_VALUES_KEY,
+)
+
+# Warm-up threads, by cache dir
+_warm_ups: Dict[Path, Thread] = {}
+_warm_ups_lock = Lock()
+
 
+def enter_room(room_name: str, read_only: bool = False) -> None:
+    """Enter a room from current session (register and rerun).
 
-def enter_room(room_name: str) -> None:
-    """Enter a room from current session (register and rerun)."""
+    Args:
+        room_name: Name of the room to enter.
+        read_only: If True, the session only receives values from the room (viewer).
+            Defaults to False.
+    """
     st.session_state[ROOM_NAME_KEY] = room_name
+    st.session_state[READ_ONLY_KEY] = read_only
     st.experimental_rerun()
 
 
@@ -22,6 +47,9 @@ def exit_room() -> None:
         raise StreamlitSyncException("Cannot exit a room: currently not in a room.")
 
     del st.session_state[LAST_SYNCED_KEY]
+    st.session_state.pop(SYNCED_VALUES_KEY, None)
+    st.session_state.pop(READ_ONLY_KEY, None)
+    st.session_state.pop(SYNCED_ROOM_KEY, None)
 
     # Unregister from room
     synced_state = get_synced_state(room_name)
@@ -34,6 +62,228 @@ def exit_room() -> None:
     st.experimental_rerun()
 
 
-def delete_room(room_name: str) -> None:
-    """Delete a room."""
-    get_synced_state(room_name).delete()
+def delete_room(room_name: str, cache_dir: Optional[Union[str, Path]] = None) -> None:
+    """Delete a room and its values. Sessions of the room are reset.
+
+    Args:
+        room_name: Name of the room to delete.
+        cache_dir: If provided, values persisted in this directory are deleted as well,
+            even if the room is not currently loaded.
+    """
+    if cache_dir is not None:
+        get_synced_state(room_name).reattach_to_disk(Path(cache_dir))
+    get_room_registry().delete(room_name)
+
+
+def set_eviction_policy(policy: Optional[EvictionPolicy]) -> None:
+    """Unload rooms without active sessions from memory, according to a policy.
+
+    Rooms persisted on disk are reloaded when a session enters them again. Values of
+    in-memory rooms are lost. Defaults to None (rooms are never evicted).
+    """
+    get_room_registry().set_eviction_policy(policy)
+
+
+def warm_up_rooms(
+    cache_dir: Union[str, Path],
+    max_rooms: Optional[int] = 10,
+    max_bytes: Optional[int] = None,
+) -> Thread:
+    """Load the most recently updated rooms of a cache directory in the background.
+
+    Rooms are attached to disk with the options they have been persisted with (as
+    recorded in the catalog of the cache directory), and their values are read and
+    fingerprinted once. Values
+    are kept in memory until the first session entering the room reads them, so that
+    this session does not pay for loading them. Meant to be called when the server
+    starts, e.g. at the top of the app: rooms of a cache directory are warmed up only
+    once per process. Return the warm-up thread.
+
+    Args:
+        cache_dir: Directory in which rooms are persisted.
+        max_rooms: Max number of rooms to load. Defaults to 10. None for no limit.
+        max_bytes: Max total size on disk of the rooms to load. Memory used once
+            loaded is not bounded. Defaults to None (no limit).
+    """
+    cache_dir = Path(cache_dir)
+    with _warm_ups_lock:
+        thread = _warm_ups.get(cache_dir.absolute())
+        if thread is None:
+            thread = Thread(
+                target=get_room_registry().warm_up,
+                args=(cache_dir, max_rooms, max_bytes),
+                name="streamlit_sync_warm_up",
+                daemon=True,
+            )
+            _warm_ups[cache_dir.absolute()] = thread
+            thread.start()
+    return thread
+
+
+def room_memo(
+    func: Optional[Callable[..., Any]] = None,
+    keys: Optional[Iterable[str]] = None,
+    max_entries: int = 32,
+    max_versions: int = 2,
+    copy_results: bool = True,
+) -> Any:
+    """Share the results of a function between the sessions of a room.
+
+    Results are cached per room and per version of the room the session has synced
+    with: after an update, the first session calling the function computes the result
+    and the other sessions reuse it. Sessions that are not up to date compute their
+    own result, which is not cached. The function must only depend on its arguments
+    and on the synced values of the room (e.g. read from `st.session_state`), not on
+    values set by the script before the call: such values would be cached for all the
+    sessions.
+
+    Like `st.experimental_memo`, each call returns a copy of the cached result so that
+    sessions can mutate it. Large results that are never mutated can be shared without
+    copies with `copy_results=False`.
+
+    Can be used as `@room_memo` or `@room_memo(keys=[...])`. The decorated function
+    must be called from a session synced with a room.
+
+    Args:
+        func: Function to memoize.
+        keys: If provided, results are only recomputed when one of these keys is
+            updated. Defaults to None (recomputed on any update of the room).
+        max_entries: Max number of distinct arguments cached per room. Defaults to 32.
+        max_versions: Max number of versions cached per arguments. Results of older
+            versions are evicted first. Defaults to 2.
+        copy_results: If True, return a deep copy of the cached result on each call.
+            If False, all sessions get the same object, which must not be mutated.
+            Defaults to True.
+    """
+    if func is None:
+        return partial(
+            room_memo,
+            keys=keys,
+            max_entries=max_entries,
+            max_versions=max_versions,
+            copy_results=copy_results,
+        )
+
+    # Scripts are executed again on each run: function is identified by its name
+    function_id = f"{func.__module__}.{func.__qualname__}"
+    key_tuple = None if keys is None else tuple(keys)
+
+    @wraps(func)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        room_name = st.session_state.get(SYNCED_ROOM_KEY)
+        if room_name is None:
+            raise StreamlitSyncException(
+                f"Cannot call {func.__qualname__}: session is not synced with a room."
+            )
+        return get_synced_state(room_name).memoize(
+            function_id,
+            make_arguments_key(args, kwargs),
+            partial(func, *args, **kwargs),
+            keys=key_tuple,
+            max_entries=max_entries,
+            max_versions=max_versions,
+            copy_results=copy_results,
+        )
+
+    return wrapper
+
+
+def configure_room(
+    room_name: str,
+    broadcast_window: float = 0.0,
+    max_broadcast_rate: Optional[float] = None,
+    conflict_resolver: ConflictResolver = last_writer_wins,
+) -> None:
+    """Configure how updates of a room are broadcasted to its sessions and merged.
+
+    Settings are kept by the process when the room is evicted or deleted, and applied
+    again when it is reloaded.
+
+    Args:
+        room_name: Name of the room.
+        broadcast_window: Time (in seconds) during which changes are batched into a
+            single wave of reruns. Defaults to 0 (each change triggers a wave).
+        max_broadcast_rate: Maximum number of rerun waves per second. Defaults to None
+            (no limit).
+        conflict_resolver: Called as `conflict_resolver(key, session_value,
+            room_value)` when a key has been updated by a session while it was
+            updated in the room by another one. Return the value to keep. Keys updated
+            by a single session are never in conflict. Defaults to `last_writer_wins`.
+    """
+    synced_state = get_synced_state(room_name)
+    synced_state.configure_broadcast(
+        window=broadcast_window, max_rate=max_broadcast_rate
+    )
+    synced_state.configure_conflicts(conflict_resolver)
+
+
+def export_room(
+    room_name: str,
+    path: Union[str, Path],
+    cache_dir: Optional[Union[str, Path]] = None,
+) -> None:
+    """Export all values of a room to a snapshot file.
+
+    Args:
+        room_name: Name of the room to export.
+        path: Path of the snapshot file. Overwritten if it already exists.
+        cache_dir: If provided, room is loaded from this directory if needed, with the
+            options it has been persisted with (storage engine, serialization,...).
+    """
+    synced_state = get_synced_state(room_name)
+    if cache_dir is not None:
+        synced_state.reattach_to_disk(Path(cache_dir))
+    # Values are streamed to the snapshot without locking the room
+    values, version = synced_state.iter_values()
+    write_snapshot(path, room_name, version, values)
+
+
+def get_room_history(
+    room_name: str, since_version: Optional[int] = None
+) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """Replay the updates of a room persisted with the journal storage engine.
+
+    Yield the version and updated values of each commit, from the oldest to the latest.
+    Only commits since the last compaction, plus the history kept by the
+    `JournalPolicy`, are available.
+
+    Args:
+        room_name: Name of the room. Must be attached to disk with a journal.
+        since_version: If provided, only commits after this version are replayed.
+    """
+    return get_synced_state(room_name).history(since_version)
+
+
+def import_room(
+    path: Union[str, Path],
+    room_name: Optional[str] = None,
+    cache_dir: Optional[Union[str, Path]] = None,
+    keys: Optional[Iterable[str]] = None,
+) -> str:
+    """Import values from a snapshot file into a room. Return the room name.
+
+    Values already in the room are overwritten but other keys are kept. Sessions of
+    the room are updated.
+
+    Args:
+        path: Path of the snapshot file.
+        room_name: Room to import into. Defaults to the room the snapshot has been
+            exported from. Use another name to clone a room.
+        cache_dir: If provided, room is persisted in this directory. If the room
+            already exists, it is loaded with the options it has been persisted with.
+        keys: If provided, only these keys are imported. Other values are not read
+            from the snapshot.
+    """
+    with RoomSnapshot(path) as snapshot:
+        if room_name is None:
+            room_name = snapshot.room_name
+        synced_state = get_synced_state(room_name)
+        if cache_dir is not None:
+            synced_state.reattach_to_disk(Path(cache_dir))
+
+        if keys is None:
+            keys = snapshot.keys()
+        synced_state.update_values(
+            {key: snapshot[key] for key in keys if key in snapshot}
+        )
+    return room_name
@@ -0,0 +1,362 @@
+"""Type-aware serialization of the values of rooms attached to disk.
+
+By default, persisted values are pickled. With a `SerializationPolicy`, each value is
+serialized by the first serializer accepting it:
+
+- `npy`: NumPy arrays (without Python objects), in the `.npy` format.
+- `arrow`: pandas DataFrames, in the Arrow IPC format. Requires `pyarrow`.
+- `str`: strings, encoded in UTF-8.
+- `msgpack`: plain containers (dicts and lists of strings, bytes, numbers, booleans
+  and None), e.g. JSON documents. Requires `msgpack`.
+- `pickle`: any other value.
+
+Serialized values larger than a threshold can be compressed with `zstd`, `lz4` (if
+installed) or `zlib`. Each serialized value starts with a header naming its serializer
+and compression, so a room can always be read back, even if the policy has changed.
+Custom serializers can be added with `register_serializer`.
+"""
+import io
+import pickle
+import struct
+import sys
+import zlib
+from functools import lru_cache
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from .exceptions import StreamlitSyncException
+
+if TYPE_CHECKING:
+    from diskcache import Index
+
+# Serialized values are stored as bytes starting with this prefix. Other values (pickled
+# by diskcache) were persisted without a policy.
+_MAGIC = b"\x00stsync\x00"
+_NAME_SIZE = struct.Struct("<B")
+
+
+class Serializer(NamedTuple):
+    """Serialize values of a given type to bytes.
+
+    Args:
+        name: Unique name of the serializer, stored with each value.
+        accepts: Return True if a value can be serialized.
+        dumps: Serialize a value. Can return any bytes-like object.
+        loads: Deserialize a value from a `memoryview`.
+    """
+
+    name: str
+    accepts: Callable[[Any], bool]
+    dumps: Callable[[Any], Any]
+    loads: Callable[[memoryview], Any]
+
+
+class SerializationPolicy(NamedTuple):
+    """Configure how persisted values are serialized.
+
+    Args:
+        serializers: Names of the serializers to try, in order. Serializers whose
+            library is not installed are skipped. Pickle is used for values accepted
+            by none of them. Defaults to all built-in serializers.
+        compression: Codec used to compress large values: "zstd", "lz4", "zlib" or
+            None (no compression). Defaults to None.
+        compress_threshold: Size (in bytes) of a serialized value above which it is
+            compressed. Defaults to 64KB.
+    """
+
+    serializers: Sequence[str] = ("npy", "arrow", "str", "msgpack")
+    compression: Optional[str] = None
+    compress_threshold: int = 64 * 1024
+
+
+def _is_array(value: Any) -> bool:
+    np = sys.modules.get("numpy")
+    return np is not None and type(value) is np.ndarray and not value.dtype.hasobject
+
+
+def _dumps_npy(value: Any) -> memoryview:
+    import numpy as np
+
+    buffer = io.BytesIO()
+    np.save(buffer, value, allow_pickle=False)
+    return buffer.getbuffer()
+
+
+def _loads_npy(data: memoryview) -> Any:
+    import numpy as np
+
+    # Only the header is parsed from a stream: data is copied once, like pickle does
+    header = io.BytesIO(data[:4096])
+    version = np.lib.format.read_magic(header)
+    if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(header)
+    else:
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(header)
+    count = 1
+    for dim in shape:
+        count *= dim
+    array = np.frombuffer(data, dtype=dtype, count=count, offset=header.tell())
+    return array.reshape(shape, order="F" if fortran_order else "C").copy(order="K")
+
+
+def _is_dataframe(value: Any) -> bool:
+    pd = sys.modules.get("pandas")
+    return (
+        pd is not None
+        and type(value) is pd.DataFrame
+        # Other column names would be converted to strings
+        and all(type(column) is str for column in value.columns)
+        and _is_installed("pyarrow")
+    )
+
+
+def _dumps_arrow(value: Any) -> bytes:
+    import pyarrow as pa
+
+    table = pa.Table.from_pandas(value)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def _loads_arrow(data: memoryview) -> Any:
+    import pyarrow as pa
+
+    return pa.ipc.open_stream(pa.py_buffer(data)).read_all().to_pandas()
+
+
+def _is_str(value: Any) -> bool:
+    return type(value) is str
+
+
+def _loads_str(data: memoryview) -> str:
+    return str(data, "utf-8")
+
+
+def _is_container(value: Any) -> bool:
+    return type(value) in (dict, list) and _is_installed("msgpack")
+
+
+def _dumps_msgpack(value: Any) -> bytes:
+    import msgpack
+
+    # Strict types: tuples, subclasses (e.g. NumPy floats) and other types are not
+    # restored as is. Raises a TypeError and the value is pickled instead.
+    return msgpack.packb(value, use_bin_type=True, strict_types=True)
+
+
+def _loads_msgpack(data: memoryview) -> Any:
+    import msgpack
+
+    return msgpack.unpackb(data, raw=False, strict_map_key=False)
+
+
+def _dumps_pickle(value: Any) -> bytes:
+    return pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+_PICKLE = Serializer("pickle", lambda value: True, _dumps_pickle, pickle.loads)
+
+_SERIALIZERS: Dict[str, Serializer] = {
+    serializer.name: serializer
+    for serializer in (
+        Serializer("npy", _is_array, _dumps_npy, _loads_npy),
+        Serializer("arrow", _is_dataframe, _dumps_arrow, _loads_arrow),
+        Serializer("str", _is_str, str.encode, _loads_str),
+        Serializer("msgpack", _is_container, _dumps_msgpack, _loads_msgpack),
+        _PICKLE,
+    )
+}
+
+
+def register_serializer(serializer: Serializer) -> None:
+    """Register a serializer. Add its name to a `SerializationPolicy` to use it.
+
+    A serializer must be registered before a room using it is read from disk.
+    """
+    if serializer.name in _SERIALIZERS:
+        raise StreamlitSyncException(
+            f"A serializer named {serializer.name!r} is already registered."
+        )
+    _SERIALIZERS[serializer.name] = serializer
+
+
+def _zstd_compress(data: Any) -> bytes:
+    import zstandard
+
+    return zstandard.ZstdCompressor().compress(data)
+
+
+def _zstd_decompress(data: memoryview) -> bytes:
+    import zstandard
+
+    return zstandard.ZstdDecompressor().decompress(data)
+
+
+def _lz4_compress(data: Any) -> bytes:
+    import lz4.frame
+
+    return lz4.frame.compress(data)
+
+
+def _lz4_decompress(data: memoryview) -> bytes:
+    import lz4.frame
+
+    return lz4.frame.decompress(data)
+
+
+def _zlib_compress(data: Any) -> bytes:
+    return zlib.compress(data)
+
+
+def _zlib_decompress(data: memoryview) -> bytes:
+    return zlib.decompress(data)
+
+
+# Codec name: (module to import, compress, decompress)
+_CODECS: Dict[
+    str, Tuple[str, Callable[[Any], bytes], Callable[[memoryview], bytes]]
+] = {
+    "zstd": ("zstandard", _zstd_compress, _zstd_decompress),
+    "lz4": ("lz4.frame", _lz4_compress, _lz4_decompress),
+    "zlib": ("zlib", _zlib_compress, _zlib_decompress),
+}
+
+
+@lru_cache(maxsize=None)
+def _is_installed(module_name: str) -> bool:
+    try:
+        __import__(module_name)
+    except ImportError:
+        return False
+    return True
+
+
+def check_policy(policy: SerializationPolicy) -> None:
+    """Raise an exception if a serializer or codec of the policy is unknown."""
+    for name in policy.serializers:
+        if name not in _SERIALIZERS:
+            raise StreamlitSyncException(f"Unknown serializer {name!r}.")
+    if policy.compression is not None:
+        if policy.compression not in _CODECS:
+            raise StreamlitSyncException(
+                f"Unknown compression {policy.compression!r}: expected one of"
+                f" {', '.join(_CODECS)}."
+            )
+        if not _is_installed(_CODECS[policy.compression][0]):
+            raise StreamlitSyncException(
+                f"Compression {policy.compression!r} requires the"
+                f" {_CODECS[policy.compression][0]!r} package."
+            )
+
+
+def dumps(value: Any, policy: SerializationPolicy) -> bytes:
+    """Serialize a value with the first serializer of the policy accepting it."""
+    for name in policy.serializers:
+        serializer = _SERIALIZERS[name]
+        if serializer.accepts(value):
+            try:
+                data = serializer.dumps(value)
+                break
+            except Exception:
+                # E.g. a tuple in a container or a DataFrame column with mixed types
+                continue
+    else:
+        name, data = _PICKLE.name, _PICKLE.dumps(value)
+
+    if policy.compression is not None and len(data) > policy.compress_threshold:
+        compressed = _CODECS[policy.compression][1](data)
+        if len(compressed) < len(data):
+            name, data = f"{name}+{policy.compression}", compressed
+
+    header = name.encode()
+    return b"".join((_MAGIC, _NAME_SIZE.pack(len(header)), header, data))
+
+
+def loads(data: Any) -> Any:
+    """Deserialize a value serialized with `dumps`. Other values are returned as is."""
+    if type(data) is not bytes or not data.startswith(_MAGIC):
+        return data
+    view = memoryview(data)
+    offset = len(_MAGIC) + _NAME_SIZE.size
+    (name_size,) = _NAME_SIZE.unpack_from(view, len(_MAGIC))
+    name = str(view[offset : offset + name_size], "ascii")
+    payload = view[offset + name_size :]
+
+    name, _, compression = name.partition("+")
+    if compression:
+        payload = memoryview(_CODECS[compression][2](payload))
+    try:
+        serializer = _SERIALIZERS[name]
+    except KeyError:
+        raise StreamlitSyncException(
+            f"Cannot read value serialized with {name!r}: serializer is not"
+            " registered."
+        ) from None
+    return serializer.loads(payload)
+
+
+class _SerializedIndex:
+    """Room state stored in a diskcache Index, with values serialized by a policy.
+
+    Values persisted without a policy are read as is. Implements the subset of the
+    Index API used by streamlit-sync.
+    """
+
+    def __init__(self, index: "Index", policy: Optional[SerializationPolicy]) -> None:
+        self.index = index
+        self.policy = policy
+        self.directory = index.directory
+        self.transact = index.transact
+
+    def __getitem__(self, key: str) -> Any:
+        return loads(self.index[key])
+
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self.index[key] = self._dumps(value)
+
+    def __delitem__(self, key: str) -> None:
+        del self.index[key]
+
+    def __contains__(self, key: object) -> bool:
+        return key in self.index
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.index)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def keys(self) -> Iterable[str]:
+        return self.index.keys()
+
+    def items(self) -> Iterator[Any]:
+        for key in self.index:
+            yield key, self[key]
+
+    def update(self, values: Dict[str, Any]) -> None:
+        with self.index.transact():
+            for key, value in values.items():
+                self[key] = value
+
+    def _dumps(self, value: Any) -> Any:
+        if self.policy is None:
+            return value
+        return dumps(value, self.policy)
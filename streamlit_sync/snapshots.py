@@ -0,0 +1,150 @@
+"""Compact snapshots of rooms, to back them up, move or clone them.
+
+A snapshot is a single file written in a streaming way:
+
+    MAGIC | value 1 | value 2 | ... | index | index offset | MAGIC
+
+Each value is pickled and compressed independently. Values that do not compress well
+(e.g. random floats) are stored raw to save time. The index maps each key to the
+position of its value in the file so that values can be loaded one by one, on demand,
+without reading the whole snapshot.
+"""
+import os
+import pickle
+import struct
+import tempfile
+import zlib
+from pathlib import Path
+from threading import Lock
+from typing import Any, Dict, Iterable, Iterator, Mapping, Tuple, Union
+
+from .exceptions import StreamlitSyncException
+
+MAGIC = b"STSYNC1\n"
+_FOOTER = struct.Struct("<Q")
+
+# Fast compression: snapshots are mostly limited by the speed of compression
+COMPRESSION_LEVEL = 1
+
+# Values are compressed only if a sample of them compresses below this ratio
+_SAMPLE_SIZE = 64 * 1024
+_MIN_COMPRESSION_RATIO = 0.9
+
+
+class RoomSnapshot:
+    """Read a room snapshot. Values are loaded on demand.
+
+    Args:
+        path: Path of the snapshot file.
+    """
+
+    def __init__(self, path: Union[str, Path]) -> None:
+        self.path = Path(path)
+        self._lock = Lock()
+        self._file = open(self.path, "rb")
+        try:
+            metadata = self._read_index()
+        except Exception:
+            self._file.close()
+            raise
+        self.room_name: str = metadata["room_name"]
+        self.version: int = metadata["version"]
+        self._index: Dict[str, Tuple[int, int, bool]] = metadata["index"]
+
+    def __enter__(self) -> "RoomSnapshot":
+        return self
+
+    def __exit__(self, type, value, traceback) -> None:  # type: ignore
+        self.close()
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._index
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._index)
+
+    def keys(self) -> Iterable[str]:
+        return self._index.keys()
+
+    def __getitem__(self, key: str) -> Any:
+        offset, size, is_compressed = self._index[key]
+        with self._lock:
+            self._file.seek(offset)
+            data = self._file.read(size)
+        return pickle.loads(zlib.decompress(data) if is_compressed else data)
+
+    def items(self) -> Iterator[Tuple[str, Any]]:
+        for key in self._index:
+            yield key, self[key]
+
+    def close(self) -> None:
+        self._file.close()
+
+    def _read_index(self) -> Dict[str, Any]:
+        if self._file.read(len(MAGIC)) != MAGIC:
+            raise StreamlitSyncException(f"{self.path} is not a room snapshot.")
+
+        footer_size = _FOOTER.size + len(MAGIC)
+        footer_offset = self._file.seek(-footer_size, os.SEEK_END)
+        footer = self._file.read(footer_size)
+        if footer[_FOOTER.size :] != MAGIC:
+            raise StreamlitSyncException(f"Room snapshot {self.path} is truncated.")
+        (index_offset,) = _FOOTER.unpack(footer[: _FOOTER.size])
+
+        self._file.seek(index_offset)
+        data = self._file.read(footer_offset - index_offset)
+        return pickle.loads(zlib.decompress(data))
+
+
+def write_snapshot(
+    path: Union[str, Path],
+    room_name: str,
+    version: int,
+    values: Union[Mapping[str, Any], Iterable[Tuple[str, Any]]],
+) -> None:
+    """Write values to a snapshot file, one by one.
+
+    File is written to a temporary file first so that an existing snapshot is never
+    left half-written.
+    """
+    path = Path(path)
+    items = values.items() if isinstance(values, Mapping) else values
+
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=path.name, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(MAGIC)
+            index: Dict[str, Tuple[int, int, bool]] = {}
+            for key, value in items:
+                try:
+                    data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+                except Exception as e:
+                    raise StreamlitSyncException(
+                        f"Cannot snapshot room {room_name}: value of {key} cannot be"
+                        f" pickled ({e})."
+                    ) from e
+                is_compressed = _is_worth_compressing(data)
+                if is_compressed:
+                    data = zlib.compress(data, COMPRESSION_LEVEL)
+                index[key] = (f.tell(), len(data), is_compressed)
+                f.write(data)
+
+            index_offset = f.tell()
+            metadata = {"room_name": room_name, "version": version, "index": index}
+            f.write(zlib.compress(pickle.dumps(metadata), COMPRESSION_LEVEL))
+            f.write(_FOOTER.pack(index_offset))
+            f.write(MAGIC)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _is_worth_compressing(data: bytes) -> bool:
+    if len(data) <= _SAMPLE_SIZE:
+        return True
+    compressed_sample = zlib.compress(data[:_SAMPLE_SIZE], COMPRESSION_LEVEL)
+    return len(compressed_sample) < _MIN_COMPRESSION_RATIO * _SAMPLE_SIZE
@@ -3,9 +3,9 @@
 It is most likely that this module will break in future updates of Streamlit.
 """
 import re
-from typing import Any, Iterable, Mapping, Optional, Tuple
+from threading import Lock
+from typing import Any, Callable, Iterable, Iterator, Mapping, Optional, Set, Tuple
 
-from streamlit.server.server import Server
 from streamlit.state.session_state import (
     GENERATED_WIDGET_KEY_PREFIX,
     STREAMLIT_INTERNAL_KEY_PREFIX,
@@ -37,6 +37,11 @@ except ImportError:
     from streamlit.state.session_state import is_keyed_widget_id as _is_keyed_widget_id
 
 
+# Imported on first use: the server module is slow to import
+Server: Any = None
+
+_patch_lock = Lock()
+
 _WIDGET_ID_REGEX = re.compile(
     re.escape(GENERATED_WIDGET_KEY_PREFIX) + r"-[0-9a-f]{32}-(?P<user_key>.*)"
 )
@@ -58,32 +63,42 @@ def widget_id_to_user_key(widget_id: str) -> str:
     return widget_id
 
 
-# Monkeypatch SessionState
-if not getattr(SessionState, "_is_patched_by_streamlit_sync", False):
+def _always_set_frontend_value_if_changed(
+    self: SessionState, widget_id: str, user_key: Optional[str]
+) -> bool:
+    """Keep `widget_state` and `session_state` in sync when a widget is registered.
 
-    def _always_set_frontend_value_if_changed(
-        self: SessionState, widget_id: str, user_key: Optional[str]
-    ) -> bool:
-        """Keep `widget_state` and `session_state` in sync when a widget is registered.
+    By default if a value has changed, the frontend widget will be updated only if
+    it's a user-keyed-widget. I guess this is done because user-keyed-widget can
+    be manually updated from st.session_state but not the "implicitly-keyed"
+    widgets.
 
-        By default if a value has changed, the frontend widget will be updated only if
-        it's a user-keyed-widget. I guess this is done because user-keyed-widget can
-        be manually updated from st.session_state but not the "implicitly-keyed"
-        widgets.
+    In our case, we want to update the frontend for any value change.
 
-        In our case, we want to update the frontend for any value change.
+    See:
+        - Streamlit >= 1.8
+            - https://github.com/streamlit/streamlit/blob/develop/lib/streamlit/state/session_state.py#L599 # noqa: E501
+            - https://github.com/streamlit/streamlit/blob/d07ffac8927e1a35b34684b55222854b3dd5a9a7/lib/streamlit/state/session_state.py#L599 # noqa: E501
 
-        See:
-            - Streamlit >= 1.8
-                - https://github.com/streamlit/streamlit/blob/develop/lib/streamlit/state/session_state.py#L599 # noqa: E501
-                - https://github.com/streamlit/streamlit/blob/d07ffac8927e1a35b34684b55222854b3dd5a9a7/lib/streamlit/state/session_state.py#L599 # noqa: E501
+        - Streamlit <= 1.7
+            - https://github.com/streamlit/streamlit/blob/1.7.0/lib/streamlit/state/session_state.py#L596 # noqa: E501
+            - https://github.com/streamlit/streamlit/blob/a3f1cef8e23a97188710b71c4cf927f4783f58c5/lib/streamlit/state/session_state.py#L596 # noqa: E501
+    """
+    return self.is_new_state_value(user_key or widget_id)
 
-            - Streamlit <= 1.7
-                - https://github.com/streamlit/streamlit/blob/1.7.0/lib/streamlit/state/session_state.py#L596 # noqa: E501
-                - https://github.com/streamlit/streamlit/blob/a3f1cef8e23a97188710b71c4cf927f4783f58c5/lib/streamlit/state/session_state.py#L596 # noqa: E501
-        """
-        return self.is_new_state_value(user_key or widget_id)
 
+def patch_session_state() -> None:
+    """Monkeypatch `SessionState` so that widgets are updated by synced values.
+
+    Applied when a room is first synced rather than on import: apps importing
+    streamlit-sync without using it are left untouched.
+    """
+    with _patch_lock:
+        if not getattr(SessionState, "_is_patched_by_streamlit_sync", False):
+            _patch_session_state()
+
+
+def _patch_session_state() -> None:
     # For Streamlit >= 1.8
     initial_register_widget = getattr(SessionState, "register_widget", None)
     if initial_register_widget is not None:
@@ -115,6 +130,52 @@ def get_session_id() -> str:
     return ctx.session_id
 
 
+def get_rendered_widget_keys() -> Set[str]:
+    """Return the user keys of the widgets already rendered in the current script run.
+
+    Widgets without user key are returned by widget id.
+    """
+    ctx = get_script_run_ctx()
+    widget_ids = getattr(ctx, "widget_ids_this_run", None)
+    if widget_ids is None:
+        return set()
+    if hasattr(widget_ids, "items"):
+        # streamlit < 1.4: thread-safe set of strings
+        widget_ids = widget_ids.items()
+    return {widget_id_to_user_key(widget_id) for widget_id in widget_ids}
+
+
+def is_server_running() -> bool:
+    """Return True if a Streamlit server is running in this process."""
+    try:
+        _get_server().get_current()
+    except RuntimeError:
+        return False
+    return True
+
+
+def get_session(session_id: str) -> Optional[Any]:
+    """Return the server session object from its id, or None if it does not exist."""
+    return _get_server().get_current().get_session_by_id(session_id)
+
+
+def _get_server() -> Any:
+    global Server
+    if Server is None:
+        from streamlit.server.server import Server
+    return Server
+
+
+def is_session_alive(session: Any) -> bool:
+    """Return False if the session has been shut down (e.g. the tab was closed).
+
+    A session object is kept by the server until it is closed. After that, any rerun
+    request is discarded.
+    """
+    state = getattr(session, "_state", None)
+    return getattr(state, "value", None) != "SHUTDOWN_REQUESTED"
+
+
 def is_trigger_value(key: str, internal_session_state: SessionState) -> bool:
     """Return True if widget is a of type "trigger_value" (e.g. a button).
 
@@ -127,6 +188,11 @@ def is_trigger_value(key: str, internal_session_state: SessionState) -> bool:
     return False
 
 
+def is_widget_id(key: str) -> bool:
+    """Return True if key is a widget id generated by Streamlit."""
+    return key.startswith(GENERATED_WIDGET_KEY_PREFIX)
+
+
 def is_form_submitter_value(key: str) -> bool:
     """Check if the widget key refers to a submit button from a form.
 
@@ -141,11 +207,107 @@ def set_internal_values(mapping: Mapping[str, Any]) -> None:
     """Set values to the streamlit internal session state."""
     internal_state = get_session_state()
     for key, value in mapping.items():
-        internal_state[widget_id_to_user_key(key)] = value
+        # Not `internal_state[key] = value`: widgets already rendered in this run
+        # cannot be modified. The session is rerun to render them in that case.
+        internal_state._new_session_state[widget_id_to_user_key(key)] = value
+
+
+class LazyValue:
+    """Placeholder of a value in the session state, loaded when first read."""
 
+    __slots__ = ("load",)
 
-def del_internal_values(keys: Iterable[str]) -> None:
+    def __init__(self, load: Callable[[], Any]) -> None:
+        self.load = load
+
+    def __deepcopy__(self, memo: Any) -> "LazyValue":
+        # Loader is immutable: no need to copy it
+        return self
+
+
+class _LazySessionState(SessionState):
+    """Session state in which values can be `LazyValue` placeholders.
+
+    Placeholders are loaded and replaced by their value when read (by the script or
+    when a widget is registered) but are kept as is when the state is compacted at the
+    end of a script run.
+    """
+
+    __slots__ = ()
+
+    def _getitem(self, widget_id: Optional[str], user_key: Optional[str]) -> Any:
+        value = SessionState._getitem(self, widget_id, user_key)
+        if isinstance(value, LazyValue):
+            placeholder, value = value, value.load()
+            for state, key in (
+                (self._new_session_state, user_key),
+                (self._old_state, widget_id),
+                (self._old_state, user_key),
+            ):
+                if key is not None and state.get(key) is placeholder:
+                    state[key] = value
+        return value
+
+    def compact_state(self) -> None:
+        wid_key_map = self.reverse_key_wid_map
+        for key_or_wid in self:
+            self._old_state[key_or_wid] = get_raw_value(self, key_or_wid, wid_key_map)
+        self._new_session_state.clear()
+        self._new_widget_state.clear()
+
+
+def set_lazy_internal_values(loaders: Mapping[str, Callable[[], Any]]) -> None:
+    """Set placeholders to the streamlit internal session state.
+
+    Each value is loaded only if read by the script or by a widget.
+    """
+    internal_state = get_session_state()
+    if type(internal_state) is SessionState:
+        internal_state.__class__ = _LazySessionState
+    for key, load in loaders.items():
+        internal_state[widget_id_to_user_key(key)] = LazyValue(load)
+
+
+def get_raw_value(
+    internal_state: SessionState,
+    key: str,
+    wid_key_map: Optional[Mapping[str, str]] = None,
+) -> Any:
+    """Get a value from the session state, without loading it if it is lazy."""
+    widget_id = internal_state._get_widget_id(key)
+    if wid_key_map is None:
+        wid_key_map = internal_state.reverse_key_wid_map
+    if widget_id in wid_key_map and widget_id == key:
+        key = wid_key_map[widget_id]
+    return SessionState._getitem(internal_state, widget_id, key)
+
+
+def iter_raw_items(internal_state: SessionState) -> Iterator[Tuple[str, Any]]:
+    """Same as `st.session_state.items()`, without loading lazy values."""
+    wid_key_map = internal_state.reverse_key_wid_map
+    for key in internal_state.keys():
+        if is_widget_id(key):
+            if not _is_keyed_widget_id(key) or key not in wid_key_map:
+                continue
+            user_key = wid_key_map[key]
+        elif key.startswith(STREAMLIT_INTERNAL_KEY_PREFIX):
+            continue
+        else:
+            user_key = key
+
+        try:
+            yield user_key, get_raw_value(internal_state, key, wid_key_map)
+        except KeyError:
+            # Widget value without deserializer (e.g. server restarted)
+            continue
+
+
+def del_internal_values(keys: Iterable[str], missing_ok: bool = False) -> None:
     """Delete values from the streamlit internal session state."""
     internal_state = get_session_state()
     for key in keys:
-        del internal_state[widget_id_to_user_key(key)]
+        try:
+            del internal_state[widget_id_to_user_key(key)]
+        except KeyError:
+            if not missing_ok:
+                raise
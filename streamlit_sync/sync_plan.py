@@ -0,0 +1,73 @@
+"""Memoized classification of session state keys.
+
+On each sync, every key of the session state must be classified: is it synced and, if
+so, under which user key ? Classification relies on several string checks and on
+widget metadata. Since a widget id always refers to the same widget, the result is
+memoized per room and only new keys have to be classified.
+"""
+from typing import Dict, Optional, Tuple
+
+from . import st_hack
+from .utils import is_synced
+
+# The plan is reset if it grows too much (e.g. widgets with dynamic labels)
+MAX_PLAN_SIZE = 10_000
+
+# Marker for keys that are not synced
+_SKIP = None
+
+
+class _SyncPlan:
+    def __init__(self) -> None:
+        self._plan: Dict[str, Optional[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._plan)
+
+    def get_synced_key(
+        self, key: str, internal_session_state: st_hack.SessionState
+    ) -> Optional[str]:
+        """Return the user key under which a value is synced, or None if not synced.
+
+        Thread-safe: classification is deterministic so concurrent sessions can only
+        write the same result.
+        """
+        try:
+            return self._plan[key]
+        except KeyError:
+            pass
+
+        synced_key, is_definitive = _classify(key, internal_session_state)
+        if is_definitive:
+            if len(self._plan) >= MAX_PLAN_SIZE:
+                self._plan = {}
+            self._plan[key] = synced_key
+        return synced_key
+
+
+def _classify(
+    key: str, internal_session_state: st_hack.SessionState
+) -> Tuple[Optional[str], bool]:
+    """Classify a key. Return the synced user key (or None) and whether the result is
+    definitive.
+
+    A widget id that is not yet registered in the widget metadata cannot be classified
+    definitively: it might be a trigger value.
+    """
+    if st_hack.is_form_submitter_value(key):
+        # Form widgets must not be synced
+        return _SKIP, True
+
+    if not is_synced(key):
+        # Some keys are not synced
+        return _SKIP, True
+
+    if key in internal_session_state._new_widget_state.widget_metadata:
+        if st_hack.is_trigger_value(key, internal_session_state):
+            # Trigger values correspond to buttons
+            # -> we don't want to propagate the effect of the button
+            #    to avoid performing twice the action
+            return _SKIP, True
+        return st_hack.widget_id_to_user_key(key), True
+
+    return st_hack.widget_id_to_user_key(key), not st_hack.is_widget_id(key)
@@ -1,41 +1,456 @@
+import copy
+import logging
+import time
+from collections import OrderedDict
 from datetime import datetime
+from functools import partial
 from itertools import chain
 from pathlib import Path
-from threading import Lock
-from typing import Any, Dict, Set
+from threading import Event, Lock, Thread
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    FrozenSet,
+    Hashable,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+)
 
 import streamlit as st
-from diskcache import Cache, Index
 
 from . import st_hack
+from .backends import LocalBackend, RoomBackend
+from .blobs import BLOBS_DIRNAME, _estimate_size
+from .broadcast import _BroadcastScheduler, fan_out
+from .catalog import _RoomCatalog, get_catalog, get_dir_size, save_catalogs
+from .conflicts import ConflictResolver, last_writer_wins
 from .exceptions import StreamlitSyncException
-from .utils import LAST_SYNCED_KEY, is_synced
+from .fingerprints import fingerprint, values_equal
+from .journal import JournalPolicy, has_journal
+from .memo import _MemoCache
+from .metrics import _InstrumentedLock, get_room_metrics
+from .metrics import is_enabled as is_metrics_enabled
+from .persistence import WriteBehindPolicy
+from .serializers import SerializationPolicy
+from .sync_plan import _SyncPlan
+from .utils import LAST_SYNCED_KEY, SYNCED_ROOM_KEY, SYNCED_VALUES_KEY
+
+logger = logging.getLogger(__name__)
+
+# Factory used to create the backend of new rooms
+_backend_factory: Callable[[str], RoomBackend] = lambda room_name: LocalBackend()
+
+# Rooms accessed less than MIN_IDLE_TIME seconds ago are never evicted
+MIN_IDLE_TIME = 1.0
+
+# Placeholder for values synced lazily: only loaded if the session reads them
+_NOT_LOADED = object()
+
+# Time (in seconds) between 2 checks for disconnected sessions
+SESSION_REAP_INTERVAL = 5.0
+
+
+def set_default_backend(factory: Callable[[str], RoomBackend]) -> None:
+    """Set the factory creating the backend of new rooms, from their name.
+
+    Rooms that already exist are not affected.
+    """
+    global _backend_factory
+    _backend_factory = factory
+
+
+class EvictionPolicy(NamedTuple):
+    """Configure when rooms without active sessions are unloaded from memory.
+
+    Rooms persisted on disk are reloaded on demand. Values of in-memory rooms are lost.
+
+    Args:
+        idle_ttl: Time (in seconds) after which a room without active sessions is
+            evicted. Defaults to None (no limit).
+        max_rooms: Max number of rooms kept in memory. Least recently used rooms
+            without active sessions are evicted first. Defaults to None (no limit).
+        max_bytes: Max estimated memory used by the rooms values. Least recently used
+            rooms without active sessions are evicted first. Defaults to None (no
+            limit).
+        interval: Time (in seconds) between 2 checks. Defaults to 60s.
+    """
+
+    idle_ttl: Optional[float] = None
+    max_rooms: Optional[int] = None
+    max_bytes: Optional[int] = None
+    interval: float = 60.0
+
+
+class Subscription(NamedTuple):
+    """Keys of a room a session depends on.
+
+    A session is only rerun by other sessions when one of these keys is updated.
+    Values of other keys are still synced, without rerun.
+
+    Args:
+        keys: Keys the session depends on.
+        namespaces: Key prefixes the session depends on. For example, namespace
+            `"sales."` matches keys `"sales.year"` and `"sales.region"`.
+    """
+
+    keys: FrozenSet[str] = frozenset()
+    namespaces: Tuple[str, ...] = ()
+
+    def matches(self, key: str) -> bool:
+        """Return True if the session depends on this key."""
+        return key in self.keys or key.startswith(self.namespaces)
+
+
+class _RoomSettings(NamedTuple):
+    """Settings of a room (see `configure_room`), kept when the room is unloaded."""
+
+    broadcast_window: float = 0.0
+    max_broadcast_rate: Optional[float] = None
+    conflict_resolver: ConflictResolver = last_writer_wins
+
+
+class _Tombstone(NamedTuple):
+    """Room that has been unloaded, to resume from when it is loaded again.
+
+    Args:
+        version: Last version of the room.
+        reset_keys: Keys to reset in sessions, if the room has been deleted.
+        settings: Settings of the room.
+    """
+
+    version: int
+    reset_keys: Set[str]
+    settings: _RoomSettings
+
+
+class _RoomRegistry:
+    """Keep track of the rooms loaded in memory."""
+
+    def __init__(self) -> None:
+        self._lock = Lock()
+        # Loaded rooms, from the least to the most recently used
+        self._rooms: "OrderedDict[str, _SyncedState]" = OrderedDict()
+        self.room_names: Set[str] = set()
+
+        # Rooms that have been unloaded (evicted or deleted)
+        self._tombstones: Dict[str, _Tombstone] = {}
+
+        self.eviction_policy: Optional[EvictionPolicy] = None
+        self._janitor: Optional[Thread] = None
+        self._janitor_wake_up = Event()
+
+    def __contains__(self, room_name: str) -> bool:
+        return room_name in self._rooms
+
+    def get(self, room_name: str) -> "_SyncedState":
+        """Return a room, loading it if necessary."""
+        with self._lock:
+            room = self._rooms.get(room_name)
+            if room is None:
+                room = _SyncedState(room_name, backend=_backend_factory(room_name))
+                tombstone = self._tombstones.pop(room_name, None)
+                if tombstone is not None:
+                    room.resume_from(tombstone.version, tombstone.reset_keys)
+                    room.apply_settings(tombstone.settings)
+                self._rooms[room_name] = room
+            else:
+                self._rooms.move_to_end(room_name)
+            room.last_accessed = time.monotonic()
+            return room
+
+    def nb_active_sessions(self, room_name: str) -> int:
+        """Return number of active sessions of a room, without loading it."""
+        room = self._rooms.get(room_name)
+        return 0 if room is None else room.nb_active_sessions
+
+    def delete(self, room_name: str) -> None:
+        """Delete a room and its values, including persisted ones."""
+        room = self.get(room_name)
+        with self._lock:
+            self._rooms.pop(room_name, None)
+            self.room_names.discard(room_name)
+            self._tombstones[room_name] = _Tombstone(
+                room.version, set(room.state.keys()), room.settings
+            )
+        room.delete()
+
+    def evict(self) -> List[str]:
+        """Unload rooms according to the eviction policy. Return evicted room names."""
+        policy = self.eviction_policy
+        if policy is None:
+            return []
+
+        sizes: Dict[str, int] = {}
+        if policy.max_bytes is not None:
+            # Walking the values of all rooms is slow: done outside of the lock, which
+            # is taken by every sync of every room
+            with self._lock:
+                rooms = list(self._rooms.values())
+            sizes = {room.room_name: room.estimated_size() for room in rooms}
+
+        now = time.monotonic()
+        with self._lock:
+            # Least recently used first. Rooms are checked again: sessions might
+            # have entered them while sizes were estimated.
+            candidates = [
+                room
+                for room in self._rooms.values()
+                if room.nb_active_sessions == 0
+                and now - room.last_accessed >= MIN_IDLE_TIME
+            ]
+
+            to_evict = []
+            if policy.idle_ttl is not None:
+                to_evict = [
+                    room
+                    for room in candidates
+                    if now - room.last_accessed >= policy.idle_ttl
+                ]
+                candidates = [room for room in candidates if room not in to_evict]
+
+            if policy.max_rooms is not None:
+                nb_excess = len(self._rooms) - len(to_evict) - policy.max_rooms
+                while nb_excess > 0 and candidates:
+                    to_evict.append(candidates.pop(0))
+                    nb_excess -= 1
+
+            if policy.max_bytes is not None:
+                # Rooms loaded while sizes were estimated are not counted
+                total_size = sum(
+                    sizes.get(room.room_name, 0)
+                    for room in self._rooms.values()
+                    if room not in to_evict
+                )
+                while total_size > policy.max_bytes and candidates:
+                    room = candidates.pop(0)
+                    to_evict.append(room)
+                    total_size -= sizes.get(room.room_name, 0)
+
+            for room in to_evict:
+                del self._rooms[room.room_name]
+                self.room_names.discard(room.room_name)
+                self._tombstones[room.room_name] = _Tombstone(
+                    room.version, set(), room.settings
+                )
+
+        # Flushing values to disk might take some time: done outside of the lock
+        for room in to_evict:
+            room.close()
+        return [room.room_name for room in to_evict]
+
+    def warm_up(
+        self,
+        cache_dir: Path,
+        max_rooms: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+    ) -> List[str]:
+        """Load the most recently updated rooms persisted in a directory.
+
+        Rooms are taken from the catalog of the directory, skipping rooms that would
+        exceed `max_bytes`. Size of a room is its size on disk, as recorded in the
+        catalog: memory used once loaded depends on the storage engine. Rooms already
+        loaded are left as is. Return the names of the rooms warmed up.
+
+        Rooms are attached with the options they have been persisted with (see
+        `_SyncedState.reattach_to_disk`).
+        """
+        rooms = sorted(
+            get_catalog(cache_dir).list_rooms(),
+            key=lambda room: room.last_updated or 0.0,
+            reverse=True,
+        )
+        warmed_up: List[str] = []
+        total_size = 0
+        for info in rooms:
+            if max_rooms is not None and len(warmed_up) >= max_rooms:
+                break
+            if max_bytes is not None and total_size + info.size_on_disk > max_bytes:
+                continue
+            if info.name in self:
+                continue
+            try:
+                room = self.get(info.name)
+                room.reattach_to_disk(cache_dir)
+                room.warm_up()
+            except Exception:
+                logger.exception("Failed to warm up room %s.", info.name)
+                continue
+            # Not evicted before sessions had a chance to enter it
+            room.last_accessed = time.monotonic()
+            warmed_up.append(info.name)
+            total_size += info.size_on_disk
+        return warmed_up
+
+    def reap_sessions(self) -> int:
+        """Remove disconnected sessions from all rooms. Return number of sessions."""
+        if not st_hack.is_server_running():
+            return 0
+        with self._lock:
+            rooms = list(self._rooms.values())
+        return sum(room.reap_sessions() for room in rooms)
+
+    def set_eviction_policy(self, policy: Optional[EvictionPolicy]) -> None:
+        """Set eviction policy, checked by the janitor thread."""
+        self.eviction_policy = policy
+        self._janitor_wake_up.set()  # Take new interval into account
+
+    def start_janitor(self) -> None:
+        """Start background thread reaping sessions and evicting rooms."""
+        if self._janitor is None:
+            self._janitor = Thread(
+                target=self._run_janitor, name="streamlit_sync_janitor", daemon=True
+            )
+            self._janitor.start()
+
+    def _run_janitor(self) -> None:
+        last_eviction = time.monotonic()
+        while True:
+            policy = self.eviction_policy
+            interval = SESSION_REAP_INTERVAL
+            if policy is not None:
+                interval = min(interval, policy.interval)
+            self._janitor_wake_up.wait(interval)
+            self._janitor_wake_up.clear()
+
+            # Janitor must never stop
+            try:
+                self.reap_sessions()
+                save_catalogs()
+                policy = self.eviction_policy
+                if (
+                    policy is not None
+                    and time.monotonic() - last_eviction >= policy.interval
+                ):
+                    last_eviction = time.monotonic()
+                    self.evict()
+            except Exception:
+                logger.exception("Failed to clean up rooms.")
 
 
 @st.experimental_singleton
+def get_room_registry() -> _RoomRegistry:
+    """Singleton containing all rooms loaded in memory.
+
+    Catalogs of rooms persisted on disk are saved by the janitor thread as well.
+    """
+    registry = _RoomRegistry()
+    registry.start_janitor()
+    return registry
+
+
 def get_existing_room_names() -> Set[str]:
-    """Singleton containing all existing room names."""
-    return set()
+    """Return names of the rooms loaded in memory."""
+    return get_room_registry().room_names
 
 
-@st.experimental_singleton
 def get_synced_state(room_name: str) -> "_SyncedState":
     """Return the room synced state.
 
     Each room is a singleton, synced by all connected sessions."""
-    return _SyncedState(room_name=room_name)
+    return get_room_registry().get(room_name)
+
+
+def _encode_attach_options(
+    write_behind: Optional[WriteBehindPolicy],
+    blob_threshold: Optional[int],
+    lazy_load: bool,
+    journal: Optional[JournalPolicy],
+    serialization: Optional[SerializationPolicy],
+) -> Dict[str, Any]:
+    """Return options of `_SyncedState.attach_to_disk` as JSON, for the catalog."""
+    return {
+        "write_behind": None if write_behind is None else write_behind._asdict(),
+        "blob_threshold": blob_threshold,
+        "lazy_load": lazy_load,
+        "journal": None if journal is None else journal._asdict(),
+        "serialization": (
+            None
+            if serialization is None
+            else dict(
+                serialization._asdict(), serializers=list(serialization.serializers)
+            )
+        ),
+    }
+
+
+def _decode_attach_options(options: Dict[str, Any]) -> Dict[str, Any]:
+    """Return options of `_SyncedState.attach_to_disk` saved in the catalog."""
+    write_behind = options.get("write_behind")
+    journal = options.get("journal")
+    serialization = options.get("serialization")
+    return {
+        "write_behind": None
+        if write_behind is None
+        else WriteBehindPolicy(**write_behind),
+        "blob_threshold": options.get("blob_threshold"),
+        "lazy_load": options.get("lazy_load", False),
+        "journal": None if journal is None else JournalPolicy(**journal),
+        "serialization": (
+            None
+            if serialization is None
+            else SerializationPolicy(
+                **dict(serialization, serializers=tuple(serialization["serializers"]))
+            )
+        ),
+    }
+
+
+def _guess_attach_options(room_cache_dir: Path) -> Dict[str, Any]:
+    """Return options of `_SyncedState.attach_to_disk` from the files of a room."""
+    if has_journal(room_cache_dir):
+        return {"journal": JournalPolicy()}
+    if (room_cache_dir / BLOBS_DIRNAME).exists():
+        # Blobs are read whatever the threshold: only used to save values
+        return {"blob_threshold": 0}
+    return {}
 
 
 class _SyncedState:
-    def __init__(self, room_name: str) -> None:
+    def __init__(self, room_name: str, backend: Optional[RoomBackend] = None) -> None:
         self.room_name: str = room_name
-        self._lock: Lock = Lock()
-        self.use_cache = False
+        self.metrics = get_room_metrics(room_name)
+        self._lock = _InstrumentedLock(self.metrics)
+        self._backend: RoomBackend = backend if backend is not None else LocalBackend()
+        self._backend.set_metrics(self.metrics)
+        self._broadcaster = _BroadcastScheduler(self._trigger_sessions)
+        self._sync_plan = _SyncPlan()
+        self.last_accessed: float = time.monotonic()
+        # Catalog of the cache dir, if attached to disk
+        self._catalog: Optional[_RoomCatalog] = None
+        # Options the room has been attached to disk with (see `_encode_attach_options`)
+        self._attach_options: Optional[Dict[str, Any]] = None
+        self.lazy_load = False
+        self.conflict_resolver: ConflictResolver = last_writer_wins
+
+        # Values of a deleted room that must be reset in sessions that synced with it
+        self._reset_version: Optional[int] = None
+        self._reset_keys: Set[str] = set()
+
+        # Sessions are triggered when room is updated by another process
+        self._backend.set_change_callback(self._broadcaster.schedule)
 
         with self._lock:
             self.last_updated: datetime = datetime.fromtimestamp(0)
+            # Fingerprint of each value, with the key version it was computed for
+            self._fingerprints: Dict[str, Tuple[int, Optional[bytes]]] = {}
             self._registered_sessions: Set[str] = set()
-            self.state: Dict[str, Any] = {}
+            # Read-only sessions, among the registered ones
+            self._viewers: Set[str] = set()
+            # Last room version seen by each session
+            self._session_versions: Dict[str, int] = {}
+            # Server session objects, resolved once per session
+            self._session_handles: Dict[str, Any] = {}
+            # Keys each session depends on. Sessions without subscription depend on
+            # all keys.
+            self._subscriptions: Dict[str, Subscription] = {}
+            # Results of memoized functions, by function
+            self._memo_caches: Dict[str, _MemoCache] = {}
 
     def __repr__(self) -> str:
         rep = (
@@ -48,132 +463,773 @@ class _SyncedState:
         rep += ">"
         return rep
 
+    @property
+    def version(self) -> int:
+        """Room version, incremented on each commit."""
+        return self._backend.version
+
+    @property
+    def state(self) -> Any:
+        """Values of the room (mapping-like)."""
+        return getattr(self._backend, "state", self._backend)
+
+    @property
+    def use_cache(self) -> bool:
+        return getattr(self._backend, "use_cache", False)
+
+    @property
+    def room_cache_dir(self) -> Optional[Path]:
+        return getattr(self._backend, "room_cache_dir", None)
+
     @property
     def nb_active_sessions(self) -> int:
-        """Return estimated number of action sessions.
+        """Return number of active sessions.
 
-        Might not be exact if a session has disconnected since last rerun.
+        Disconnected sessions are removed in the background every few seconds.
         """
         return len(self._registered_sessions)
 
-    def attach_to_disk(self, cache_dir: Path) -> None:
-        """Attach a room to disk for caching."""
+    def attach_to_disk(
+        self,
+        cache_dir: Path,
+        write_behind: Optional[WriteBehindPolicy] = None,
+        blob_threshold: Optional[int] = None,
+        lazy_load: bool = False,
+        journal: Optional[JournalPolicy] = None,
+        serialization: Optional[SerializationPolicy] = None,
+    ) -> None:
+        """Attach a room to disk for caching.
+
+        If a write-behind policy is provided, values are kept in memory and flushed to
+        disk in the background. Otherwise each commit is written to disk directly.
+
+        If a blob threshold is provided, arrays and DataFrames larger than it (in
+        bytes) are stored as memory-mappable blobs shared by all sessions.
+
+        If lazy load is enabled, values are read from disk only when a session uses
+        them. Has no effect in write-behind mode as values are already in memory.
+
+        If a journal policy is provided, values are kept in memory and each commit is
+        appended to a journal instead (see `journal.py`). Cannot be combined with
+        write-behind nor blobs.
+
+        If a serialization policy is provided, values are serialized by type instead of
+        being pickled (see `serializers.py`).
+
+        A room already attached to disk cannot be attached again with another cache dir
+        or other options.
+        """
+        if not isinstance(self._backend, LocalBackend):
+            raise StreamlitSyncException(
+                f"Cannot attach room {self.room_name} to disk: backend"
+                f" {type(self._backend).__name__} does not support it."
+            )
+
         room_cache_dir = cache_dir / self.room_name
+        attach_options = _encode_attach_options(
+            write_behind=write_behind,
+            blob_threshold=blob_threshold,
+            lazy_load=lazy_load,
+            journal=journal,
+            serialization=serialization,
+        )
         if self.use_cache:
-            assert self.room_cache_dir is not None
             if self.room_cache_dir != room_cache_dir:
                 raise StreamlitSyncException(
                     f"Cannot attach room {self.room_name}"
                     f" to cache dir {room_cache_dir}:"
                     f" already attached to {self.room_cache_dir}"
                 )
+            if self._attach_options != attach_options:
+                raise StreamlitSyncException(
+                    f"Cannot attach room {self.room_name} to disk with options"
+                    f" {attach_options}: already attached with {self._attach_options}"
+                )
+        else:
+            self._backend.attach_to_disk(
+                room_cache_dir,
+                write_behind=write_behind,
+                blob_threshold=blob_threshold,
+                journal=journal,
+                serialization=serialization,
+            )
+            self.lazy_load = lazy_load
+            self._attach_options = attach_options
+            self._catalog = get_catalog(cache_dir)
+            self._catalog.update(
+                self.room_name,
+                size_on_disk=get_dir_size(room_cache_dir),
+                attach_options=attach_options,
+            )
+
+    def reattach_to_disk(self, cache_dir: Path) -> None:
+        """Attach a room to disk with the options it has been persisted with.
+
+        Options are read from the catalog of the cache dir. For rooms persisted before
+        options were recorded, the storage engine is guessed from the room files. No-op
+        if the room is already attached to this cache dir.
+        """
+        if self.use_cache and self.room_cache_dir == cache_dir / self.room_name:
+            return
+        info = get_catalog(cache_dir).get(self.room_name)
+        if info is not None and info.attach_options is not None:
+            options = _decode_attach_options(info.attach_options)
         else:
-            self.use_cache = True
-            self.room_cache_dir: Path = room_cache_dir
-            self._cache = Cache(self.room_cache_dir)
-            self.state = Index.fromcache(self._cache)
+            options = _guess_attach_options(cache_dir / self.room_name)
+        self.attach_to_disk(cache_dir, **options)
+
+    def estimated_size(self) -> int:
+        """Return estimated memory used by the room values, in bytes."""
+        return self._backend.estimated_size()
+
+    def warm_up(self) -> None:
+        """Read all values once and cache their fingerprints.
+
+        Values persisted with the default engine are kept in memory until the first
+        session reads them (see `LocalBackend.preload`). That session then neither
+        loads values from disk nor reads them again to compare them to its own.
+        """
+        preloaded = self._backend.preload()
+        with self._backend.lock():
+            keys = list(self._backend.keys())
+        key_version: Optional[int]
+        for key in keys:
+            if key in preloaded:
+                key_version, value = preloaded[key]
+            else:
+                # Version is read before value, as in `_is_unchanged`
+                key_version = self._backend.key_version(key)
+                value = self._backend.get(key)
+            if key_version is None:
+                continue
+            value_fingerprint = fingerprint(value)
+            if value_fingerprint is not None:
+                self._fingerprints.setdefault(key, (key_version, value_fingerprint))
+
+    def resume_from(self, version: int, reset_keys: Set[str]) -> None:
+        """Continue from a previous instance of the room that has been unloaded.
+
+        If the previous room has been deleted, `reset_keys` contains its keys. They are
+        removed from the sessions that synced with it.
+        """
+        if len(reset_keys) > 0:
+            self._reset_version = version
+            self._reset_keys = reset_keys
+            version += 1  # All sessions are outdated
+        self._backend.resume_from(version)
+
+    def close(self) -> None:
+        """Unload the room from memory. Persisted values are kept."""
+        self._broadcaster.cancel()
+        self._backend.close()
+        if self._catalog is not None:
+            assert self.room_cache_dir is not None
+            self._catalog.update(
+                self.room_name, size_on_disk=get_dir_size(self.room_cache_dir)
+            )
 
     def delete(self) -> None:
-        """Reset the room values and discard it from existing room.
+        """Delete the room values, including persisted ones, and rerun its sessions.
 
-        TODO: remove room from existing room names
-        TODO: remove SyncedState from streamlit singleton
-        TODO: implement delete when cache is used.
+        Room must not be used afterwards. Use `_RoomRegistry.delete` instead.
         """
-        raise NotImplementedError()
+        self._broadcaster.cancel()
+        with self._lock:
+            sessions = [
+                session
+                for session in map(self._get_session_handle, self._registered_sessions)
+                if session is not None
+            ]
+            self._registered_sessions.clear()
+            self._viewers.clear()
+            self._session_versions.clear()
+            self._session_handles.clear()
+            self._subscriptions.clear()
+        self._backend.delete()
+        if self._catalog is not None:
+            self._catalog.remove(self.room_name)
+
+        # Sessions will reset the deleted values
+        fan_out(sessions)
+
+    def register_session(self, read_only: bool = False) -> None:
+        """Register a new session to the room.
+
+        Lock is not acquired if session is already registered with the same role.
+
+        Args:
+            read_only: True if the session only receives values (viewer).
+        """
+        if st.session_state.get(SYNCED_ROOM_KEY) != self.room_name:
+            st.session_state[SYNCED_ROOM_KEY] = self.room_name
+        session_id = st_hack.get_session_id()
+        if (
+            session_id in self._registered_sessions
+            and (session_id in self._viewers) == read_only
+        ):
+            return
 
-    def register_session(self) -> None:
-        """Register a new session to the room."""
         with self._lock:
-            self._registered_sessions.add(st_hack.get_session_id())
+            self._registered_sessions.add(session_id)
+            if read_only:
+                self._viewers.add(session_id)
+            else:
+                self._viewers.discard(session_id)
             get_existing_room_names().add(self.room_name)
 
+    def reap_sessions(self) -> int:
+        """Remove disconnected sessions from the room. Return number of sessions."""
+        with self._lock:
+            dead_sessions = [
+                session_id
+                for session_id in self._registered_sessions
+                if self._get_session_handle(session_id) is None
+            ]
+            for session_id in dead_sessions:
+                self._forget_session(session_id)
+        return len(dead_sessions)
+
+    def subscribe(self, subscription: Optional[Subscription]) -> None:
+        """Set the keys the current session depends on. None for all keys.
+
+        Lock is not acquired if subscription is unchanged.
+        """
+        if subscription is not None:
+            subscription = Subscription(
+                frozenset(subscription.keys), tuple(subscription.namespaces)
+            )
+        session_id = st_hack.get_session_id()
+        if self._subscriptions.get(session_id) == subscription:
+            return
+
+        with self._lock:
+            if subscription is None:
+                self._subscriptions.pop(session_id, None)
+            else:
+                self._subscriptions[session_id] = subscription
+
+    def _depends_on(self, session_id: str, keys: Iterable[str]) -> bool:
+        """Return True if a session depends on at least one of the keys."""
+        subscription = self._subscriptions.get(session_id)
+        if subscription is None:
+            return True
+        return any(subscription.matches(key) for key in keys)
+
     def unregister_session(self) -> None:
         """Unregister a session from the room."""
+        session_id = st_hack.get_session_id()
         with self._lock:
-            self._registered_sessions.discard(st_hack.get_session_id())
+            self._forget_session(session_id)
 
-    def sync(self) -> None:
+    def sync(self, before_script: bool = False, read_only: bool = False) -> None:
         """Synchronize all session state values and widget with other sessions.
 
         Logic:
-        1.   If the synced state has been updated since last time, update current
-             session values and rerun the session.
-
-        2.   Else, check for all values from streamlit (both widgets and session state)
-              a. If at least 1 value has been updated, update the synced state and rerun
-                 all sessions.
+        1.   Check for all values from streamlit (both widgets and session state)
+              a. If at least 1 value has been updated, commit it to the synced state
+                 and rerun all other sessions.
               b. Else, do nothing.
+
+        2.   If the synced state has been updated since last time, update current
+             session values. If the script has already rendered widgets, rerun the
+             session so that they are updated.
+
+        Concurrency is optimistic: the scan for new values is done without holding the
+        backend lock. The lock is only taken to commit new values (1.a.) or to read
+        missed values (2.). If the room has been updated since the session last synced,
+        updates of the session are merged with the room instead of being discarded: only
+        keys updated by both the session and the room are resolved, using the conflict
+        resolver of the room.
+
+        Args:
+            before_script: True if called before the script renders anything. Missed
+                values are then applied in place, without a second script run, unless
+                a widget rendered before the call displays one of them.
+            read_only: True if the session only receives values (viewer). Values of
+                the session are never checked nor committed: an up-to-date viewer
+                returns immediately, without taking any lock.
         """
+        synced_version = st.session_state.get(LAST_SYNCED_KEY)
+        if read_only:
+            if synced_version != self.version:
+                self._catch_up(synced_version, rerun=not before_script)
+            return
+
+        self.metrics.inc("syncs")
+        rerun = not before_script
+        if not isinstance(synced_version, int):
+            # New session: get all values first
+            self._catch_up(synced_version, rerun=rerun)
+            synced_version = st.session_state[LAST_SYNCED_KEY]
+
+        # Check if new data from streamlit frontend
+        start = time.perf_counter()
+        updated_values, fingerprints = self._get_updated_values()
+        self.metrics.observe("scan_seconds", time.perf_counter() - start)
+
+        # Current SessionState has newer values than _SyncedState
+        # -> update _SyncedState values
+        # -> trigger rerun for all connected sessions
+        while True:
+            base_version = self.version
+            if base_version == synced_version:
+                values = updated_values
+            else:
+                values = self._merge(updated_values, synced_version)
+            if len(values) == 0:
+                break
+
+            start = time.perf_counter()
+            version = self._backend.commit(base_version, values)
+            self.metrics.observe("commit_seconds", time.perf_counter() - start)
+            if version is None:
+                # Another session committed during the merge: merge again
+                self.metrics.inc("conflicts")
+                continue
+
+            self._record_commit(values)
+            self.last_updated = datetime.now()
+            if self._catalog is not None:
+                self._catalog.update(self.room_name, last_updated=time.time())
+            for key, value in values.items():
+                if value is updated_values.get(key):
+                    self._fingerprints[key] = (version, fingerprints[key])
+            self._get_synced_values().update(values)
+            if base_version != synced_version:
+                # Other sessions are triggered once missed values are read
+                self.metrics.inc("merged_commits")
+                committed_keys = frozenset(
+                    key
+                    for key, value in values.items()
+                    if value is updated_values.get(key)
+                )
+                self._catch_up(
+                    synced_version,
+                    rerun=rerun,
+                    broadcast=True,
+                    committed_keys=committed_keys,
+                )
+                return
+
+            with self._lock:
+                self._session_versions[st_hack.get_session_id()] = version
+            st.session_state[LAST_SYNCED_KEY] = version
+            self._broadcaster.schedule()
+            return
+
+        if self.version != synced_version:
+            # Means current SessionState is not synced with SyncedState
+            self._catch_up(synced_version, rerun=rerun)
+
+    def _merge(
+        self, updated_values: Dict[str, Any], synced_version: int
+    ) -> Dict[str, Any]:
+        """Merge values updated by the session with the room updates since last sync.
+
+        Keys updated only by the session are kept. Keys updated only by the room are
+        skipped: the session holds an outdated value that will be replaced on catch-up.
+        Keys updated by both (or created by both) are resolved by the conflict resolver.
+        Lazily loaded values are considered not updated by the session.
+
+        Return the values to commit.
+        """
+        synced_values = self._get_synced_values()
+        merged: Dict[str, Any] = {}
+        for key, value in updated_values.items():
+            key_version = self._backend.key_version(key)
+            if key_version is None or key_version <= synced_version:
+                merged[key] = value
+                continue
+
+            if key in synced_values:
+                synced_value = synced_values[key]
+                if synced_value is _NOT_LOADED or values_equal(value, synced_value):
+                    # Value not updated by the session
+                    continue
+
+            self.metrics.inc("key_conflicts")
+            room_value = self._backend.get(key)
+            resolved_value = self.conflict_resolver(key, value, room_value)
+            if resolved_value is not room_value:
+                merged[key] = resolved_value
+        return merged
+
+    def _get_synced_values(self) -> Dict[str, Any]:
+        """Return the values of the room as last synced by the current session.
+
+        Used to tell apart values updated by the session from outdated ones.
+        """
+        synced_values = st.session_state.get(SYNCED_VALUES_KEY)
+        if synced_values is None:
+            synced_values = st.session_state[SYNCED_VALUES_KEY] = {}
+        return synced_values
+
+    def _record_commit(self, values: Dict[str, Any]) -> None:
+        self.metrics.inc("commits")
+        self.metrics.inc("keys_changed", len(values))
+        if self.use_cache and is_metrics_enabled():
+            self.metrics.inc(
+                "disk_bytes_written", sum(_estimate_size(v) for v in values.values())
+            )
+
+    def _catch_up(
+        self,
+        synced_version: Optional[int],
+        rerun: bool = True,
+        broadcast: bool = False,
+        committed_keys: FrozenSet[str] = frozenset(),
+    ) -> None:
+        """Update streamlit internal state with missed values.
+
+        If `rerun`, the session is reloaded to render the missed values, unless it does
+        not depend on any of them (see `subscribe`). Otherwise, the script has not
+        rendered the missed values yet and the session is only reloaded if a widget
+        already rendered in this run displays one of them, apart from the
+        `committed_keys` the session has just committed itself. If `broadcast`,
+        other sessions are triggered once the version of the current session is updated,
+        so that it is not rerun twice.
+        """
+        self.metrics.inc("catch_ups")
+        if self.lazy_load and not self._backend.is_in_memory:
+            # Values are read from disk only if the session uses them
+            missed_keys, version = self._backend.keys_since(synced_version)
+            missed_values: Dict[str, Any] = {}
+        else:
+            missed_values, version = self._backend.read_since(synced_version)
+            missed_keys = list(missed_values)
         with self._lock:
-            internal_session_state = st_hack.get_session_state()
-
-            if st.session_state.get(LAST_SYNCED_KEY) != self.last_updated:
-                # Means current SessionState is not synced with SyncedState
-                # -> update streamlit internal state and reload
-                st_hack.set_internal_values(self.state)
-                st.session_state[LAST_SYNCED_KEY] = self.last_updated
-                st.experimental_rerun()
-                st.stop()
+            self._session_versions[st_hack.get_session_id()] = version
+        if broadcast:
+            self._broadcaster.schedule()
+
+        synced_values = self._get_synced_values()
+        is_reset = (
+            self._reset_version is not None
+            and isinstance(synced_version, int)
+            and synced_version <= self._reset_version
+        )
+        if is_reset:
+            # Session synced with a deleted instance of the room
+            reset_keys = [key for key in self._reset_keys if key not in missed_keys]
+            st_hack.del_internal_values(reset_keys, missing_ok=True)
+            for key in reset_keys:
+                synced_values.pop(key, None)
+        if len(missed_values) < len(missed_keys):
+            st_hack.set_lazy_internal_values(
+                {
+                    key: partial(self._load_lazy_value, synced_values, key)
+                    for key in missed_keys
+                }
+            )
+            synced_values.update(dict.fromkeys(missed_keys, _NOT_LOADED))
+        else:
+            st_hack.set_internal_values(missed_values)
+            synced_values.update(missed_values)
+        st.session_state[LAST_SYNCED_KEY] = version
+        if not rerun:
+            # Not-synced widgets (e.g. rendered before `sync`) do not need a rerun
+            rendered_keys = st_hack.get_rendered_widget_keys() - committed_keys
+            rerun = not rendered_keys.isdisjoint(missed_keys) or (
+                is_reset and not rendered_keys.isdisjoint(self._reset_keys)
+            )
+        if rerun and (
+            is_reset or self._depends_on(st_hack.get_session_id(), missed_keys)
+        ):
+            self.metrics.inc("catch_up_reruns")
+            st.experimental_rerun()
+            st.stop()
+
+    def _load_lazy_value(self, synced_values: Dict[str, Any], key: str) -> Any:
+        """Read a value synced lazily, when first used by the session.
+
+        Value is recorded as synced so that it is not read again to be compared.
+        """
+        value = self._backend.get(key)
+        if synced_values.get(key) is _NOT_LOADED:
+            synced_values[key] = value
+        return value
+
+    def _get_updated_values(
+        self,
+    ) -> Tuple[Dict[str, Any], Dict[str, Optional[bytes]]]:
+        """Return values from current session that differ from the synced state.
+
+        Fingerprints of the updated values are returned as well to be reused on commit.
+
+        Called without holding the room lock.
+        """
+        internal_session_state = st_hack.get_session_state()
+        synced_values = self._get_synced_values()
+
+        # Values to check, deduplicated by synced key. Effective values from
+        # st.session_state come last and take precedence.
+        values_to_check: Dict[str, Any] = {}
+        for key, value in chain(
+            internal_session_state._new_session_state.items(),
+            internal_session_state._new_widget_state.items(),
+            st_hack.iter_raw_items(internal_session_state),
+        ):
+            synced_key = self._sync_plan.get_synced_key(key, internal_session_state)
+            if synced_key is not None:
+                values_to_check[synced_key] = value
+
+        self.metrics.inc("keys_scanned", len(values_to_check))
+        updated_values: Dict[str, Any] = {}
+        fingerprints: Dict[str, Optional[bytes]] = {}
+        for key, value in values_to_check.items():
+            if isinstance(value, st_hack.LazyValue):
+                # Not loaded => not modified by the session
+                continue
+            is_unchanged, value_fingerprint = self._is_unchanged(
+                key, value, synced_values
+            )
+            if not is_unchanged:
+                updated_values[key] = value
+                fingerprints[key] = value_fingerprint
+        return updated_values, fingerprints
+
+    def _is_unchanged(
+        self,
+        key: str,
+        value: Any,
+        synced_values: Dict[str, Any],
+    ) -> Tuple[bool, Optional[bytes]]:
+        """Check if a value is the same as in the synced state.
+
+        Checks are made from the cheapest to the most expensive:
+        1. Identity with the value the session last synced, or with the value in
+           memory. Cost of a rerun does not depend on the size of the values it did
+           not change. Like in memory, values mutated in place are not detected. A
+           value the session last synced is not an update of the session, even if the
+           key has been updated by another session since: the session is outdated
+           and will catch up.
+        2. Type-aware fingerprint (arrays, DataFrames, bytes, containers,...). The
+           fingerprint of the synced value is cached until the key is updated.
+        3. Equality.
+
+        Return the fingerprint of the value, if computed.
+
+        Called without holding the room lock.
+        """
+        key_version = self._backend.key_version(key)
+        if key_version is None:
+            # New key
+            return False, fingerprint(value)
+
+        if value is synced_values.get(key):
+            return True, None
+        if self._backend.is_in_memory and value is self._backend.get(key):
+            return True, None
+
+        value_fingerprint = fingerprint(value)
+        if value_fingerprint is not None:
+            cached = self._fingerprints.get(key)
+            if cached is not None and cached[0] == key_version:
+                synced_fingerprint = cached[1]
             else:
+                # Version is read before value: if value has been updated in the
+                # meantime, cached fingerprint will be considered outdated.
+                synced_fingerprint = fingerprint(self._backend.get(key))
+                self._fingerprints[key] = (key_version, synced_fingerprint)
 
-                internal_session_state._new_widget_state.widget_metadata
+            if synced_fingerprint is not None:
+                return value_fingerprint == synced_fingerprint, value_fingerprint
 
-                # Check if new data from streamlit frontend
-                updated_values = {}
-                for key, value in chain(
-                    internal_session_state._new_session_state.items(),
-                    internal_session_state._new_widget_state.items(),
-                    st.session_state.items(),
-                ):
-                    if st_hack.is_form_submitter_value(key):
-                        # Form widgets must not be synced
-                        continue
+        return values_equal(value, self._backend.get(key)), value_fingerprint
 
-                    if st_hack.is_trigger_value(key, internal_session_state):
-                        # Trigger values correspond to buttons
-                        # -> we don't want to propagate the effect of the button
-                        #    to avoid performing twice the action
-                        continue
+    def memoize(
+        self,
+        function_id: str,
+        arguments: Hashable,
+        compute: Callable[[], Any],
+        keys: Optional[Tuple[str, ...]] = None,
+        max_entries: int = 32,
+        max_versions: int = 2,
+        copy_results: bool = True,
+    ) -> Any:
+        """Return the result of a call, shared by the sessions of the room.
 
-                    if not is_synced(key):
-                        # Some keys are not synced
-                        continue
+        Result is cached for the version of the room the current session has synced
+        with, or for the versions of `keys` if provided. It is recomputed without being
+        cached when the session is outdated (on one of the keys). If `copy_results`,
+        each call returns a deep copy of the cached result.
+        """
+        synced_version = st.session_state.get(LAST_SYNCED_KEY)
+        if not isinstance(synced_version, int):
+            # Session has not synced yet
+            self.metrics.inc("memo_misses")
+            return compute()
 
-                    key = st_hack.widget_id_to_user_key(key)
+        versions: Hashable = synced_version
+        if keys is None:
+            is_outdated = synced_version != self.version
+        else:
+            key_versions = tuple(self._backend.key_version(key) for key in keys)
+            is_outdated = any(
+                version is not None and version > synced_version
+                for version in key_versions
+            )
+            versions = key_versions
+        if is_outdated:
+            # Session holds outdated values: result cannot be shared
+            self.metrics.inc("memo_misses")
+            return compute()
+
+        cache = self._memo_caches.get(function_id)
+        if cache is None:
+            with self._lock:
+                cache = self._memo_caches.setdefault(
+                    function_id, _MemoCache(max_entries, max_versions)
+                )
+        result, hit = cache.get_or_compute(arguments, versions, compute)
+        self.metrics.inc("memo_hits" if hit else "memo_misses")
+        if copy_results:
+            # Sessions mutating their result must not affect the other sessions
+            return copy.deepcopy(result)
+        return result
 
-                    if value != self.state.get(key):
-                        updated_values[key] = value
+    def history(
+        self, since_version: Optional[int] = None
+    ) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """Replay updates kept in the journal of the room. See `_Journal.history`."""
+        if not isinstance(self._backend, LocalBackend):
+            raise StreamlitSyncException(
+                f"Backend {type(self._backend).__name__} does not keep history."
+            )
+        return self._backend.history(since_version)
 
-                # Current SessionState has newer values than _SyncedState
-                # -> update _SyncedState values
-                # -> trigger rerun for all connected sessions
-                if len(updated_values) > 0:
-                    self.state.update(updated_values)
-                    self.last_updated = datetime.now()
-                    self._trigger_sessions()
-                    st.session_state[LAST_SYNCED_KEY] = self.last_updated
+    def read_values(self) -> Tuple[Dict[str, Any], int]:
+        """Return all values of the room, consistent with the returned version."""
+        return self._backend.read_since(None)
+
+    def iter_values(self) -> Tuple[Iterator[Tuple[str, Any]], int]:
+        """Return an iterator over the values of the room, and the room version.
+
+        Keys and version are read under the lock but values are read one by one,
+        without holding it: commits are not blocked while a large room is iterated.
+        Values committed in the meantime can be newer than the returned version.
+        """
+        with self._backend.lock():
+            keys = list(self._backend.keys())
+            version = self._backend.version
+        return ((key, self._backend.get(key)) for key in keys), version
+
+    def update_values(self, values: Dict[str, Any]) -> None:
+        """Commit values from outside of a session (e.g. on import) and broadcast."""
+        if len(values) == 0:
+            return
+        while self._backend.commit(self.version, values) is None:
+            pass  # Room updated in the meantime: retry on top of latest version
+        self.last_updated = datetime.now()
+        if self._catalog is not None:
+            self._catalog.update(self.room_name, last_updated=time.time())
+        self._broadcaster.schedule()
+
+    def configure_broadcast(
+        self, window: float = 0.0, max_rate: Optional[float] = None
+    ) -> None:
+        """Configure how updates are coalesced before triggering other sessions.
+
+        See `_BroadcastScheduler.configure`.
+        """
+        self._broadcaster.configure(window=window, max_rate=max_rate)
+
+    def configure_conflicts(self, resolver: ConflictResolver) -> None:
+        """Set how keys updated concurrently by a session and the room are resolved."""
+        self.conflict_resolver = resolver
+
+    @property
+    def settings(self) -> _RoomSettings:
+        """Return the settings of the room, to apply them when it is reloaded."""
+        return _RoomSettings(
+            broadcast_window=self._broadcaster.window,
+            max_broadcast_rate=self._broadcaster.max_rate,
+            conflict_resolver=self.conflict_resolver,
+        )
+
+    def apply_settings(self, settings: _RoomSettings) -> None:
+        """Configure the room with the settings of a previous instance."""
+        self.configure_broadcast(
+            window=settings.broadcast_window, max_rate=settings.max_broadcast_rate
+        )
+        self.configure_conflicts(settings.conflict_resolver)
 
     def _trigger_sessions(self) -> None:
-        """Trigger rerun on all active sessions except the session that triggered it.
+        """Trigger rerun on all active sessions that are not up to date.
+
+        Sessions that have already seen the latest version (e.g. the session that
+        committed it) are not rerun. Sessions that do not depend on any of the keys
+        updated since their version are not rerun either (see `subscribe`). Viewers
+        are triggered after the other sessions.
 
         If a session is not active anymore, it is removed from the room. Most probably
         the user closed the tab.
         """
-        current_session_id = st_hack.get_session_id()
-        inactive_sessions = set()
-        for session_id in self._registered_sessions:
-            if session_id != current_session_id:
-                # We need to trigger rerun in other sessions.
-                # => We can't use st.experimental_rerun()
-                session = st_hack.Server.get_current().get_session_by_id(session_id)
+        with self._lock:
+            sessions_to_trigger = []
+            viewers_to_trigger = []
+            nb_not_subscribed = 0
+            # Keys updated since a version, computed once per version
+            updated_keys: Dict[int, List[str]] = {}
+            for session_id in list(self._registered_sessions):
+                session_version = self._session_versions.get(session_id)
+                if session_version == self.version:
+                    continue
+                if session_id in self._subscriptions and session_version is not None:
+                    if session_version not in updated_keys:
+                        updated_keys[session_version] = self._backend.keys_since(
+                            session_version
+                        )[0]
+                    if not self._depends_on(session_id, updated_keys[session_version]):
+                        nb_not_subscribed += 1
+                        continue
+
+                session = self._get_session_handle(session_id)
                 if session is None:
                     # It is most likely that this session stopped
-                    inactive_sessions.add(session_id)
+                    self._forget_session(session_id)
                     continue
-                st_hack.Server.get_current().get_session_by_id(
-                    session_id
-                ).request_rerun(None)
+                if session_id in self._viewers:
+                    viewers_to_trigger.append(session)
+                else:
+                    sessions_to_trigger.append(session)
+            # Sessions that can edit the room are notified first
+            sessions_to_trigger += viewers_to_trigger
+
+        # We need to trigger rerun in other sessions.
+        # => We can't use st.experimental_rerun()
+        # Requests are sent outside of the lock, by a pool of workers.
+        self.metrics.inc("waves")
+        self.metrics.inc("sessions_triggered", len(sessions_to_trigger))
+        self.metrics.inc("sessions_not_subscribed", nb_not_subscribed)
+        self.metrics.observe("fan_out_size", len(sessions_to_trigger))
+        fan_out(
+            sessions_to_trigger,
+            on_sent=partial(self.metrics.observe, "fan_out_seconds"),
+        )
+
+    def _get_session_handle(self, session_id: str) -> Optional[Any]:
+        """Return the server session object, or None if it is not alive anymore.
+
+        Handles are cached. Must be called while holding the room lock.
+        """
+        session = self._session_handles.get(session_id)
+        if session is None:
+            session = st_hack.get_session(session_id)
+            if session is None:
+                return None
+            self._session_handles[session_id] = session
+        if not st_hack.is_session_alive(session):
+            return None
+        return session
+
+    def _forget_session(self, session_id: str) -> None:
+        """Remove any reference to a session.
 
-        for session_id in inactive_sessions:
-            self._registered_sessions.discard(session_id)
+        Must be called while holding the room lock.
+        """
+        self._registered_sessions.discard(session_id)
+        self._viewers.discard(session_id)
+        self._session_versions.pop(session_id, None)
+        self._session_handles.pop(session_id, None)
+        self._subscriptions.pop(session_id, None)
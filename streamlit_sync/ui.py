@@ -4,22 +4,27 @@ The select_room widget is just a simple example of how to use the ./rooms.py API
 """
 
 from pathlib import Path
-from typing import Optional, Set, Union
+from typing import List, Optional, Union
 
 import streamlit as st
 
+from .catalog import get_catalog
 from .rooms import enter_room, exit_room
-from .synced_state import get_existing_room_names, get_synced_state
-from .utils import ROOM_NAME_KEY, get_not_synced_key
+from .synced_state import get_room_registry
+from .utils import READ_ONLY_KEY, ROOM_NAME_KEY, get_not_synced_key
+
+# Above this number of rooms, a search field is displayed
+MAX_LISTED_ROOMS = 20
 
 
 def select_room_widget(cache_dir: Optional[Union[str, Path]]) -> str:
     if st.session_state.get(ROOM_NAME_KEY) is not None:
         # Is already in a room
         room_name = st.session_state[ROOM_NAME_KEY]
-        with st.sidebar.expander(
-            f'Synced room "{room_name}" ({_get_room_status(room_name)})'
-        ):
+        status = _get_room_status(room_name)
+        if st.session_state.get(READ_ONLY_KEY, False):
+            status += ", read-only"
+        with st.sidebar.expander(f'Synced room "{room_name}" ({status})'):
             if st.button("Exit room"):
                 exit_room()
         return room_name
@@ -28,10 +33,10 @@ def select_room_widget(cache_dir: Optional[Union[str, Path]]) -> str:
         st.sidebar.title("Select a synced room")
 
         room_name = None
-        existing_rooms = get_existing_room_names() | _list_from_cache_dir(cache_dir)
-        options = [None]  # None for "create new room"
+        existing_rooms = _list_existing_rooms(cache_dir)
+        options: List[Optional[str]] = [None]  # None for "create new room"
         if existing_rooms:
-            options += sorted(existing_rooms)
+            options += existing_rooms
 
             room_name = st.sidebar.radio(
                 "Existing rooms",
@@ -66,7 +71,7 @@ def _radio_format_func(room_name: Optional[str]) -> Optional[str]:
 
 
 def _get_room_status(room_name: str) -> str:
-    nb_sessions = get_synced_state(room_name).nb_active_sessions
+    nb_sessions = get_room_registry().nb_active_sessions(room_name)
     if nb_sessions == 0:
         return "empty"
     elif nb_sessions == 1:
@@ -75,13 +80,27 @@ def _get_room_status(room_name: str) -> str:
         return f"{nb_sessions} active sessions"
 
 
-def _list_from_cache_dir(cache_dir: Optional[Union[str, Path]]) -> Set[str]:
-    """List existing rooms saved in cache dir."""
-    if cache_dir is None:
-        return set()
-
-    cache_dir = Path(cache_dir)
-    if not cache_dir.exists():
-        return set()
-
-    return {path.name for path in cache_dir.iterdir() if path.is_dir()}
+def _list_existing_rooms(cache_dir: Optional[Union[str, Path]]) -> List[str]:
+    """List rooms loaded in memory or saved in cache dir.
+
+    Rooms saved in cache dir are listed from its catalog, without scanning it. If
+    there are too many rooms, only the ones matching a search field are listed.
+    """
+    room_names = set(get_room_registry().room_names)
+    if cache_dir is not None:
+        catalog = get_catalog(cache_dir)
+        room_names.update(room.name for room in catalog.list_rooms())
+
+    if len(room_names) <= MAX_LISTED_ROOMS:
+        return sorted(room_names)
+
+    search = st.sidebar.text_input(
+        f"Search among {len(room_names)} rooms",
+        key=get_not_synced_key("search_rooms"),
+    ).lower()
+    matching_rooms = sorted(name for name in room_names if search in name.lower())
+    if len(matching_rooms) > MAX_LISTED_ROOMS:
+        st.sidebar.caption(
+            f"{len(matching_rooms) - MAX_LISTED_ROOMS} more rooms: refine your search."
+        )
+    return matching_rooms[:MAX_LISTED_ROOMS]
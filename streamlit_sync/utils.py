@@ -20,3 +20,6 @@ NOT_SYNCED_PREFIX = "$NOT_SYNCED$"
 # Private keys used by streamlit-sync
 LAST_SYNCED_KEY = get_not_synced_key("$LAST_SYNCED$")
 ROOM_NAME_KEY = get_not_synced_key("$ROOM_NAME$")
+SYNCED_VALUES_KEY = get_not_synced_key("$SYNCED_VALUES$")
+READ_ONLY_KEY = get_not_synced_key("$READ_ONLY$")
+SYNCED_ROOM_KEY = get_not_synced_key("$SYNCED_ROOM$")
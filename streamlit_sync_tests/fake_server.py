@@ -0,0 +1,130 @@
+"""Fake Streamlit server to run scripts of several sessions without a browser.
+
+Sessions are simulated in the current process: each script run is executed in the
+calling thread, with a minimal script run context. Rerun requests sent by the rooms
+are recorded but not executed: callers decide when to rerun a session.
+"""
+import itertools
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set
+
+from streamlit.state.session_state import SessionState
+
+from streamlit_sync import st_hack
+
+try:
+    from streamlit.scriptrunner import RerunException, StopException, add_script_run_ctx
+except ImportError:
+    try:
+        # streamlit < 1.7
+        from streamlit.script_run_context import add_script_run_ctx  # type: ignore
+        from streamlit.script_runner import (  # type: ignore
+            RerunException,
+            StopException,
+        )
+    except ImportError:
+        # streamlit < 1.4
+        from streamlit.report_thread import (  # type: ignore
+            add_report_ctx as add_script_run_ctx,
+        )
+        from streamlit.script_runner import (  # type: ignore
+            RerunException,
+            StopException,
+        )
+
+OK = "ok"
+RERUN = "rerun"
+STOP = "stop"
+
+
+class FakeScriptRunContext:
+    """Attributes of `ScriptRunContext` used by Streamlit and streamlit-sync."""
+
+    def __init__(self, session: "FakeSession") -> None:
+        self.session_id = session.id
+        self.session_state = session.session_state
+        self.query_string = ""
+        self.widget_ids_this_run: Set[str] = set()
+        self.form_ids_this_run: Set[str] = set()
+        self.uploaded_file_mgr = None
+        self.cursors: Dict[int, Any] = {}
+        self.dg_stack: List[Any] = []
+
+    def enqueue(self, msg: Any) -> None:
+        pass
+
+
+class _FakeState:
+    def __init__(self, value: str) -> None:
+        self.value = value
+
+
+class FakeSession:
+    """Stand-in of a server session (one browser tab)."""
+
+    def __init__(self, session_id: str) -> None:
+        self.id = session_id
+        self.session_state = SessionState()
+        self.nb_rerun_requests = 0
+        self.rerun_requested = threading.Event()
+        self._state = _FakeState("RUNNING")
+
+    def request_rerun(self, client_state: Any) -> None:
+        self.nb_rerun_requests += 1
+        self.rerun_requested.set()
+
+    def shutdown(self) -> None:
+        """Simulate the user closing the tab."""
+        self._state = _FakeState("SHUTDOWN_REQUESTED")
+
+
+class FakeServer:
+    """Stand-in of the Streamlit server, holding the simulated sessions."""
+
+    def __init__(self) -> None:
+        self.sessions: Dict[str, FakeSession] = {}
+        self._ids = itertools.count()
+
+    def get_current(self) -> "FakeServer":
+        return self
+
+    def get_session_by_id(self, session_id: str) -> Optional[FakeSession]:
+        return self.sessions.get(session_id)
+
+    def new_session(self) -> FakeSession:
+        session = FakeSession(f"session_{next(self._ids)}")
+        self.sessions[session.id] = session
+        return session
+
+    @contextmanager
+    def installed(self) -> Iterator["FakeServer"]:
+        """Replace the Streamlit server by this one in streamlit-sync."""
+        previous_server = st_hack.Server
+        st_hack.Server = self
+        try:
+            yield self
+        finally:
+            st_hack.Server = previous_server
+
+    def run(self, session: FakeSession, script: Callable[[], None]) -> str:
+        """Run a script in a session. Return "ok", "rerun" or "stop"."""
+        thread = threading.current_thread()
+        add_script_run_ctx(thread, FakeScriptRunContext(session))  # type: ignore
+        session.rerun_requested.clear()
+        try:
+            script()
+            return OK
+        except RerunException:
+            return RERUN
+        except StopException:
+            return STOP
+
+    def run_until_done(
+        self, session: FakeSession, script: Callable[[], None], max_runs: int = 10
+    ) -> int:
+        """Run a script until it does not request a rerun. Return number of runs."""
+        for nb_runs in range(1, max_runs + 1):
+            if self.run(session, script) != RERUN:
+                return nb_runs
+        raise RuntimeError(f"Session {session.id} still reruns after {max_runs} runs.")
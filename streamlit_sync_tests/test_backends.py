@@ -0,0 +1,172 @@
+import time
+from pathlib import Path
+from unittest.mock import MagicMock
+
+from streamlit_sync.backends import LocalBackend, SQLiteBackend
+from streamlit_sync.persistence import WriteBehindPolicy
+
+
+def test_local_backend() -> None:
+    """Test commit and read missed values."""
+    backend = LocalBackend()
+    assert backend.version == 0
+
+    assert backend.commit(0, {"a": 1, "b": 2}) == 1
+    assert backend.commit(1, {"a": 3}) == 2
+    assert backend.key_version("a") == 2
+    assert backend.key_version("b") == 1
+    assert backend.key_version("c") is None
+
+    # Only missed values are returned
+    assert backend.read_since(1) == ({"a": 3}, 2)
+    assert backend.read_since(2) == ({}, 2)
+    assert backend.read_since(None) == ({"a": 3, "b": 2}, 2)
+
+
+def test_local_backend_outdated_commit() -> None:
+    """Test commit is refused if room has been updated since base version."""
+    backend = LocalBackend()
+    backend.commit(0, {"a": 1})
+
+    assert backend.commit(0, {"a": 2}) is None
+    assert backend.get("a") == 1
+
+
+def test_sqlite_backend_persistence(tmp_path: Path) -> None:
+    """Test room is reloaded from database."""
+    backend = SQLiteBackend(tmp_path / "room.sqlite3")
+    backend.commit(0, {"a": 1, "b": [1, 2]})
+    backend.commit(1, {"a": 2})
+    backend.close()
+
+    backend = SQLiteBackend(tmp_path / "room.sqlite3")
+    assert backend.version == 2
+    assert backend.read_since(None) == ({"a": 2, "b": [1, 2]}, 2)
+    assert backend.read_since(1) == ({"a": 2}, 2)
+    backend.close()
+
+
+def test_sqlite_backend_shared(tmp_path: Path) -> None:
+    """Test room is shared between 2 backends (e.g. in 2 processes)."""
+    # Backend 1 does not watch for changes (or very rarely)
+    backend_1 = SQLiteBackend(tmp_path / "room.sqlite3", poll_interval=60)
+    backend_2 = SQLiteBackend(tmp_path / "room.sqlite3", poll_interval=0.01)
+    callback = MagicMock()
+    backend_2.set_change_callback(callback)
+
+    assert backend_1.commit(0, {"a": 1}) == 1
+
+    # Backend 2 is notified
+    deadline = time.monotonic() + 2
+    while not callback.called and time.monotonic() < deadline:
+        time.sleep(0.01)
+    callback.assert_called_once()
+    assert backend_2.version == 1
+    assert backend_2.get("a") == 1
+
+    # Backend 1 is not up to date when backend 2 commits
+    assert backend_2.commit(1, {"a": 2}) == 2
+    assert backend_1.version == 1
+    assert backend_1.commit(1, {"a": 3}) is None  # refused...
+    assert backend_1.version == 2  # ... and refreshed
+    assert backend_1.get("a") == 2
+
+    backend_1.close()
+    backend_2.close()
+
+
+def test_sqlite_backend_outdated_commit_notifies(tmp_path: Path) -> None:
+    """Test changes loaded by a refused commit are notified."""
+    backend_1 = SQLiteBackend(tmp_path / "room.sqlite3", poll_interval=60)
+    backend_2 = SQLiteBackend(tmp_path / "room.sqlite3", poll_interval=60)
+    callback = MagicMock()
+    backend_1.set_change_callback(callback)
+
+    assert backend_2.commit(0, {"a": 1}) == 1
+    assert backend_1.commit(0, {"a": 2}) is None
+    callback.assert_called_once()
+    assert backend_1.get("a") == 1
+
+    # Nothing new
+    assert backend_1.commit(0, {"a": 2}) is None
+    callback.assert_called_once()
+
+    backend_1.close()
+    backend_2.close()
+
+
+def test_local_backend_resume_from() -> None:
+    """Test versions are not reused when a room is reloaded."""
+    backend = LocalBackend()
+    backend.resume_from(5)
+    assert backend.version == 5
+    assert backend.commit(5, {"a": 1}) == 6
+
+    backend.resume_from(2)  # never goes backward
+    assert backend.version == 6
+
+
+def test_local_backend_estimated_size() -> None:
+    """Test memory used by values is estimated."""
+    backend = LocalBackend()
+    assert backend.estimated_size() == 0
+
+    backend.commit(0, {"a": b"x" * 1000})
+    assert backend.estimated_size() >= 1000
+
+
+def test_local_backend_delete(tmp_path: Path) -> None:
+    """Test persisted values are deleted."""
+    backend = LocalBackend()
+    backend.attach_to_disk(tmp_path / "room")
+    backend.commit(backend.version, {"a": 1})
+    assert (tmp_path / "room").exists()
+
+    backend.delete()
+    assert not (tmp_path / "room").exists()
+    assert backend.read_since(None)[0] == {}
+
+
+def test_sqlite_backend_delete(tmp_path: Path) -> None:
+    """Test database is deleted."""
+    backend = SQLiteBackend(tmp_path / "room.sqlite3")
+    backend.commit(0, {"a": 1})
+
+    backend.delete()
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_local_backend_close_flushes_write_behind(tmp_path: Path) -> None:
+    """Test dirty values are flushed when a room is unloaded, not only on shutdown."""
+    policy = WriteBehindPolicy(flush_interval=60, flush_on_shutdown=False)
+    backend = LocalBackend()
+    backend.attach_to_disk(tmp_path / "room", write_behind=policy)
+    backend.commit(backend.version, {"a": 1})
+    backend.close()
+
+    backend = LocalBackend()
+    backend.attach_to_disk(tmp_path / "room", write_behind=policy)
+    assert backend.get("a") == 1
+    backend.close()
+
+
+def test_local_backend_preload(tmp_path: Path) -> None:
+    """Test preloaded values are handed over to the first reader, unless outdated."""
+    backend = LocalBackend()
+    backend.attach_to_disk(tmp_path / "room")
+    backend.commit(backend.version, {"a": [1], "b": [2]})
+    backend.close()
+
+    backend = LocalBackend()
+    backend.attach_to_disk(tmp_path / "room")
+    preloaded = backend.preload()
+    assert preloaded == {"a": (1, [1]), "b": (1, [2])}
+    assert backend.estimated_size() > 0
+
+    backend.commit(backend.version, {"b": [3]})
+    values, _ = backend.read_since(None)
+    assert values["a"] is preloaded["a"][1]  # Not read from disk again
+    assert values["b"] == [3]
+    assert backend.estimated_size() == 0  # Dropped once read
+    assert backend.get("a") is not preloaded["a"][1]
+    backend.close()
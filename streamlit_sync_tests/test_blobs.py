@@ -0,0 +1,108 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from diskcache import Index
+
+from streamlit_sync.backends import LocalBackend
+from streamlit_sync.blobs import BLOBS_DIRNAME, _BlobIndex, _BlobRef, _BlobStore
+
+
+def _blob_index(tmp_path: Path, threshold: int = 100) -> _BlobIndex:
+    return _BlobIndex(
+        Index(str(tmp_path / "room")), _BlobStore(tmp_path / "blobs", threshold)
+    )
+
+
+def test_small_values_are_not_blobs(tmp_path: Path) -> None:
+    """Test values under the threshold are stored in the index."""
+    state = _blob_index(tmp_path)
+    state["a"] = np.arange(3)
+    state["b"] = "not an array"
+
+    assert not isinstance(state.index["a"], _BlobRef)
+    assert state["b"] == "not an array"
+    assert list(state.blob_store.data_dir.iterdir()) == []
+
+
+def test_large_array_is_memory_mapped(tmp_path: Path) -> None:
+    """Test large arrays are stored once and loaded as read-only shared views."""
+    state = _blob_index(tmp_path)
+    array = np.arange(1000)
+    state.update({"a": array, "b": array.copy()})
+
+    assert isinstance(state.index["a"], _BlobRef)
+    assert len(list(state.blob_store.data_dir.iterdir())) == 1  # stored once
+
+    loaded = state["a"]
+    assert isinstance(loaded, np.memmap)
+    assert not loaded.flags.writeable
+    assert np.array_equal(loaded, array)
+    assert state["b"] is loaded  # shared
+
+
+def test_large_dataframe(tmp_path: Path) -> None:
+    """Test large DataFrames are stored as Arrow blobs."""
+    state = _blob_index(tmp_path)
+    df = pd.DataFrame({"a": np.arange(1000), "b": np.arange(1000) * 0.5})
+    state["df"] = df
+
+    assert state.index["df"].fmt == "arrow"
+    assert state["df"].equals(df)
+
+
+def test_unreferenced_blobs_are_deleted(tmp_path: Path) -> None:
+    """Test blob is deleted when no key references it anymore."""
+    state = _blob_index(tmp_path)
+    state["a"] = np.arange(1000)
+    state["b"] = np.arange(1000)
+    state["a"] = np.arange(2000)
+    assert len(list(state.blob_store.data_dir.iterdir())) == 2  # still used by "b"
+
+    state["b"] = "small value"
+    assert len(list(state.blob_store.data_dir.iterdir())) == 1
+
+    del state["a"]
+    assert list(state.blob_store.data_dir.iterdir()) == []
+
+
+def test_collect_garbage(tmp_path: Path) -> None:
+    """Test orphan blobs are collected."""
+    state = _blob_index(tmp_path)
+    state["a"] = np.arange(1000)
+    (state.blob_store.data_dir / "orphan.npy").touch()
+    (state.blob_store.data_dir / "crashed.tmp").touch()
+
+    state.blob_store.collect_garbage()
+    assert len(list(state.blob_store.data_dir.iterdir())) == 1
+    assert state["a"].shape == (1000,)
+
+
+def test_reference_counts_survive_reload(tmp_path: Path) -> None:
+    """Test blobs shared by several keys are tracked across reloads."""
+    state = _blob_index(tmp_path)
+    state.update({"a": np.arange(1000), "b": np.arange(1000)})
+
+    state = _blob_index(tmp_path)
+    state["a"] = "small value"
+    assert len(list(state.blob_store.data_dir.iterdir())) == 1  # still used by "b"
+
+    del state["b"]
+    assert list(state.blob_store.data_dir.iterdir()) == []
+
+
+def test_attach_to_disk_collects_garbage(tmp_path: Path) -> None:
+    """Test blobs orphaned by a crash are deleted when the room is attached."""
+    backend = LocalBackend()
+    backend.attach_to_disk(tmp_path / "room", blob_threshold=100)
+    backend.commit(backend.version, {"a": np.arange(1000)})
+    backend.close()
+
+    data_dir = tmp_path / "room" / BLOBS_DIRNAME / "data"
+    (data_dir / "orphan.npy").touch()
+
+    backend = LocalBackend()
+    backend.attach_to_disk(tmp_path / "room", blob_threshold=100)
+    assert len(list(data_dir.iterdir())) == 1
+    assert backend.state["a"].shape == (1000,)
+    backend.close()
@@ -0,0 +1,110 @@
+import time
+from unittest.mock import MagicMock
+
+import pytest
+
+from streamlit_sync.broadcast import _BroadcastScheduler, fan_out
+from streamlit_sync.exceptions import StreamlitSyncException
+
+
+def test_immediate_broadcast() -> None:
+    """Test waves are sent immediately by default."""
+    broadcast = MagicMock()
+    scheduler = _BroadcastScheduler(broadcast)
+    assert scheduler.is_immediate
+
+    scheduler.schedule()
+    scheduler.schedule()
+    assert broadcast.call_count == 2
+
+
+def test_coalesced_broadcast() -> None:
+    """Test changes scheduled within the window are sent in a single wave."""
+    broadcast = MagicMock()
+    scheduler = _BroadcastScheduler(broadcast)
+    scheduler.configure(window=0.05)
+
+    for _ in range(10):
+        scheduler.schedule()
+    assert scheduler.is_pending
+    assert broadcast.call_count == 0
+
+    time.sleep(0.2)
+    assert not scheduler.is_pending
+    assert broadcast.call_count == 1
+
+    # A new change after the wave is sent in a new wave
+    scheduler.schedule()
+    time.sleep(0.2)
+    assert broadcast.call_count == 2
+
+
+def test_max_rate_broadcast() -> None:
+    """Test waves are delayed to respect max rate."""
+    broadcast = MagicMock()
+    scheduler = _BroadcastScheduler(broadcast)
+    scheduler.configure(max_rate=5)  # at most 1 wave every 0.2s
+
+    scheduler.schedule()
+    time.sleep(0.05)
+    assert broadcast.call_count == 1
+
+    scheduler.schedule()
+    scheduler.schedule()
+    time.sleep(0.05)
+    assert broadcast.call_count == 1  # delayed
+
+    time.sleep(0.3)
+    assert broadcast.call_count == 2
+
+
+def test_cancel_broadcast() -> None:
+    """Test pending wave can be cancelled."""
+    broadcast = MagicMock()
+    scheduler = _BroadcastScheduler(broadcast)
+    scheduler.configure(window=0.05)
+
+    scheduler.schedule()
+    scheduler.cancel()
+    time.sleep(0.1)
+    assert broadcast.call_count == 0
+
+
+def test_configure_broadcast_invalid() -> None:
+    """Test invalid configuration."""
+    scheduler = _BroadcastScheduler(MagicMock())
+    with pytest.raises(StreamlitSyncException):
+        scheduler.configure(window=-1)
+    with pytest.raises(StreamlitSyncException):
+        scheduler.configure(max_rate=0)
+
+
+def test_fan_out() -> None:
+    """Test rerun is requested on all sessions."""
+    sessions = [MagicMock() for _ in range(50)]
+    fan_out(sessions)
+
+    deadline = time.monotonic() + 1
+    while time.monotonic() < deadline:
+        if all(session.request_rerun.called for session in sessions):
+            break
+        time.sleep(0.01)
+
+    for session in sessions:
+        session.request_rerun.assert_called_once_with(None)
+
+
+def test_fan_out_session_error(caplog: pytest.LogCaptureFixture) -> None:
+    """Test a session failing to rerun does not prevent the others from rerunning."""
+    sessions = [MagicMock() for _ in range(3)]
+    sessions[0].request_rerun.side_effect = RuntimeError("Session closed")
+    on_sent = MagicMock()
+    fan_out(sessions, on_sent=on_sent)
+
+    deadline = time.monotonic() + 1
+    while time.monotonic() < deadline and not on_sent.called:
+        time.sleep(0.01)
+
+    for session in sessions:
+        session.request_rerun.assert_called_once_with(None)
+    assert "Failed to request a rerun" in caplog.text
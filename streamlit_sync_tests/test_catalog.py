@@ -0,0 +1,59 @@
+from pathlib import Path
+
+from streamlit_sync.catalog import CATALOG_FILENAME, _RoomCatalog
+
+
+def test_catalog_built_from_cache_dir(tmp_path: Path) -> None:
+    """Test catalog is built by scanning the cache dir the first time."""
+    (tmp_path / "room_1").mkdir()
+    (tmp_path / "room_1" / "data").write_bytes(b"x" * 100)
+    (tmp_path / "room_2").mkdir()
+    (tmp_path / "not_a_room.txt").touch()
+
+    catalog = _RoomCatalog(tmp_path)
+    assert [room.name for room in catalog.list_rooms()] == ["room_1", "room_2"]
+    assert catalog.get("room_1").size_on_disk == 100  # type: ignore
+
+
+def test_catalog_saved_and_reloaded(tmp_path: Path) -> None:
+    """Test catalog is saved in the cache dir and reloaded without scanning it."""
+    catalog = _RoomCatalog(tmp_path)
+    catalog.update(
+        "room_1", last_updated=123.0, size_on_disk=42, attach_options={"journal": {}}
+    )
+    catalog.update("room_2")
+    catalog.update("room_2", last_updated=456.0)
+    catalog.save()
+    assert (tmp_path / CATALOG_FILENAME).exists()
+
+    catalog = _RoomCatalog(tmp_path)
+    assert catalog.list_rooms() == [
+        ("room_1", 123.0, 42, {"journal": {}}),
+        ("room_2", 456.0, 0, None),
+    ]
+
+    catalog.remove("room_1")
+    catalog.save()
+    assert "room_1" not in _RoomCatalog(tmp_path)
+
+
+def test_catalog_invalid_file(tmp_path: Path) -> None:
+    """Test catalog is rebuilt if file is corrupted."""
+    (tmp_path / "room").mkdir()
+    (tmp_path / CATALOG_FILENAME).write_text("not json")
+
+    catalog = _RoomCatalog(tmp_path)
+    assert "room" in catalog
+
+
+def test_catalog_search(tmp_path: Path) -> None:
+    """Test rooms can be searched by name."""
+    catalog = _RoomCatalog(tmp_path)
+    for room_name in ("Sales 2021", "sales 2022", "Marketing"):
+        catalog.update(room_name)
+
+    assert [room.name for room in catalog.list_rooms(search="SALES")] == [
+        "Sales 2021",
+        "sales 2022",
+    ]
+    assert len(catalog.list_rooms(limit=2)) == 2
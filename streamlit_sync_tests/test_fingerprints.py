@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+
+from streamlit_sync.fingerprints import fingerprint, values_equal
+
+
+def test_fingerprint_scalars() -> None:
+    """Test scalars are not fingerprinted."""
+    assert fingerprint(1) is None
+    assert fingerprint(1.5) is None
+    assert fingerprint(None) is None
+    assert fingerprint(True) is None
+
+
+def test_fingerprint_containers() -> None:
+    """Test fingerprint of builtin containers."""
+    assert fingerprint("abc") == fingerprint("abc")
+    assert fingerprint("abc") != fingerprint(b"abc")
+    assert fingerprint([1, "a", {"b": 2.0}]) == fingerprint([1, "a", {"b": 2.0}])
+    assert fingerprint([1, 2]) != fingerprint((1, 2))
+    assert fingerprint({1, "1"}) == fingerprint({"1", 1})
+
+    # Consecutive items cannot collide
+    assert fingerprint(["a", "strb"]) != fingerprint(["astr", "b"])
+
+    # Unsupported types
+    assert fingerprint(object()) is None
+    assert fingerprint([1, object()]) is None
+
+
+def test_fingerprint_numpy() -> None:
+    """Test fingerprint of NumPy arrays."""
+    array = np.arange(100)
+    assert fingerprint(array) == fingerprint(array.copy())
+    assert fingerprint(array) != fingerprint(array.astype(float))
+    assert fingerprint(array) != fingerprint(array.reshape(10, 10))
+    assert fingerprint(array.reshape(10, 10).T) == fingerprint(
+        np.ascontiguousarray(array.reshape(10, 10).T)
+    )
+    assert fingerprint(np.array([object()])) is None
+
+
+def test_fingerprint_pandas() -> None:
+    """Test fingerprint of Pandas DataFrame and Series."""
+    df = pd.DataFrame({"a": [1, 2], "b": ["x", "y"]})
+    assert fingerprint(df) == fingerprint(df.copy())
+    assert fingerprint(df) != fingerprint(df.assign(a=[1, 3]))
+    assert fingerprint(df) != fingerprint(df.rename(columns={"a": "c"}))
+    assert fingerprint(df["a"]) == fingerprint(df["a"].copy())
+
+
+def test_values_equal() -> None:
+    """Test equality is never ambiguous."""
+    assert values_equal(1, 1)
+    assert not values_equal(1, 2)
+    assert values_equal(float("nan"), float("nan"))
+
+    assert values_equal(np.arange(3), np.arange(3))
+    assert not values_equal(np.arange(3), np.arange(4))
+    assert not values_equal(np.arange(3), None)
+
+    df = pd.DataFrame({"a": [1, 2]})
+    assert values_equal(df, df.copy())
+    assert not values_equal(df, None)
+
+    # Ambiguous comparison
+    assert not values_equal([np.arange(3)], [np.arange(3)])
@@ -0,0 +1,30 @@
+import subprocess
+import sys
+
+import pytest
+
+import streamlit_sync
+from streamlit_sync import rooms, synced_state
+
+
+def test_import_is_lazy() -> None:
+    """Test rooms, backends and the Streamlit server are not loaded on import."""
+    script = (
+        "import sys, streamlit_sync;"
+        "print(' '.join(name for name in sys.modules"
+        " if name.startswith(('diskcache', 'streamlit.server.server',"
+        " 'streamlit_sync.synced_state'))))"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", script], check=True, capture_output=True, text=True
+    ).stdout
+    assert output.strip() == ""
+
+
+def test_lazy_attributes() -> None:
+    """Test public API is available from the package."""
+    assert streamlit_sync.enter_room is rooms.enter_room
+    assert streamlit_sync.Subscription is synced_state.Subscription
+    assert "select_room_widget" in dir(streamlit_sync)
+    with pytest.raises(AttributeError):
+        streamlit_sync.not_an_attribute
@@ -0,0 +1,126 @@
+import time
+from pathlib import Path
+from typing import Optional
+
+import pytest
+from diskcache import Index
+
+from streamlit_sync.backends import LocalBackend
+from streamlit_sync.exceptions import StreamlitSyncException
+from streamlit_sync.journal import SNAPSHOT_FILENAME, JournalPolicy
+from streamlit_sync.persistence import WriteBehindPolicy
+
+
+def _attach(room_dir: Path, policy: Optional[JournalPolicy] = None) -> LocalBackend:
+    backend = LocalBackend()
+    backend.attach_to_disk(room_dir, journal=policy or JournalPolicy())
+    return backend
+
+
+def _segments(room_dir: Path) -> list:
+    return sorted(room_dir.glob("journal-*.log"))
+
+
+def test_journal_recovery(tmp_path: Path) -> None:
+    """Test room is recovered by replaying the journal."""
+    backend = _attach(tmp_path / "room")
+    assert backend.is_in_memory
+    version = backend.commit(backend.version, {"a": 1, "b": [1, 2]})
+    version = backend.commit(version, {"a": 2})
+    assert version is not None
+    backend.close()
+
+    backend = _attach(tmp_path / "room")
+    assert backend.read_since(None)[0] == {"a": 2, "b": [1, 2]}
+    assert backend.version > version  # Versions keep increasing
+    backend.close()
+
+
+def test_journal_truncated_record(tmp_path: Path) -> None:
+    """Test a record half-written by a crash is ignored."""
+    backend = _attach(tmp_path / "room")
+    version = backend.commit(backend.version, {"a": 1})
+    backend.commit(version, {"a": 2})
+    backend.close()
+
+    segment = _segments(tmp_path / "room")[-1]
+    segment.write_bytes(segment.read_bytes()[:-3])
+
+    backend = _attach(tmp_path / "room")
+    assert backend.get("a") == 1
+    backend.close()
+
+
+def test_journal_compaction(tmp_path: Path) -> None:
+    """Test journal is compacted into a snapshot and old segments are deleted."""
+    backend = _attach(tmp_path / "room", JournalPolicy(compact_bytes=1000))
+    for i in range(50):
+        backend.commit(backend.version, {"a": i, f"key_{i}": "x" * 100})
+
+    # Compacted in the background
+    deadline = time.monotonic() + 2
+    while not (tmp_path / "room" / SNAPSHOT_FILENAME).exists():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    backend.close()
+    assert len(_segments(tmp_path / "room")) <= 2
+
+    backend = _attach(tmp_path / "room")
+    values = backend.read_since(None)[0]
+    assert values["a"] == 49
+    assert len(values) == 51
+    backend.close()
+
+
+def test_journal_history(tmp_path: Path) -> None:
+    """Test updates are replayed, including segments kept after compaction."""
+    backend = _attach(tmp_path / "room", JournalPolicy(history_bytes=10_000))
+    first_version = backend.version
+    for i in range(5):
+        backend.commit(backend.version, {"a": i})
+    backend._journal.compact()  # type: ignore
+    backend.commit(backend.version, {"a": 5})
+
+    history = list(backend.history())
+    assert [values["a"] for _, values in history] == [0, 1, 2, 3, 4, 5]
+    assert [version for version, _ in history] == list(
+        range(first_version + 1, first_version + 7)
+    )
+    assert len(list(backend.history(since_version=history[-2][0]))) == 1
+    backend.close()
+
+
+def test_journal_migrate_from_diskcache(tmp_path: Path) -> None:
+    """Test a room persisted with the default engine is imported in the journal."""
+    backend = LocalBackend()
+    backend.attach_to_disk(tmp_path / "room")
+    backend.commit(backend.version, {"a": 1})
+    backend.close()
+
+    backend = _attach(tmp_path / "room")
+    assert backend.get("a") == 1
+    backend.close()
+
+    # Values are now read from the journal
+    Index(str(tmp_path / "room")).clear()
+    backend = _attach(tmp_path / "room")
+    assert backend.get("a") == 1
+    backend.close()
+
+
+def test_journal_delete(tmp_path: Path) -> None:
+    """Test deleting a room removes its journal."""
+    backend = _attach(tmp_path / "room")
+    backend.commit(backend.version, {"a": 1})
+    backend.delete()
+    assert not (tmp_path / "room").exists()
+
+
+def test_journal_incompatible_options(tmp_path: Path) -> None:
+    """Test journal cannot be combined with write-behind."""
+    backend = LocalBackend()
+    with pytest.raises(StreamlitSyncException):
+        backend.attach_to_disk(
+            tmp_path / "room", write_behind=WriteBehindPolicy(), journal=JournalPolicy()
+        )
+    assert not backend.use_cache
@@ -0,0 +1,82 @@
+import threading
+import time
+from typing import List
+
+import numpy as np
+import pytest
+
+from streamlit_sync.exceptions import StreamlitSyncException
+from streamlit_sync.memo import _MemoCache, make_arguments_key
+
+
+def test_results_are_cached_per_version() -> None:
+    """Test results are computed once per arguments and versions."""
+    cache = _MemoCache(max_entries=2, max_versions=2)
+    calls: List[int] = []
+
+    def compute() -> int:
+        calls.append(1)
+        return len(calls)
+
+    assert cache.get_or_compute("a", 1, compute) == (1, False)
+    assert cache.get_or_compute("a", 1, compute) == (1, True)
+    assert cache.get_or_compute("a", 2, compute) == (2, False)
+    assert cache.get_or_compute("a", 1, compute) == (1, True)
+
+    # Oldest version is evicted
+    assert cache.get_or_compute("a", 3, compute) == (3, False)
+    assert cache.get_or_compute("a", 1, compute) == (4, False)
+    assert len(cache) == 2
+
+    # Least recently used arguments are evicted
+    cache.get_or_compute("b", 1, compute)
+    cache.get_or_compute("c", 1, compute)
+    assert cache.get_or_compute("a", 1, compute)[1] is False
+
+
+def test_concurrent_calls_compute_once() -> None:
+    """Test sessions asking for a result being computed wait for it."""
+    cache = _MemoCache(max_entries=2, max_versions=2)
+    calls: List[int] = []
+
+    def compute() -> int:
+        calls.append(1)
+        time.sleep(0.05)
+        return 42
+
+    results: List[int] = []
+    threads = [
+        threading.Thread(
+            target=lambda: results.append(cache.get_or_compute("a", 1, compute)[0])
+        )
+        for _ in range(10)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == [42] * 10
+    assert len(calls) == 1
+
+
+def test_failed_computation_is_not_cached() -> None:
+    """Test a failed computation is propagated and computed again next time."""
+    cache = _MemoCache(max_entries=2, max_versions=2)
+
+    def fail() -> None:
+        raise ValueError()
+
+    with pytest.raises(ValueError):
+        cache.get_or_compute("a", 1, fail)
+    assert cache.get_or_compute("a", 1, lambda: None) == (None, False)
+
+
+def test_arguments_key() -> None:
+    """Test unhashable arguments are fingerprinted."""
+    assert make_arguments_key((1, "a"), {"b": 2}) == ((1, "a"), (("b", 2),))
+    assert make_arguments_key(([1, 2],), {}) == make_arguments_key(([1, 2],), {})
+    assert make_arguments_key((np.arange(3),), {}) != make_arguments_key(
+        (np.arange(4),), {}
+    )
+    with pytest.raises(StreamlitSyncException):
+        make_arguments_key(([object()],), {})
@@ -0,0 +1,127 @@
+import urllib.request
+from threading import RLock
+from typing import Iterator
+
+import pytest
+
+from streamlit_sync import metrics
+from streamlit_sync.metrics import _InstrumentedLock, get_room_metrics, get_stats
+from streamlit_sync.synced_state import _SyncedState
+
+
+@pytest.fixture(autouse=True)
+def reset_metrics() -> Iterator[None]:
+    metrics.reset()
+    yield
+    metrics.set_enabled(True)
+    metrics.reset()
+
+
+def test_room_metrics() -> None:
+    """Test counters and histograms are recorded per room and aggregated."""
+    room_1 = get_room_metrics("room_1")
+    room_2 = get_room_metrics("room_2")
+    assert get_room_metrics("room_1") is room_1
+
+    room_1.inc("commits")
+    room_1.inc("keys_changed", 3)
+    room_2.inc("commits")
+    room_1.observe("scan_seconds", 0.002)
+    room_2.observe("scan_seconds", 0.2)
+
+    stats = get_stats("room_1")
+    assert stats["commits"] == 1
+    assert stats["keys_changed"] == 3
+    assert stats["scan_seconds"]["count"] == 1
+    assert stats["scan_seconds"]["buckets"][0.005] == 1
+
+    stats = get_stats()
+    assert stats["commits"] == 2
+    assert stats["scan_seconds"]["count"] == 2
+    assert stats["scan_seconds"]["max"] == 0.2
+    assert stats["scan_seconds"]["sum"] == pytest.approx(0.202)
+
+
+def test_metrics_disabled() -> None:
+    """Test nothing is recorded when metrics are disabled."""
+    metrics.set_enabled(False)
+    room = get_room_metrics("room")
+    room.inc("commits")
+    room.observe("scan_seconds", 0.1)
+    with _InstrumentedLock(room):
+        pass
+
+    stats = get_stats("room")
+    assert stats["commits"] == 0
+    assert stats["scan_seconds"]["count"] == 0
+    assert stats["lock_hold_seconds"]["count"] == 0
+
+
+def test_instrumented_lock() -> None:
+    """Test lock wait and hold times are recorded."""
+    room = get_room_metrics("room")
+    lock = _InstrumentedLock(room)
+    with lock:
+        pass
+    with lock:
+        pass
+
+    stats = get_stats("room")
+    assert stats["lock_wait_seconds"]["count"] == 2
+    assert stats["lock_hold_seconds"]["count"] == 2
+
+
+def test_instrumented_reentrant_lock() -> None:
+    """Test only the outermost acquisition of a reentrant lock is recorded."""
+    room = get_room_metrics("room")
+    lock = _InstrumentedLock(room, RLock(), prefix="backend_lock")
+    with lock:
+        with lock:
+            pass
+    assert lock.acquire(blocking=False)
+    lock.release()
+
+    stats = get_stats("room")
+    assert stats["backend_lock_wait_seconds"]["count"] == 2
+    assert stats["backend_lock_hold_seconds"]["count"] == 2
+    assert stats["lock_hold_seconds"]["count"] == 0
+
+
+def test_backend_lock_is_instrumented() -> None:
+    """Test commits record the contention on the backend lock."""
+    room = _SyncedState("instrumented_room")
+    room.update_values({"a": 1})
+
+    stats = get_stats("instrumented_room")
+    assert stats["backend_lock_wait_seconds"]["count"] >= 1
+    assert stats["backend_lock_hold_seconds"]["count"] >= 1
+
+
+def test_render_prometheus() -> None:
+    """Test metrics are rendered in the Prometheus text format."""
+    room = get_room_metrics('room "1"')
+    room.inc("commits", 2)
+    room.observe("fan_out_size", 3)
+
+    text = metrics.render_prometheus()
+    assert "# TYPE streamlit_sync_commits_total counter" in text
+    assert 'streamlit_sync_commits_total{room="room \\"1\\""} 2' in text
+    assert 'streamlit_sync_fan_out_size_bucket{room="room \\"1\\"",le="2"} 0' in text
+    assert 'streamlit_sync_fan_out_size_bucket{room="room \\"1\\"",le="5"} 1' in text
+    assert 'streamlit_sync_fan_out_size_bucket{room="room \\"1\\"",le="+Inf"} 1' in text
+    assert 'streamlit_sync_fan_out_size_count{room="room \\"1\\""} 1' in text
+
+
+def test_http_server() -> None:
+    """Test metrics are served over HTTP."""
+    get_room_metrics("room").inc("commits")
+    server = metrics.start_http_server(0, addr="127.0.0.1")
+    try:
+        url = f"http://127.0.0.1:{server.server_port}/metrics"
+        with urllib.request.urlopen(url) as response:
+            assert (
+                'streamlit_sync_commits_total{room="room"} 1'
+                in response.read().decode()
+            )
+    finally:
+        server.shutdown()
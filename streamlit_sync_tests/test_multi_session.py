@@ -0,0 +1,449 @@
+"""Test sync between several sessions, using a fake server."""
+import time
+from pathlib import Path
+from typing import Any, Callable, Iterator, List, Optional
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+import streamlit as st
+
+from streamlit_sync import metrics
+from streamlit_sync.conflicts import first_writer_wins
+from streamlit_sync.fingerprints import fingerprint
+from streamlit_sync.rooms import room_memo
+from streamlit_sync.synced_state import Subscription, _SyncedState, get_synced_state
+from streamlit_sync.utils import get_not_synced_key
+
+from .fake_server import OK, RERUN, FakeServer
+
+
+@pytest.fixture
+def server() -> Iterator[FakeServer]:
+    metrics.reset()  # Metrics are kept by room name
+    with FakeServer().installed() as server:
+        yield server
+
+
+def _script(
+    room: _SyncedState, subscription: Optional[Subscription] = None, **values: Any
+) -> Callable[[], None]:
+    """Script equivalent to `with sync(room): st.session_state.update(values)`."""
+
+    def script() -> None:
+        room.register_session()
+        room.subscribe(subscription)
+        room.sync(before_script=True)
+        for key, value in values.items():
+            st.session_state[key] = value
+        room.sync()
+
+    return script
+
+
+def _edit(**values: Any) -> Callable[[], None]:
+    """Script updating values without syncing, as the frontend would."""
+
+    def script() -> None:
+        for key, value in values.items():
+            st.session_state[key] = value
+
+    return script
+
+
+def _wait_for_rerun_request(session: Any) -> None:
+    assert session.rerun_requested.wait(timeout=2)
+
+
+def test_values_are_synced(server: FakeServer) -> None:
+    """Test a value set by a session is received by another one."""
+    room = _SyncedState("room")
+    session_1, session_2 = server.new_session(), server.new_session()
+    server.run_until_done(session_1, _script(room))
+    server.run_until_done(session_2, _script(room))
+
+    # Session 1 updates a value => session 2 is triggered
+    assert server.run(session_1, _script(room, a=1)) == OK
+    _wait_for_rerun_request(session_2)
+    assert session_1.nb_rerun_requests == 0
+
+    server.run_until_done(session_2, _script(room))
+    assert session_2.session_state["a"] == 1
+
+
+def test_catch_up_in_a_single_run(server: FakeServer) -> None:
+    """Test missed values are applied before the script, without rerun."""
+    room = _SyncedState("room")
+    session_1, session_2 = server.new_session(), server.new_session()
+    server.run_until_done(session_1, _script(room))
+    server.run_until_done(session_2, _script(room))
+
+    server.run(session_1, _script(room, a=1))
+    _wait_for_rerun_request(session_2)
+
+    seen = []
+
+    def script() -> None:
+        room.register_session()
+        room.sync(before_script=True)
+        seen.append(st.session_state["a"])
+        room.sync()
+
+    assert server.run(session_2, script) == OK
+    assert seen == [1]
+    assert room.metrics.counters["catch_up_reruns"] == 0
+
+
+def test_catch_up_after_widgets_reruns(server: FakeServer) -> None:
+    """Test session is rerun if missed values arrive after their widget is rendered."""
+    room = _SyncedState("room")
+    session = server.new_session()
+
+    def script() -> None:
+        st.checkbox("checkbox", key="a")
+        room.register_session()
+        room.sync(before_script=True)
+
+    server.run_until_done(session, script)
+    room.update_values({"a": True})
+
+    assert server.run(session, script) == RERUN
+    assert session.session_state["a"] is True
+    assert room.metrics.counters["catch_up_reruns"] == 1
+
+
+def test_catch_up_after_not_synced_widgets(server: FakeServer) -> None:
+    """Test widgets not displaying missed values do not force a rerun."""
+    room = _SyncedState("room")
+    session = server.new_session()
+    server.run_until_done(session, _script(room))
+    room.update_values({"a": 1})
+
+    def script() -> None:
+        st.button("Exit room", key=get_not_synced_key("exit"))
+        st.checkbox("checkbox")
+        room.register_session()
+        room.sync(before_script=True)
+
+    assert server.run(session, script) == OK
+    assert session.session_state["a"] == 1
+    assert room.metrics.counters["catch_up_reruns"] == 0
+
+
+def test_new_session_receives_values(server: FakeServer, tmp_path: Path) -> None:
+    """Test a session entering a persisted room gets its values."""
+    room = _SyncedState("room")
+    room.attach_to_disk(tmp_path)
+    session_1 = server.new_session()
+    server.run_until_done(session_1, _script(room, a=1, b=[1, 2]))
+
+    # Same room reloaded from disk
+    room = _SyncedState("room")
+    room.attach_to_disk(tmp_path)
+    session_2 = server.new_session()
+    assert server.run_until_done(session_2, _script(room)) == 1
+    assert session_2.session_state["a"] == 1
+    assert session_2.session_state["b"] == [1, 2]
+
+
+def test_lazy_load(server: FakeServer, tmp_path: Path) -> None:
+    """Test a session catching up reads from disk only the values it uses."""
+    room = _SyncedState("room")
+    room.attach_to_disk(tmp_path, lazy_load=True)
+    session_1, session_2 = server.new_session(), server.new_session()
+    server.run_until_done(session_1, _script(room))
+    server.run_until_done(session_2, _script(room))
+    server.run_until_done(session_1, _script(room, a=1, b=np.arange(1000)))
+
+    read_keys = []
+    get = room._backend.get
+
+    def _get(key: str, default: Any = None) -> Any:
+        read_keys.append(key)
+        return get(key, default)
+
+    def script() -> None:
+        _script(room)()
+        st.write(st.session_state["a"])  # "b" is never accessed
+
+    with patch.object(room._backend, "get", _get):
+        server.run_until_done(session_2, script)
+        server.run_until_done(session_2, script)  # Catch-up is not repeated
+    assert read_keys == ["a"]
+    assert session_2.session_state["a"] == 1
+
+    # Session 2 is up to date: updates of session 1 are still received
+    server.run_until_done(session_1, _script(room, b=[2]))
+    server.run_until_done(session_2, _script(room))
+    assert session_2.session_state["b"] == [2]
+
+
+def test_unchanged_persisted_values_are_not_hashed(
+    server: FakeServer, tmp_path: Path
+) -> None:
+    """Test a rerun without changes does not fingerprint the values read from disk."""
+    room = _SyncedState("room")
+    room.attach_to_disk(tmp_path)
+    session_1, session_2 = server.new_session(), server.new_session()
+    server.run_until_done(session_1, _script(room, a=np.arange(1000)))
+    server.run_until_done(session_2, _script(room))
+
+    with patch("streamlit_sync.synced_state.fingerprint", wraps=fingerprint) as mock:
+        assert server.run(session_1, _script(room)) == OK
+        assert server.run(session_2, _script(room)) == OK
+    assert mock.call_count == 0
+
+    # Values updated by the session are still detected
+    assert server.run(session_2, _script(room, a=np.arange(10))) == OK
+    assert np.array_equal(room.state["a"], np.arange(10))
+
+
+def test_outdated_values_are_not_hashed(server: FakeServer) -> None:
+    """Test an outdated session does not fingerprint the values it did not change."""
+    room = _SyncedState("room")
+    session_1, session_2 = server.new_session(), server.new_session()
+    server.run_until_done(session_1, _script(room, a=[1], b=[1]))
+    server.run_until_done(session_2, _script(room))
+    server.run_until_done(session_1, _script(room, a=[2]))
+
+    with patch("streamlit_sync.synced_state.fingerprint", wraps=fingerprint) as mock:
+        server.run_until_done(session_2, _script(room, b=[3]))
+    assert [call.args[0] for call in mock.call_args_list] == [[3]]
+    assert room.state == {"a": [2], "b": [3]}
+    assert session_2.session_state["a"] == [2]
+
+
+def test_closed_sessions_are_not_triggered(server: FakeServer) -> None:
+    """Test closed sessions are removed from the room on next broadcast."""
+    room = _SyncedState("room")
+    session_1, session_2 = server.new_session(), server.new_session()
+    server.run_until_done(session_1, _script(room))
+    server.run_until_done(session_2, _script(room))
+    assert room.nb_active_sessions == 2
+
+    session_2.shutdown()
+    server.run(session_1, _script(room, a=1))
+    time.sleep(0.1)
+    assert session_2.nb_rerun_requests == 0
+    assert room.nb_active_sessions == 1
+
+
+def test_concurrent_updates_are_merged(server: FakeServer) -> None:
+    """Test updates of different keys by 2 sessions are both committed."""
+    room = _SyncedState("room")
+    session_1, session_2 = server.new_session(), server.new_session()
+    server.run_until_done(session_1, _script(room, a=0, b=0))
+    server.run_until_done(session_2, _script(room))
+
+    # Session 2 updates "b" while session 1 has updated "a"
+    server.run(session_1, _script(room, a=1))
+    server.run(session_2, _edit(b=2))
+    assert server.run_until_done(session_2, _script(room)) == 1
+
+    # Outdated value of "a" in session 2 is not committed
+    assert room.state == {"a": 1, "b": 2}
+    assert session_2.session_state["a"] == 1
+    assert room.metrics.counters["merged_commits"] == 1
+    assert room.metrics.counters["key_conflicts"] == 0
+
+
+def test_conflict_last_writer_wins(server: FakeServer) -> None:
+    """Test a key updated by 2 sessions keeps the last value by default."""
+    room = _SyncedState("room")
+    session_1, session_2 = server.new_session(), server.new_session()
+    server.run_until_done(session_1, _script(room, a=0))
+    server.run_until_done(session_2, _script(room))
+
+    server.run(session_1, _script(room, a=1))
+    server.run(session_2, _edit(a=2))
+    server.run_until_done(session_2, _script(room))
+
+    assert room.state == {"a": 2}
+    assert session_2.session_state["a"] == 2
+    assert room.metrics.counters["key_conflicts"] == 1
+
+
+def test_conflict_custom_resolver(server: FakeServer) -> None:
+    """Test a key updated by 2 sessions is resolved by the room resolver."""
+    room = _SyncedState("room")
+    room.configure_conflicts(first_writer_wins)
+    session_1, session_2 = server.new_session(), server.new_session()
+    server.run_until_done(session_1, _script(room, a=0, b=0))
+    server.run_until_done(session_2, _script(room))
+
+    server.run(session_1, _script(room, a=1))
+    server.run(session_2, _edit(a=2, b=2))
+    server.run_until_done(session_2, _script(room))
+
+    assert room.state == {"a": 1, "b": 2}
+    assert session_2.session_state["a"] == 1
+
+
+def test_subscribed_sessions_only_are_rerun(server: FakeServer) -> None:
+    """Test a session is only rerun on updates of the keys it depends on."""
+    room = _SyncedState("room")
+    subscription = Subscription(keys=frozenset({"b"}))
+    session_1, session_2 = server.new_session(), server.new_session()
+    server.run_until_done(session_1, _script(room))
+    server.run_until_done(session_2, _script(room, subscription))
+
+    server.run(session_1, _script(room, a=1))
+    time.sleep(0.1)
+    assert session_2.nb_rerun_requests == 0
+    assert room.metrics.counters["sessions_not_subscribed"] == 1
+
+    # Session 2 depends on "b": rerun and get all values
+    server.run(session_1, _script(room, b=1))
+    _wait_for_rerun_request(session_2)
+    assert server.run(session_2, _script(room, subscription)) == OK
+    assert session_2.session_state["a"] == 1
+    assert session_2.session_state["b"] == 1
+
+
+def test_no_rerun_on_catch_up_if_not_subscribed(server: FakeServer) -> None:
+    """Test updates of other keys during a run do not rerun the session."""
+    room = _SyncedState("room")
+    session = server.new_session()
+    server.run_until_done(session, _script(room))
+
+    def script() -> None:
+        room.register_session()
+        room.subscribe(Subscription(namespaces=("filters.",)))
+        room.sync(before_script=True)
+        st.checkbox("checkbox")
+        room.update_values({"a": 1})  # Updated by another session during the run
+        room.sync()
+
+    assert server.run(session, script) == OK
+    assert session.session_state["a"] == 1
+    assert room.metrics.counters["catch_up_reruns"] == 0
+
+
+def _viewer_script(room: _SyncedState) -> Callable[[], None]:
+    """Script of a read-only session, updating a value locally."""
+
+    def script() -> None:
+        room.register_session(read_only=True)
+        room.sync(before_script=True, read_only=True)
+        st.session_state["b"] = 2
+        room.sync(read_only=True)
+
+    return script
+
+
+def test_viewer_only_receives_values(server: FakeServer) -> None:
+    """Test a read-only session gets values but never commits."""
+    room = _SyncedState("room")
+    editor, viewer = server.new_session(), server.new_session()
+    server.run_until_done(editor, _script(room))
+    server.run_until_done(viewer, _viewer_script(room))
+
+    server.run(editor, _script(room, a=1))
+    _wait_for_rerun_request(viewer)
+    assert server.run(viewer, _viewer_script(room)) == OK
+    assert viewer.session_state["a"] == 1
+    assert room.state == {"a": 1}  # Local value of the viewer is not committed
+
+
+def test_up_to_date_viewer_fast_path(server: FakeServer) -> None:
+    """Test an up-to-date viewer does not scan its values nor take the room lock."""
+    room = _SyncedState("room")
+    viewer = server.new_session()
+    server.run_until_done(viewer, _viewer_script(room))
+
+    metrics.reset()
+    assert server.run(viewer, _viewer_script(room)) == OK
+    stats = room.metrics.as_dict()
+    assert stats["syncs"] == 0
+    assert stats["keys_scanned"] == 0
+    assert stats["lock_wait_seconds"]["count"] == 0
+
+
+def test_memoized_results_are_shared(server: FakeServer) -> None:
+    """Test a memoized result is computed by the first session after an update."""
+    room = get_synced_state("memo_room")
+    calls = []
+
+    @room_memo(keys=["a"])
+    def total(offset: int) -> int:
+        calls.append(st.session_state["a"])
+        return sum(st.session_state["a"]) + offset
+
+    results = {}
+
+    def _memo_script(session: Any, **values: Any) -> Callable[[], None]:
+        def script() -> None:
+            _script(room, **values)()
+            results[session.id] = total(1)
+
+        return script
+
+    session_1, session_2 = server.new_session(), server.new_session()
+    server.run_until_done(session_1, _memo_script(session_1, a=[1, 2]))
+    server.run_until_done(session_2, _memo_script(session_2))
+    assert results == {session_1.id: 4, session_2.id: 4}
+    assert calls == [[1, 2]]
+
+    # Other keys do not invalidate the result
+    server.run_until_done(session_1, _memo_script(session_1, b=1))
+    server.run_until_done(session_2, _memo_script(session_2))
+    assert calls == [[1, 2]]
+
+    server.run_until_done(session_1, _memo_script(session_1, a=[5]))
+    server.run_until_done(session_2, _memo_script(session_2))
+    assert results == {session_1.id: 6, session_2.id: 6}
+    assert calls == [[1, 2], [5]]
+    assert room.metrics.counters["memo_misses"] == 2
+
+
+def test_memoized_results_are_copies(server: FakeServer) -> None:
+    """Test sessions mutating a memoized result do not affect each other."""
+    room = get_synced_state("memo_copy_room")
+
+    @room_memo
+    def items() -> List[int]:
+        return [1, 2]
+
+    @room_memo(copy_results=False)
+    def shared_items() -> List[int]:
+        return [1, 2]
+
+    results = []
+
+    def script() -> None:
+        _script(room)()
+        results.append((items(), shared_items()))
+        results[-1][0].append(3)
+
+    session_1, session_2 = server.new_session(), server.new_session()
+    server.run_until_done(session_1, script)
+    server.run_until_done(session_2, script)
+    assert results[0][0] == results[1][0] == [1, 2, 3]
+    assert results[0][1] is results[1][1]
+
+
+def test_memoized_results_of_outdated_sessions(server: FakeServer) -> None:
+    """Test sessions not up to date with the room do not share their results."""
+    room = get_synced_state("memo_outdated_room")
+    calls = []
+
+    @room_memo
+    def total() -> int:
+        calls.append(st.session_state["a"])
+        return sum(st.session_state["a"])
+
+    results = []
+
+    def memo_script() -> None:
+        results.append(total())
+
+    session_1, session_2 = server.new_session(), server.new_session()
+    server.run_until_done(session_1, _script(room, a=[1, 2]))
+    server.run_until_done(session_2, _script(room))
+    server.run_until_done(session_1, _script(room, a=[5]))
+
+    # Session 2 did not catch up: computed with its own values, not cached
+    server.run_until_done(session_2, memo_script)
+    server.run_until_done(session_1, memo_script)
+    assert results == [3, 5]
+    assert calls == [[1, 2], [5]]
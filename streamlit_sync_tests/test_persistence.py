@@ -0,0 +1,59 @@
+import time
+from pathlib import Path
+
+from diskcache import Index
+
+from streamlit_sync.persistence import WriteBehindPolicy, _WriteBehindFlusher
+
+
+def test_flush_on_interval(tmp_path: Path) -> None:
+    """Test dirty values are flushed in the background."""
+    index = Index(str(tmp_path))
+    flusher = _WriteBehindFlusher(index, WriteBehindPolicy(flush_interval=0.05))
+
+    flusher.mark_dirty({"a": 1, "b": 2})
+    assert flusher.nb_dirty == 2
+    assert "a" not in index
+
+    time.sleep(0.2)
+    assert flusher.nb_dirty == 0
+    assert dict(index) == {"a": 1, "b": 2}
+    flusher.stop()
+
+
+def test_flush_on_max_dirty(tmp_path: Path) -> None:
+    """Test flush is triggered when too many values are dirty."""
+    index = Index(str(tmp_path))
+    flusher = _WriteBehindFlusher(
+        index, WriteBehindPolicy(flush_interval=60, max_dirty=3)
+    )
+
+    flusher.mark_dirty({"a": 1, "b": 2})
+    time.sleep(0.1)
+    assert len(index) == 0
+
+    flusher.mark_dirty({"c": 3})
+    time.sleep(0.1)
+    assert len(index) == 3
+    flusher.stop()
+
+
+def test_flush_on_stop(tmp_path: Path) -> None:
+    """Test remaining values are flushed when stopped."""
+    index = Index(str(tmp_path))
+    flusher = _WriteBehindFlusher(index, WriteBehindPolicy(flush_interval=60))
+
+    flusher.mark_dirty({"a": 1})
+    flusher.mark_dirty({"a": 2})
+    flusher.stop()
+    assert dict(index) == {"a": 2}
+
+
+def test_no_flush_on_stop(tmp_path: Path) -> None:
+    """Test remaining values can be discarded when stopped."""
+    index = Index(str(tmp_path))
+    flusher = _WriteBehindFlusher(index, WriteBehindPolicy(flush_interval=60))
+
+    flusher.mark_dirty({"a": 1})
+    flusher.stop(flush=False)
+    assert len(index) == 0
@@ -0,0 +1,18 @@
+from pathlib import Path
+
+from streamlit_sync.rooms import warm_up_rooms
+from streamlit_sync.synced_state import _RoomRegistry, get_room_registry
+
+
+def test_warm_up_rooms_once(tmp_path: Path) -> None:
+    """Test rooms of a cache directory are warmed up once, in the background."""
+    room = _RoomRegistry().get("warm_up_room")
+    room.attach_to_disk(tmp_path)
+    room._backend.commit(room.version, {"a": [1]})
+    room.close()
+
+    thread = warm_up_rooms(tmp_path)
+    assert warm_up_rooms(tmp_path) is thread
+    thread.join()
+    assert "warm_up_room" in get_room_registry()
+    assert dict(get_room_registry().get("warm_up_room").state) == {"a": [1]}
@@ -0,0 +1,133 @@
+import pickle
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+from diskcache import Index
+
+from streamlit_sync.backends import LocalBackend
+from streamlit_sync.exceptions import StreamlitSyncException
+from streamlit_sync.journal import JournalPolicy
+from streamlit_sync.serializers import (
+    _MAGIC,
+    SerializationPolicy,
+    Serializer,
+    _SerializedIndex,
+    check_policy,
+    dumps,
+    loads,
+    register_serializer,
+)
+
+
+def _serializer_name(data: bytes) -> str:
+    offset = len(_MAGIC) + 1
+    return data[offset : offset + data[len(_MAGIC)]].decode().split("+")[0]
+
+
+def test_array_and_dataframe_roundtrip() -> None:
+    """Test arrays and DataFrames are serialized natively."""
+    pytest.importorskip("pyarrow")
+    policy = SerializationPolicy()
+    array = np.arange(100).reshape(10, 10)
+    df = pd.DataFrame({"a": np.arange(10), "b": list("abcdefghij")})
+
+    assert _serializer_name(dumps(array, policy)) == "npy"
+    assert np.array_equal(loads(dumps(array, policy)), array)
+    assert _serializer_name(dumps(df, policy)) == "arrow"
+    assert loads(dumps(df, policy)).equals(df)
+
+    # Column names would not roundtrip with Arrow
+    df = pd.DataFrame({0: [1, 2]})
+    assert _serializer_name(dumps(df, policy)) == "pickle"
+    assert loads(dumps(df, policy)).equals(df)
+
+
+def test_plain_values_roundtrip() -> None:
+    """Test strings and plain containers, with pickle as fallback."""
+    pytest.importorskip("msgpack")
+    policy = SerializationPolicy()
+    document = {"a": [1, 2.5, None, True, {"b": "c"}]}
+
+    assert _serializer_name(dumps("text", policy)) == "str"
+    assert loads(dumps("text", policy)) == "text"
+    assert _serializer_name(dumps(document, policy)) == "msgpack"
+    assert loads(dumps(document, policy)) == document
+
+    # Tuples would be restored as lists by msgpack
+    for value in [(1, 2), {"a": (1,)}, {"a": 2**70}, b"bytes", np.float64(1.0)]:
+        assert _serializer_name(dumps(value, policy)) == "pickle"
+        assert loads(dumps(value, policy)) == value
+
+
+def test_compression() -> None:
+    """Test only large values are compressed."""
+    policy = SerializationPolicy(compression="zlib", compress_threshold=100)
+    small, large = "a" * 10, "a" * 1000
+
+    assert b"str+zlib" not in dumps(small, policy)
+    assert b"str+zlib" in dumps(large, policy)
+    assert len(dumps(large, policy)) < 100
+    assert loads(dumps(large, policy)) == large
+
+
+def test_invalid_policy() -> None:
+    """Test unknown serializers and codecs are rejected."""
+    with pytest.raises(StreamlitSyncException):
+        check_policy(SerializationPolicy(serializers=("unknown",)))
+    with pytest.raises(StreamlitSyncException):
+        check_policy(SerializationPolicy(compression="unknown"))
+
+
+def test_register_serializer() -> None:
+    """Test a custom serializer can be registered once."""
+    serializer = Serializer(
+        "test_complex",
+        accepts=lambda value: isinstance(value, complex),
+        dumps=lambda value: f"{value.real},{value.imag}".encode(),
+        loads=lambda data: complex(*map(float, bytes(data).split(b","))),
+    )
+    register_serializer(serializer)
+    with pytest.raises(StreamlitSyncException):
+        register_serializer(serializer)
+
+    policy = SerializationPolicy(serializers=("test_complex",))
+    assert _serializer_name(dumps(1 + 2j, policy)) == "test_complex"
+    assert loads(dumps(1 + 2j, policy)) == 1 + 2j
+
+
+def test_index_reads_values_persisted_without_policy(tmp_path: Path) -> None:
+    """Test a room can be read whether or not its values were serialized."""
+    index = Index(str(tmp_path / "room"))
+    index["legacy"] = (1, 2)
+    index["raw"] = b"bytes"
+
+    state = _SerializedIndex(index, SerializationPolicy())
+    state["new"] = "value"
+    assert isinstance(index["new"], bytes)  # serialized
+
+    state = _SerializedIndex(index, None)
+    assert dict(state.items()) == {"legacy": (1, 2), "raw": b"bytes", "new": "value"}
+
+
+@pytest.mark.parametrize("journal", [None, JournalPolicy()])
+def test_backend_with_serialization(tmp_path: Path, journal: JournalPolicy) -> None:
+    """Test room values are serialized on disk and recovered."""
+    policy = SerializationPolicy(compression="zlib", compress_threshold=100)
+    backend = LocalBackend()
+    backend.attach_to_disk(tmp_path / "room", journal=journal, serialization=policy)
+    array = np.zeros(10_000)
+    backend.commit(backend.version, {"array": array, "text": "a" * 1000})
+    backend.close()
+
+    backend = LocalBackend()
+    backend.attach_to_disk(tmp_path / "room", journal=journal)
+    values = backend.read_since(None)[0]
+    assert np.array_equal(values["array"], array)
+    assert values["text"] == "a" * 1000
+    backend.close()
+
+    # Smaller than pickle
+    size = sum(path.stat().st_size for path in (tmp_path / "room").rglob("*"))
+    assert size < len(pickle.dumps(array)) / 2
@@ -0,0 +1,123 @@
+from pathlib import Path
+from threading import Thread
+from typing import Any, Dict, List
+
+import numpy as np
+import pytest
+
+from streamlit_sync.catalog import RoomInfo, get_catalog
+from streamlit_sync.exceptions import StreamlitSyncException
+from streamlit_sync.journal import JournalPolicy
+from streamlit_sync.rooms import export_room, import_room
+from streamlit_sync.serializers import SerializationPolicy
+from streamlit_sync.snapshots import RoomSnapshot, write_snapshot
+from streamlit_sync.synced_state import _RoomRegistry, get_synced_state
+
+
+def test_snapshot_roundtrip(tmp_path: Path) -> None:
+    """Test values are written and read back."""
+    path = tmp_path / "room.snapshot"
+    values: Dict[str, Any] = {"a": 1, "b": "text", "c": np.arange(1000), "d": None}
+    write_snapshot(path, "room", 3, values)
+
+    with RoomSnapshot(path) as snapshot:
+        assert snapshot.room_name == "room"
+        assert snapshot.version == 3
+        assert set(snapshot.keys()) == {"a", "b", "c", "d"}
+        assert snapshot["b"] == "text"
+        assert snapshot["d"] is None
+        np.testing.assert_array_equal(snapshot["c"], values["c"])
+        assert "e" not in snapshot
+
+
+def test_snapshot_unpicklable_value(tmp_path: Path) -> None:
+    """Test snapshot is not written if a value cannot be pickled."""
+    path = tmp_path / "room.snapshot"
+    with pytest.raises(StreamlitSyncException):
+        write_snapshot(path, "room", 0, {"a": 1, "b": lambda: None})
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_invalid_snapshot(tmp_path: Path) -> None:
+    """Test invalid or truncated snapshots are detected."""
+    path = tmp_path / "room.snapshot"
+    path.write_bytes(b"not a snapshot")
+    with pytest.raises(StreamlitSyncException):
+        RoomSnapshot(path)
+
+    write_snapshot(path, "room", 0, {"a": 1})
+    path.write_bytes(path.read_bytes()[:-1])
+    with pytest.raises(StreamlitSyncException):
+        RoomSnapshot(path)
+
+
+def test_export_import_room(tmp_path: Path) -> None:
+    """Test a room is cloned from its snapshot."""
+    path = tmp_path / "room.snapshot"
+    get_synced_state("exported_room").update_values({"a": 1, "b": [1, 2]})
+
+    export_room("exported_room", path)
+    assert import_room(path, room_name="cloned_room", keys=["a"]) == "cloned_room"
+    assert import_room(path, room_name="cloned_room_2") == "cloned_room_2"
+
+    assert get_synced_state("cloned_room").read_values()[0] == {"a": 1}
+    assert get_synced_state("cloned_room_2").read_values()[0] == {"a": 1, "b": [1, 2]}
+
+
+# Lock probed when a `_LockProbe` is read from disk, and results of the probes
+_probed_lock: Any = None
+_probes: List[bool] = []
+
+
+def _probe_lock() -> "_LockProbe":
+    def probe() -> None:
+        is_free = _probed_lock.acquire(blocking=False)
+        if is_free:
+            _probed_lock.release()
+        _probes.append(is_free)
+
+    thread = Thread(target=probe)
+    thread.start()
+    thread.join()
+    return _LockProbe()
+
+
+class _LockProbe:
+    """Value checking, when read from disk, if the room lock is free."""
+
+    def __reduce__(self) -> Any:
+        return (_probe_lock, ())
+
+
+def test_export_room_does_not_lock_room(tmp_path: Path) -> None:
+    """Test values are read from disk without holding the room lock."""
+    global _probed_lock
+    room = get_synced_state("streamed_room")
+    room.attach_to_disk(tmp_path)
+    room.update_values({"a": 1, "probe": _LockProbe()})
+    _probed_lock = room._backend.lock()
+
+    export_room("streamed_room", tmp_path / "room.snapshot")
+    assert _probes == [True]
+    with RoomSnapshot(tmp_path / "room.snapshot") as snapshot:
+        assert set(snapshot.keys()) == {"a", "probe"}
+
+
+@pytest.mark.parametrize("recorded", [True, False])
+def test_export_room_persisted_with_journal(tmp_path: Path, recorded: bool) -> None:
+    """Test a room is exported with the engine it has been persisted with."""
+    room_name = f"journal_room_{recorded}"
+    room = _RoomRegistry().get(room_name)
+    room.attach_to_disk(
+        tmp_path, journal=JournalPolicy(), serialization=SerializationPolicy()
+    )
+    room.update_values({"a": [1, 2]})
+    room.close()
+    if not recorded:
+        # Room persisted before attach options were recorded in the catalog
+        get_catalog(tmp_path)._rooms[room_name] = RoomInfo(room_name)
+
+    export_room(room_name, tmp_path / "room.snapshot", cache_dir=tmp_path)
+    with RoomSnapshot(tmp_path / "room.snapshot") as snapshot:
+        assert snapshot["a"] == [1, 2]
+    assert not (tmp_path / room_name / "cache.db").exists()  # Not opened by diskcache
@@ -2,12 +2,16 @@ from unittest.mock import MagicMock
 
 import pytest
 from pytest import MonkeyPatch
+from streamlit.state.session_state import SessionState
 
 from streamlit_sync import st_hack
 from streamlit_sync.exceptions import StreamlitSyncException
 from streamlit_sync.st_hack import (
+    LazyValue,
+    _LazySessionState,
     is_form_submitter_value,
     is_trigger_value,
+    iter_raw_items,
     widget_id_to_user_key,
 )
 
@@ -51,3 +55,37 @@ def test_widget_id_to_user_key(monkeypatch: MonkeyPatch) -> None:
 
     with pytest.raises(StreamlitSyncException):
         widget_id_to_user_key("auto_generated_widget_id_with_wrong_format")
+
+
+def test_lazy_session_state() -> None:
+    """Test lazy values are loaded only when read, and only once."""
+    state = SessionState()
+    state.__class__ = _LazySessionState
+    load_a = MagicMock(return_value=1)
+    load_b = MagicMock(return_value=2)
+    state["a"] = LazyValue(load_a)
+    state["b"] = LazyValue(load_b)
+
+    # Placeholders are kept when state is compacted or iterated
+    state.compact_state()
+    assert isinstance(dict(iter_raw_items(state))["a"], LazyValue)
+    load_a.assert_not_called()
+
+    # Value is loaded when read
+    assert state["a"] == 1
+    assert state["a"] == 1
+    load_a.assert_called_once()
+    state.compact_state()
+    assert dict(iter_raw_items(state))["a"] == 1
+
+    # Other values are not loaded
+    load_b.assert_not_called()
+
+
+def test_patch_session_state_once() -> None:
+    """Test `SessionState` is patched only once."""
+    st_hack.patch_session_state()
+    register_widget = getattr(SessionState, "register_widget", None)
+    st_hack.patch_session_state()
+    assert getattr(SessionState, "register_widget", None) is register_widget
+    assert SessionState._is_patched_by_streamlit_sync  # type: ignore
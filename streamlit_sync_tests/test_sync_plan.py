@@ -0,0 +1,51 @@
+from unittest.mock import MagicMock
+
+from pytest import MonkeyPatch
+
+from streamlit_sync import st_hack
+from streamlit_sync.sync_plan import _SyncPlan
+from streamlit_sync.utils import get_not_synced_key
+
+WIDGET_ID = "$$GENERATED_WIDGET_KEY-a57f8cd0ef6469c61f435e5eb8097cf7-customkey"
+BUTTON_ID = "$$GENERATED_WIDGET_KEY-b57f8cd0ef6469c61f435e5eb8097cf7-button"
+
+
+def _mock_session_state(registered: dict) -> MagicMock:
+    mock = MagicMock()
+    metadata = mock._new_widget_state.widget_metadata
+    metadata.__contains__.side_effect = lambda key: key in registered
+    metadata.__getitem__.side_effect = lambda key: MagicMock(value_type=registered[key])
+    return mock
+
+
+def test_sync_plan(monkeypatch: MonkeyPatch) -> None:
+    """Test keys are classified and memoized."""
+    monkeypatch.setattr(st_hack, "_is_keyed_widget_id", st_hack.is_widget_id)
+    plan = _SyncPlan()
+    state = _mock_session_state({WIDGET_ID: "int_value", BUTTON_ID: "trigger_value"})
+
+    assert plan.get_synced_key("custom_user_key", state) == "custom_user_key"
+    assert plan.get_synced_key(WIDGET_ID, state) == "customkey"
+    assert plan.get_synced_key(BUTTON_ID, state) is None
+    assert plan.get_synced_key(get_not_synced_key("key"), state) is None
+    assert plan.get_synced_key("FormSubmitter:my_form-Submit", state) is None
+    assert len(plan) == 5
+
+    # Memoized: metadata is not checked anymore
+    state._new_widget_state.widget_metadata.__contains__.side_effect = None
+    assert plan.get_synced_key(WIDGET_ID, state) == "customkey"
+
+
+def test_sync_plan_unregistered_widget(monkeypatch: MonkeyPatch) -> None:
+    """Test widget ids are not memoized until the widget is registered."""
+    monkeypatch.setattr(st_hack, "_is_keyed_widget_id", st_hack.is_widget_id)
+    plan = _SyncPlan()
+
+    state = _mock_session_state({})
+    assert plan.get_synced_key(BUTTON_ID, state) == "button"
+    assert len(plan) == 0
+
+    # Once registered, we know it's a button
+    state = _mock_session_state({BUTTON_ID: "trigger_value"})
+    assert plan.get_synced_key(BUTTON_ID, state) is None
+    assert len(plan) == 1
@@ -0,0 +1,270 @@
+import time
+from pathlib import Path
+from typing import Any, Optional
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from streamlit_sync.backends import LocalBackend
+from streamlit_sync.catalog import get_catalog
+from streamlit_sync.conflicts import first_writer_wins
+from streamlit_sync.exceptions import StreamlitSyncException
+from streamlit_sync.journal import JournalPolicy
+from streamlit_sync.synced_state import (
+    MIN_IDLE_TIME,
+    EvictionPolicy,
+    Subscription,
+    _RoomRegistry,
+)
+
+
+def _make_idle(registry: _RoomRegistry, room_name: str, idle_time: float) -> None:
+    registry.get(room_name).last_accessed = time.monotonic() - idle_time
+
+
+def test_registry_get() -> None:
+    """Test rooms are loaded once."""
+    registry = _RoomRegistry()
+    room = registry.get("room")
+    assert registry.get("room") is room
+    assert "room" in registry
+
+
+def test_evict_idle_rooms() -> None:
+    """Test rooms idle for too long are evicted."""
+    registry = _RoomRegistry()
+    registry.get("idle_room")
+    registry.get("recent_room")
+    _make_idle(registry, "idle_room", 100)
+    _make_idle(registry, "recent_room", MIN_IDLE_TIME + 1)
+
+    # No policy => no eviction
+    assert registry.evict() == []
+
+    registry.eviction_policy = EvictionPolicy(idle_ttl=10)
+    assert registry.evict() == ["idle_room"]
+    assert "idle_room" not in registry
+    assert "recent_room" in registry
+
+
+def test_evicted_room_keeps_settings() -> None:
+    """Test a room reloaded after eviction is configured as before."""
+    registry = _RoomRegistry()
+    room = registry.get("room")
+    room.configure_broadcast(window=0.5, max_rate=2.0)
+    room.configure_conflicts(first_writer_wins)
+    _make_idle(registry, "room", 100)
+
+    registry.eviction_policy = EvictionPolicy(idle_ttl=10)
+    assert registry.evict() == ["room"]
+
+    room = registry.get("room")
+    assert room._broadcaster.window == 0.5
+    assert room._broadcaster.max_rate == 2.0
+    assert room.conflict_resolver is first_writer_wins
+
+
+def test_evict_least_recently_used_rooms() -> None:
+    """Test least recently used rooms are evicted when there are too many."""
+    registry = _RoomRegistry()
+    for room_name in ("room_1", "room_2", "room_3"):
+        _make_idle(registry, room_name, MIN_IDLE_TIME + 1)
+    registry.get("room_1")  # Used again => won't be evicted
+    _make_idle(registry, "room_1", MIN_IDLE_TIME + 1)
+
+    registry.eviction_policy = EvictionPolicy(max_rooms=1)
+    assert registry.evict() == ["room_2", "room_3"]
+
+
+def test_evict_rooms_above_max_bytes() -> None:
+    """Test rooms are evicted when they use too much memory."""
+    registry = _RoomRegistry()
+    for room_name in ("room_1", "room_2"):
+        room = registry.get(room_name)
+        room._backend.commit(0, {"a": b"x" * 1000})
+        _make_idle(registry, room_name, MIN_IDLE_TIME + 1)
+
+    registry.eviction_policy = EvictionPolicy(max_bytes=1500)
+    assert registry.evict() == ["room_1"]
+
+
+def test_evict_estimates_sizes_without_lock() -> None:
+    """Test room sizes are estimated without blocking the registry."""
+    registry = _RoomRegistry()
+    registry.get("room")
+    _make_idle(registry, "room", MIN_IDLE_TIME + 1)
+
+    locked = []
+
+    def estimated_size(room: Any) -> int:
+        locked.append(registry._lock.locked())
+        return 1000
+
+    registry.eviction_policy = EvictionPolicy(max_bytes=500)
+    with patch(
+        "streamlit_sync.synced_state._SyncedState.estimated_size", estimated_size
+    ):
+        assert registry.evict() == ["room"]
+    assert locked == [False]
+
+
+def test_active_rooms_are_not_evicted() -> None:
+    """Test rooms with registered sessions or recently used are not evicted."""
+    registry = _RoomRegistry()
+    registry.get("active_room")._registered_sessions.add("session_id")
+    _make_idle(registry, "active_room", 100)
+    registry.get("recent_room")
+
+    registry.eviction_policy = EvictionPolicy(idle_ttl=0, max_rooms=0, max_bytes=0)
+    assert registry.evict() == []
+
+
+def test_evicted_room_resumes_version(tmp_path: Path) -> None:
+    """Test evicted room is reloaded from disk with a new version."""
+    registry = _RoomRegistry()
+    room = registry.get("room")
+    room.attach_to_disk(tmp_path)
+    room._backend.commit(room.version, {"a": 1})
+    version = room.version
+    _make_idle(registry, "room", 100)
+
+    registry.eviction_policy = EvictionPolicy(idle_ttl=10)
+    assert registry.evict() == ["room"]
+
+    room = registry.get("room")
+    room.attach_to_disk(tmp_path)
+    assert room.version > version
+    assert room.state["a"] == 1
+
+
+def test_warm_up_most_recent_rooms(tmp_path: Path) -> None:
+    """Test most recently updated rooms are loaded, within the limits."""
+    registry = _RoomRegistry()
+    for i, room_name in enumerate(["old", "recent", "large", "latest"]):
+        room = registry.get(room_name)
+        room.attach_to_disk(tmp_path)
+        room._backend.commit(room.version, {"a": [i]})
+        room.close()
+
+    catalog = get_catalog(tmp_path)
+    catalog.update("old", last_updated=1.0, size_on_disk=100)
+    catalog.update("recent", last_updated=3.0, size_on_disk=100)
+    catalog.update("large", last_updated=4.0, size_on_disk=10_000)
+    catalog.update("latest", last_updated=5.0, size_on_disk=100)
+
+    registry = _RoomRegistry()
+    registry.get("latest")  # Already loaded: left as is
+    assert registry.warm_up(tmp_path, max_rooms=2, max_bytes=1000) == [
+        "recent",
+        "old",
+    ]
+    assert "large" not in registry
+
+    room = registry.get("recent")
+    assert room.use_cache
+    assert room._fingerprints["a"][1] is not None  # Cached for the first session
+    assert isinstance(room._backend, LocalBackend)
+    assert room._backend._preloaded == {"a": [1]}  # Not read from disk again
+
+
+def test_warm_up_with_persisted_options(tmp_path: Path) -> None:
+    """Test rooms are warmed up with the options they have been persisted with."""
+    room = _RoomRegistry().get("room")
+    room.attach_to_disk(tmp_path, journal=JournalPolicy())
+    room._backend.commit(room.version, {"a": 1})
+    room.close()
+
+    registry = _RoomRegistry()
+    assert registry.warm_up(tmp_path) == ["room"]
+    room = registry.get("room")
+    assert dict(room.state) == {"a": 1}
+
+    room.attach_to_disk(tmp_path, journal=JournalPolicy())  # Same options: no-op
+    with pytest.raises(StreamlitSyncException):
+        room.attach_to_disk(tmp_path)
+    room.close()
+
+
+def test_warm_up_rooms_are_not_evicted(tmp_path: Path) -> None:
+    """Test warmed up rooms count as accessed once loaded."""
+    room = _RoomRegistry().get("room")
+    room.attach_to_disk(tmp_path)
+    room._backend.commit(room.version, {"a": 1})
+    room.close()
+
+    registry = _RoomRegistry()
+    registry.set_eviction_policy(EvictionPolicy(idle_ttl=0.1))
+    with patch("streamlit_sync.synced_state.MIN_IDLE_TIME", 0.0), patch(
+        "streamlit_sync.synced_state._SyncedState.warm_up",
+        lambda room: time.sleep(0.1),  # Slow warm-up
+    ):
+        assert registry.warm_up(tmp_path) == ["room"]
+        assert registry.evict() == []
+
+
+def test_delete_room(tmp_path: Path) -> None:
+    """Test room values are deleted and sessions will reset them."""
+    registry = _RoomRegistry()
+    room = registry.get("room")
+    room.attach_to_disk(tmp_path)
+    room._backend.commit(room.version, {"a": 1})
+    version = room.version
+
+    registry.delete("room")
+    assert not (tmp_path / "room").exists()
+
+    room = registry.get("room")
+    assert room.version > version
+    assert room._reset_version == version
+    assert room._reset_keys == {"a"}
+
+
+def test_reap_sessions() -> None:
+    """Test disconnected sessions are removed from the rooms."""
+    registry = _RoomRegistry()
+    registry.get("room_1")._registered_sessions.update({"alive", "closed"})
+    registry.get("room_2")._registered_sessions.update({"alive", "gone"})
+
+    closed_session = MagicMock()
+    closed_session._state.value = "SHUTDOWN_REQUESTED"
+
+    def _get_session(session_id: str) -> Optional[Any]:
+        return {"alive": MagicMock(), "closed": closed_session}.get(session_id)
+
+    with patch("streamlit_sync.st_hack.is_server_running", return_value=True), patch(
+        "streamlit_sync.st_hack.get_session", side_effect=_get_session
+    ):
+        assert registry.reap_sessions() == 2
+
+    assert registry.get("room_1").nb_active_sessions == 1
+    assert registry.get("room_2").nb_active_sessions == 1
+
+
+def test_reap_sessions_without_server() -> None:
+    """Test sessions are kept if no server is running (e.g. bare mode)."""
+    registry = _RoomRegistry()
+    registry.get("room")._registered_sessions.add("session_id")
+
+    assert registry.reap_sessions() == 0
+    assert registry.get("room").nb_active_sessions == 1
+
+
+def test_catalog_updated(tmp_path: Path) -> None:
+    """Test catalog of the cache dir is updated when rooms are attached or deleted."""
+    registry = _RoomRegistry()
+    registry.get("room").attach_to_disk(tmp_path)
+    catalog = get_catalog(tmp_path)
+    assert "room" in catalog
+
+    registry.delete("room")
+    assert "room" not in catalog
+
+
+def test_subscription_matches() -> None:
+    """Test a subscription matches explicit keys and namespaces."""
+    subscription = Subscription(keys=frozenset({"a"}), namespaces=("sales.",))
+    assert subscription.matches("a")
+    assert subscription.matches("sales.year")
+    assert not subscription.matches("b")
+    assert not subscription.matches("sales")
+    assert not Subscription().matches("a")